@@ -0,0 +1,196 @@
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from chart_data import fit_budget
+from cohorts import month_number
+from filters import FilterState, apply_where
+
+# -------------------------
+# Approximate panels from stratified samples
+# -------------------------
+# Users are stratified by City × UserSubscriptionType and stores by City ×
+# SubscriptionType. Once per snapshot the rows of every stratum are put in a
+# random order, and the sample at fraction f is the first
+# max(MIN_STRATUM, ⌈f·N_h⌉) rows of each stratum h. The samples of FRACTIONS
+# are therefore nested, and a larger one refines a smaller one. The filters
+# are applied to the sample rows: y_i is the row's value (1 for counts, the
+# store's Pro/Basic AmountPaid for Total Income) and 0 where the filters drop
+# the row. The filtered total is then estimated per stratum as
+#     total = Σ_h N_h/n_h · Σ_{i∈h} y_i
+#     var   = Σ_h N_h² · (1 − n_h/N_h) · s_h² / n_h
+# and reported with a normal-approximation confidence interval ±Z·√var.
+# Strata sampled in full contribute no variance, so an unfiltered count is exact.
+FRACTIONS = (0.01, 0.1)  # sample fractions in refinement order; exact comes last
+MIN_STRATUM = 20
+Z = 1.96  # 95% confidence
+APPROX_ROWS = int(os.environ.get("POSSAX_APPROX_ROWS", 5_000_000))  # users + stores; mode on by default above this
+PANELS = ["metrics", "user_sub_trend", "store_trend", "user_trend", "store_type_counts", "role_counts"]
+USER_STRATA = ["City", "UserSubscriptionType"]
+STORE_STRATA = ["City", "SubscriptionType"]
+USER_COLS = ["CreatedAt", "City", "Role", "UserSubscriptionType"]
+STORE_COLS = ["StoreID", "CreatedAt", "City", "SubscriptionType"]
+INCOME_TYPES = ["Pro", "Basic"]
+
+
+def _codes(column: pd.Series) -> tuple[np.ndarray, pd.Index]:
+    # Codes shifted by one, so missing values (-1) are a stratum of their own
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy().astype(np.int64) + 1, column.cat.categories
+    codes, categories = pd.factorize(column)
+    return codes.astype(np.int64) + 1, pd.Index(categories)
+
+
+def sample_sizes(sizes: np.ndarray, fraction: float) -> np.ndarray:
+    """Rows taken from strata of these sizes at a sample fraction."""
+    return np.minimum(sizes, np.maximum(MIN_STRATUM, np.ceil(sizes * fraction))).astype(np.int64)
+
+
+def estimate(
+    sizes: np.ndarray, taken: np.ndarray, strata: np.ndarray, y: np.ndarray,
+    groups: Optional[np.ndarray] = None, n_groups: int = 1,
+) -> tuple[np.ndarray, np.ndarray]:
+    """(estimated totals, confidence half-widths) of y per group, from a stratified sample."""
+    n_strata = len(sizes)
+    idx = strata if groups is None else groups * n_strata + strata
+    s1 = np.bincount(idx, weights=y, minlength=n_groups * n_strata).reshape(n_groups, n_strata)
+    s2 = np.bincount(idx, weights=y * y, minlength=n_groups * n_strata).reshape(n_groups, n_strata)
+    n, size = taken.astype(np.float64), sizes.astype(np.float64)
+    mean = np.divide(s1, n, out=np.zeros_like(s1), where=n > 0)
+    var = np.divide(s2 - s1 * mean, n - 1, out=np.zeros_like(s1), where=n > 1)  # s_h² per group
+    scale = np.divide(size * size * (1 - n / np.maximum(size, 1)), n, out=np.zeros_like(n), where=n > 0)
+    totals = (mean * size).sum(axis=1)
+    return totals, Z * np.sqrt(np.maximum((var * scale).sum(axis=1), 0))
+
+
+class TableSample:
+    """The rows of one table in stratified random order, up to the largest sample fraction."""
+
+    def __init__(self, df: pd.DataFrame, strata: list[str], columns: list[str], seed: int):
+        code = np.zeros(len(df), dtype=np.int64)
+        for column in strata:
+            codes, categories = _codes(df[column])
+            code = code * (len(categories) + 1) + codes
+        self.sizes = np.bincount(code)
+        # Strata in code order, rows in random order within each
+        noise = np.random.default_rng(seed).integers(0, 2**32, len(df), dtype=np.int64)
+        order = np.argsort((code << 32) | noise)
+        strata_sorted = code[order]
+        rank = np.arange(len(df)) - np.r_[0, np.cumsum(self.sizes)][strata_sorted]
+        keep = rank < sample_sizes(self.sizes, max(FRACTIONS))[strata_sorted]
+        self.rows = order[keep]
+        self.strata = strata_sorted[keep]
+        self.rank = rank[keep]
+        self.frame = df[columns].iloc[self.rows].reset_index(drop=True)
+        self.months = month_number(self.frame["CreatedAt"])
+
+    def level(self, fraction: float) -> tuple[np.ndarray, np.ndarray]:
+        """(sample rows of a fraction, at most the largest of FRACTIONS, and rows taken per stratum)."""
+        taken = sample_sizes(self.sizes, min(fraction, max(FRACTIONS)))
+        return np.flatnonzero(self.rank < taken[self.strata]), taken
+
+    def matches(self, where: dict) -> np.ndarray:
+        """1.0 for sample rows the filters keep, else 0.0."""
+        y = np.zeros(len(self.frame))
+        y[apply_where(self.frame, where).index.to_numpy()] = 1.0
+        return y
+
+
+class Samples:
+    """Stratified user and store samples of one snapshot, and the approximate PANELS from them."""
+
+    def __init__(self, df_users: pd.DataFrame, df_stores: pd.DataFrame, df_subscriptions: pd.DataFrame, seed: int = 42):
+        self.users = TableSample(df_users, USER_STRATA, USER_COLS, seed)
+        self.stores = TableSample(df_stores, STORE_STRATA, STORE_COLS, seed + 1)
+        # Pro/Basic AmountPaid of every sampled store (the income of its subscriptions)
+        paid = df_subscriptions[df_subscriptions["Type"].isin(INCOME_TYPES)]
+        income = paid.groupby("StoreID")["AmountPaid"].sum()
+        self.income = income.reindex(self.stores.frame["StoreID"].to_numpy(), fill_value=0).to_numpy(np.float64)
+
+    @staticmethod
+    def _counts(sample: TableSample, rows: np.ndarray, taken: np.ndarray, y: np.ndarray, column: str) -> pd.DataFrame:
+        # Estimated rows per value of a categorical column, as panels.*_counts
+        codes = sample.frame[column].cat.codes.to_numpy().astype(np.int64)[rows]
+        categories = sample.frame[column].cat.categories
+        known = codes >= 0
+        totals, margins = estimate(
+            sample.sizes, taken, sample.strata[rows][known], y[rows][known], codes[known], len(categories)
+        )
+        counts = np.rint(totals).astype(np.int64)
+        seen = np.flatnonzero(counts > 0)
+        return pd.DataFrame({
+            column: pd.Categorical.from_codes(seen, categories),
+            "Count": counts[seen],
+            "Margin": np.rint(margins[seen]).astype(np.int64),
+        })
+
+    @staticmethod
+    def _monthly(
+        sample: TableSample, rows: np.ndarray, taken: np.ndarray, y: np.ndarray, value: str, series: Optional[str] = None
+    ) -> pd.DataFrame:
+        # Estimated rows per CreatedAt month (and series value), as panels.*_trend
+        months = sample.months[rows]
+        dated = (months != np.iinfo(np.int64).min) & (y[rows] > 0)
+        first = int(months[dated].min()) if dated.any() else 0
+        span = int(months[dated].max()) - first + 1 if dated.any() else 0
+        group = np.where(dated, months - first, 0)
+        n_series, categories = 1, None
+        if series is not None:
+            codes = sample.frame[series].cat.codes.to_numpy().astype(np.int64)[rows]
+            categories = sample.frame[series].cat.categories
+            n_series = len(categories)
+            dated &= codes >= 0
+            group = group * n_series + np.maximum(codes, 0)
+        totals, margins = estimate(
+            sample.sizes, taken, sample.strata[rows][dated], y[rows][dated], group[dated], max(span * n_series, 1)
+        )
+        counts = np.rint(totals).astype(np.int64)
+        seen = np.flatnonzero(counts > 0) if span else np.zeros(0, dtype=np.int64)
+        month, code = np.divmod(seen, n_series)
+        df = pd.DataFrame({"Month": (first + month).astype("datetime64[M]").astype("datetime64[us]")})
+        if series is not None:
+            df[series] = pd.Categorical.from_codes(code, categories)
+        df[value] = counts[seen]
+        df["Margin"] = np.rint(margins[seen]).astype(np.int64)
+        return df
+
+    def estimates(self, state: FilterState, fraction: float) -> dict:
+        """{panel: approximate result} for every PANELS entry, from the sample at fraction.
+
+        Results have the exact panels' shape plus their confidence half-widths:
+        a "margins" dict in the metrics, a "Margin" column in the frames.
+        """
+        users, user_taken = self.users.level(fraction)
+        stores, store_taken = self.stores.level(fraction)
+        user_y = self.users.matches(state.users_where())
+        store_y = self.stores.matches(state.stores_where())
+
+        def total(sample, rows, taken, y):
+            value, margin = estimate(sample.sizes, taken, sample.strata[rows], y[rows])
+            return int(np.rint(value[0])), int(np.rint(margin[0]))
+
+        sub_type = self.stores.frame["SubscriptionType"].to_numpy()
+        metrics = {
+            "total_users": total(self.users, users, user_taken, user_y),
+            "total_stores": total(self.stores, stores, store_taken, store_y),
+            "total_pro_stores": total(self.stores, stores, store_taken, store_y * (sub_type == "Pro")),
+            "total_basic_stores": total(self.stores, stores, store_taken, store_y * (sub_type == "Basic")),
+            "total_income": total(self.stores, stores, store_taken, store_y * self.income),
+        }
+        return {
+            "metrics": {**{k: v for k, (v, _) in metrics.items()}, "margins": {k: m for k, (_, m) in metrics.items()}},
+            "user_sub_trend": fit_budget(
+                self._monthly(self.users, users, user_taken, user_y, "UserCount", "UserSubscriptionType"),
+                "Month", "UserCount", "UserSubscriptionType",
+            )[0],
+            "store_trend": fit_budget(
+                self._monthly(self.stores, stores, store_taken, store_y, "StoreCount"), "Month", "StoreCount"
+            )[0],
+            "user_trend": fit_budget(
+                self._monthly(self.users, users, user_taken, user_y, "UserCount"), "Month", "UserCount"
+            )[0],
+            "store_type_counts": self._counts(self.stores, stores, store_taken, store_y, "SubscriptionType"),
+            "role_counts": self._counts(self.users, users, user_taken, user_y, "Role"),
+        }
@@ -0,0 +1,390 @@
+import os
+import threading
+from datetime import datetime
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+import cohorts
+import export
+import panels
+import snapshot
+from filters import FilterState
+from expiry_index import ExpiryIndex
+from filter_index import FilterIndex
+from geo_bins import GeoBins
+from leaderboard import Leaderboards
+from ledger import numbered
+from paging import TablePage
+from result_cache import ResultCache
+from rollup_cube import DatasetCubes
+
+# -------------------------
+# Query backends
+# -------------------------
+# Every backend answers the same panel methods for a FilterState:
+#   "pandas" filters frames through the bitmap/date-order index in
+#            filter_index.py and aggregates with panels.py
+#   "cube"   answers Key Metrics, trends and pies from the rollup cubes in
+#            rollup_cube.py, leaderboards from leaderboard.py, everything
+#            else as "pandas"
+#   "sql"    runs one parameterized SQLite query per panel, see sql_backend.py
+# Given a ResultCache, the pandas and cube backends share filtered frames
+# across sessions (and threads) through it.
+#
+# Ledger transactions reach a backend through sync_ledger(ledger, rollup): the
+# store rollup's columns overwrite the touched stores and their users, and
+# the ledger subscriptions join the snapshot's. The pandas backends write
+# into their own shallow copies of the frames, so the dataset (and whatever
+# is built from it) keeps the snapshot values.
+BACKEND = os.environ.get("POSSAX_BACKEND", "cube")
+SUB_COLS = ["SubscriptionID", "StoreID", "Type", "StartDate", "EndDate", "AmountPaid"]
+
+
+def _assign(df: pd.DataFrame, rows: np.ndarray, values: pd.DataFrame) -> pd.DataFrame:
+    # A shallow copy of df with values written into rows (positions)
+    out = df.copy(deep=False)
+    for column in values.columns:
+        out.iloc[rows, out.columns.get_loc(column)] = values[column].to_numpy()
+    return out
+
+
+class PandasBackend:
+    name = "pandas"
+
+    def __init__(
+        self,
+        df_users: pd.DataFrame,
+        df_stores: pd.DataFrame,
+        df_subscriptions: pd.DataFrame,
+        path: Optional[str] = None,
+        cache: Optional[ResultCache] = None,
+    ):
+        self.df_users = df_users
+        self.df_stores = df_stores
+        self.df_subscriptions = df_subscriptions
+        self.path = path
+        self.version = snapshot.manifest(path)["version"] if path else None
+        self.cache = cache
+        self._local = threading.local()
+        self._geo = None
+        self._expiry = None
+        self._index = None
+        self._owner_names = None
+        self._positions = {}
+        self.ledger_subs = None  # live ledger subscriptions, SUB_COLS + TransactionID
+        self.ledger_seq = 0  # last ledger Seq applied by sync_ledger()
+        self.ledger_id = None  # Ledger.id of the ledger those came from
+
+    def _memo(self, slot: str, key, compute):
+        # One entry per slot and thread: every panel of a rerun shares the
+        # filtered frames, while concurrent sessions don't trample each other
+        cached = getattr(self._local, slot, None)
+        if cached is None or cached[0] != key:
+            cached = (key, compute())
+            setattr(self._local, slot, cached)
+        return cached[1]
+
+    def clear_memos(self) -> None:
+        """Forget the memoized frames of every thread (the next rerun recomputes)."""
+        self._local = threading.local()
+
+    def memos(self) -> dict:
+        """This thread's memoized frames, to hand to worker threads (see adopt_memos)."""
+        return dict(vars(self._local))
+
+    def adopt_memos(self, memos: dict) -> None:
+        # Worker threads start from the submitting thread's filtered frames:
+        # shared by reference, never copied
+        vars(self._local).update(memos)
+
+    def filtered(self, state: FilterState) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        def compute():
+            if self.cache is None:
+                return self._filter(state)
+            # keyed on what the frames hold, not on the cache having been
+            # validate()d for the latest ledger write yet
+            key = ("filtered", self.version, self.ledger_id, self.ledger_seq, state)
+            return self.cache.get(key, lambda: self._filter(state))
+        return self._memo("filtered", state, compute)
+
+    @property
+    def index(self) -> FilterIndex:
+        # Built on first use, once per snapshot
+        if self._index is None:
+            self._index = FilterIndex(self.df_users, self.df_stores, self.df_subscriptions)
+        return self._index
+
+    def _filter(self, state: FilterState):
+        users_f, stores_f, subs_f = self.index.filter(state)
+        if self.ledger_subs is not None and len(self.ledger_subs):
+            extra = self.ledger_subs[self.ledger_subs["StoreID"].isin(stores_f["StoreID"])]
+            subs_f = pd.concat([subs_f, extra[SUB_COLS]], ignore_index=True)
+        return users_f, stores_f, subs_f
+
+    def key_metrics(self, state: FilterState) -> dict:
+        return panels.key_metrics(*self.filtered(state))
+
+    def user_sub_trend(self, state: FilterState) -> pd.DataFrame:
+        return panels.user_sub_trend(self.filtered(state)[0])
+
+    def store_trend(self, state: FilterState) -> pd.DataFrame:
+        return panels.store_trend(self.filtered(state)[1])
+
+    def user_trend(self, state: FilterState) -> pd.DataFrame:
+        return panels.user_trend(self.filtered(state)[0])
+
+    def top_active(self, state: FilterState, n: int = 10) -> pd.DataFrame:
+        return panels.top_active(self.filtered(state)[0], n)
+
+    def top_cities(self, state: FilterState, n: int = 10) -> pd.DataFrame:
+        return panels.top_cities(self.filtered(state)[0], n)
+
+    def top_refs(self, state: FilterState, n: int = 10) -> pd.DataFrame:
+        return panels.top_refs(self.filtered(state)[0], n)
+
+    def store_type_counts(self, state: FilterState) -> pd.DataFrame:
+        return panels.store_type_counts(self.filtered(state)[1])
+
+    def role_counts(self, state: FilterState) -> pd.DataFrame:
+        return panels.role_counts(self.filtered(state)[0])
+
+    @property
+    def geo(self) -> GeoBins:
+        # Cell ids are assigned on first use, once per snapshot
+        if self._geo is None:
+            self._geo = GeoBins(self.df_users)
+        return self._geo
+
+    def user_map(self, state: FilterState, level: Optional[str] = None) -> tuple[pd.DataFrame, Optional[str]]:
+        """(lat/lon/count/size per map dot, grid level or None for raw points)."""
+        return self.geo.query(self.geo.positions(self.filtered(state)[0]["UserID"]), level)
+
+    def users_page(self, state: FilterState, page: TablePage) -> tuple[pd.DataFrame, int]:
+        return panels.users_page(self.filtered(state)[0], page)
+
+    @property
+    def expiry(self) -> ExpiryIndex:
+        # Built on first use; update() it when store CurrentEnd values change
+        if self._expiry is None:
+            ids = self.df_stores["StoreID"].to_numpy()
+            self._store_pos = pd.Series(range(len(ids)), index=ids)
+            self._expiry = ExpiryIndex(self.df_stores)
+        return self._expiry
+
+    def _store_keep(self, state: FilterState):
+        # StoreID-indexed mask of the filtered stores, None when nothing is filtered
+        if all(v is None for v in state.stores_where().values()):
+            return None
+
+        def compute():
+            ids = self.filtered(state)[1]["StoreID"].to_numpy()
+            keep = np.zeros(int(self.df_stores["StoreID"].max()) + 1, dtype=bool)
+            keep[ids] = True
+            return keep
+        return self._memo("store_keep", state, compute)
+
+    def _by_expiry(self, state: FilterState, window, today: datetime, page: Optional[TablePage] = None):
+        # Stores of an expiry window ordered by DaysToExpiry, from the expiry
+        # index: the whole window, or only the rows of one page
+        lo, hi = panels.expiry_bounds(window)
+        offset, limit, ascending = (page.offset, page.limit, page.ascending) if page else (0, None, True)
+        ids, total = self.expiry.page(today, lo, hi, offset, limit, ascending, self._store_keep(state))
+        rows = self.df_stores.iloc[self._store_pos.loc[ids].to_numpy()]
+        return panels.with_expiry(rows, self.df_users, today).reset_index(drop=True), total
+
+    def stores_page(self, state: FilterState, page: TablePage, today: datetime) -> tuple[pd.DataFrame, int]:
+        if page.sort == "DaysToExpiry":
+            rows, total = self._by_expiry(state, "All", today, page)
+            return rows[panels.STORE_COLS], total
+        return panels.stores_page(self.filtered(state)[1], self.df_users, page, today)
+
+    def expiring_page(self, state: FilterState, page: TablePage, today: datetime) -> tuple[pd.DataFrame, int]:
+        if page.sort == "DaysToExpiry":
+            rows, total = self._by_expiry(state, state.expiry_window, today, page)
+            return rows[panels.EXPIRING_COLS], total
+        return panels.expiring_page(self.filtered(state)[1], self.df_users, state.expiry_window, page, today)
+
+    def _expiring(self, state: FilterState, today: datetime) -> pd.DataFrame:
+        return self._memo(
+            "expiring", (state, today),
+            lambda: self._by_expiry(state, state.expiry_window, today)[0][panels.EXPIRING_COLS + ["OwnerUserID"]],
+        )
+
+    def expiring_trend(self, state: FilterState, today: datetime) -> pd.DataFrame:
+        return panels.expiring_trend(self._expiring(state, today))
+
+    def affected_owners(self, state: FilterState, today: datetime) -> pd.DataFrame:
+        return panels.affected_owners(self._expiring(state, today), self.df_users)
+
+    @property
+    def owner_names(self) -> pd.Series:
+        # UserID → Name for the Owner column of exported chunks, built on first use
+        if self._owner_names is None:
+            self._owner_names = panels.owner_names(self.df_users)
+        return self._owner_names
+
+    def export_chunks(
+        self, state: FilterState, table: str, today: datetime, chunk_rows: int = export.CHUNK_ROWS
+    ) -> Iterator[pd.DataFrame]:
+        """Rows of an export.TABLES table in on-screen order, chunk_rows at a time (at least one chunk)."""
+        if table not in export.TABLES:
+            raise ValueError(f"Unknown export table {table!r}; expected one of {list(export.TABLES)}")
+        if table == "users":
+            users_f = self.filtered(state)[0]
+            for start in range(0, max(len(users_f), 1), chunk_rows):
+                yield users_f.iloc[start:start + chunk_rows][panels.USER_COLS].reset_index(drop=True)
+            return
+
+        # Stores come from the expiry index a block of whole days at a time,
+        # with Owner and DaysToExpiry joined onto that block only
+        window = "All" if table == "stores" else state.expiry_window
+        blocks = self.expiry.chunks(today, *panels.expiry_bounds(window), chunk_rows, self._store_keep(state))
+        if table == "owners":
+            # Affected owners in users order: a UserID-indexed mark per owner, then one pass over the users
+            owner = self.df_stores["OwnerUserID"].to_numpy()
+            owned = np.zeros(int(max(self.df_users["UserID"].max(), owner.max(initial=0))) + 1, dtype=bool)
+            for ids in blocks:
+                owned[owner[self._store_pos.loc[ids].to_numpy()]] = True
+            sent = False
+            for start in range(0, len(self.df_users), chunk_rows):
+                chunk = self.df_users.iloc[start:start + chunk_rows]
+                chunk = chunk[owned[chunk["UserID"].to_numpy()]]
+                if len(chunk):
+                    sent = True
+                    yield chunk[panels.OWNER_COLS].reset_index(drop=True)
+            if not sent:
+                yield self.df_users.iloc[:0][panels.OWNER_COLS]
+            return
+
+        columns = panels.STORE_COLS if table == "stores" else panels.EXPIRING_COLS
+        sent = False
+        for ids in blocks:
+            if len(ids) or not sent:
+                sent = True
+                rows = self.df_stores.iloc[self._store_pos.loc[ids].to_numpy()]
+                yield panels.with_expiry(rows, self.df_users, today, self.owner_names)[columns].reset_index(drop=True)
+        if not sent:
+            yield panels.with_expiry(self.df_stores.iloc[:0], self.df_users, today, self.owner_names)[columns]
+
+    def user_retention(self, state: FilterState, today: datetime) -> pd.DataFrame:
+        return cohorts.user_retention(self.filtered(state)[0], today)
+
+    def store_retention(self, state: FilterState, today: datetime) -> pd.DataFrame:
+        return cohorts.store_retention(*self.filtered(state)[1:], today)
+
+    def tier_transitions(self, state: FilterState, across: str = "renewal") -> pd.DataFrame:
+        return cohorts.tier_transitions(self.filtered(state)[2], across)
+
+    # ---------- Ledger ----------
+    def _rows(self, table: str, ids) -> np.ndarray:
+        # Row positions of UserIDs / StoreIDs, from a lookup built on first use
+        if table not in self._positions:
+            df, key = (self.df_users, "UserID") if table == "users" else (self.df_stores, "StoreID")
+            self._positions[table] = pd.Index(df[key].to_numpy())
+        return self._positions[table].get_indexer(np.asarray(ids, dtype=np.int64))
+
+    def sync_ledger(self, ledger, rollup) -> np.ndarray:
+        """Apply ledger transactions up to rollup.seq; returns the StoreIDs rewritten."""
+        self.ledger_id = ledger.id
+        inserts, cancels, seq = ledger.subscription_changes(after=self.ledger_seq, until=rollup.seq)
+        if seq == self.ledger_seq:
+            return np.zeros(0, dtype=np.int64)
+        first_id = int(self.df_subscriptions["SubscriptionID"].max()) + 1
+        added = numbered(inserts, first_id).astype({"Type": self.df_subscriptions["Type"].dtype})
+        live = added if self.ledger_subs is None else pd.concat([self.ledger_subs, added], ignore_index=True)
+        gone = live["TransactionID"].isin(cancels).to_numpy()
+        removed = live[gone]
+        self.ledger_subs = live[~gone].reset_index(drop=True)
+        store_ids = np.unique(np.r_[added["StoreID"].to_numpy(np.int64), removed["StoreID"].to_numpy(np.int64)])
+        self._apply_ledger(rollup.stores(store_ids), rollup.users(store_ids), added, removed)
+        self.ledger_seq = seq
+        self.clear_memos()
+        return store_ids
+
+    def _apply_ledger(self, stores: pd.DataFrame, users: pd.DataFrame, added: pd.DataFrame, removed: pd.DataFrame):
+        # Rollup columns of the touched stores and their users onto this backend's
+        # frames (ledger rows of stores or users outside the snapshot are skipped)
+        user_rows = self._rows("users", users["UserID"])
+        self.df_users = _assign(self.df_users, user_rows[user_rows >= 0], users[user_rows >= 0].drop(columns="UserID"))
+        rows = self._rows("stores", stores["StoreID"])
+        stores = stores[rows >= 0]
+        rows = rows[rows >= 0]
+        self.df_stores = _assign(self.df_stores, rows, stores.drop(columns="StoreID"))
+        if self._index is not None:
+            self._index.df_users = self.df_users
+            self._index.update_stores(self.df_stores, rows)
+        if self._expiry is not None:
+            self._expiry.update(stores["StoreID"], stores["CurrentEnd"])
+
+
+class CubeBackend(PandasBackend):
+    name = "cube"
+
+    def __init__(self, df_users, df_stores, df_subscriptions, path: Optional[str] = None, cache: Optional[ResultCache] = None):
+        super().__init__(df_users, df_stores, df_subscriptions, path, cache)
+        # Built once per snapshot version and kept next to it for later processes.
+        # The pickled cubes hold the snapshot rows only: every process replays
+        # the ledger onto its loaded copy (sync_ledger starts from Seq 0)
+        cubes = lambda: DatasetCubes.build(df_users, df_stores, df_subscriptions)
+        boards = lambda: Leaderboards(df_users)
+        self.cubes = snapshot.cached("cubes", cubes, path) if path else cubes()
+        self.boards = snapshot.cached("leaderboards", boards, path) if path else boards()
+
+    def _apply_ledger(self, stores: pd.DataFrame, users: pd.DataFrame, added: pd.DataFrame, removed: pd.DataFrame):
+        # Users leave the cells (and leaderboard rows) of their old values for
+        # the new ones, stores move tier with their income, then the ledger
+        # payments land
+        rows = self._rows("users", users["UserID"])
+        rows = rows[rows >= 0]
+        before = self.df_users.iloc[rows]
+        self.cubes.add_users(before, -1)
+        super()._apply_ledger(stores, users, added, removed)
+        after = self.df_users.iloc[rows]
+        self.cubes.add_users(after)
+        self.boards.update_users(before, after)
+        self.cubes.set_store_types(stores["StoreID"], stores["SubscriptionType"])
+        self.cubes.add_subscriptions(added)
+        self.cubes.add_subscriptions(removed, -1)
+
+    def key_metrics(self, state: FilterState) -> dict:
+        return self.cubes.key_metrics(state)
+
+    def user_sub_trend(self, state: FilterState) -> pd.DataFrame:
+        return self.cubes.user_sub_trend(state)
+
+    def store_trend(self, state: FilterState) -> pd.DataFrame:
+        return self.cubes.store_trend(state)
+
+    def user_trend(self, state: FilterState) -> pd.DataFrame:
+        return self.cubes.user_trend(state)
+
+    def top_active(self, state: FilterState, n: int = 10) -> pd.DataFrame:
+        return self.boards.top_active(state, n)
+
+    def top_cities(self, state: FilterState, n: int = 10) -> pd.DataFrame:
+        return self.boards.top_cities(state, n)
+
+    def top_refs(self, state: FilterState, n: int = 10) -> pd.DataFrame:
+        return self.boards.top_refs(state, n)
+
+    def store_type_counts(self, state: FilterState) -> pd.DataFrame:
+        return self.cubes.store_type_counts(state)
+
+    def role_counts(self, state: FilterState) -> pd.DataFrame:
+        return self.cubes.role_counts(state)
+
+
+def get_backend(
+    name: str, df_users, df_stores, df_subscriptions, path: Optional[str] = None, cache: Optional[ResultCache] = None
+):
+    if name == "pandas":
+        return PandasBackend(df_users, df_stores, df_subscriptions, path, cache)
+    if name == "cube":
+        return CubeBackend(df_users, df_stores, df_subscriptions, path, cache)
+    if name == "sql":
+        from sql_backend import SQLBackend
+
+        return SQLBackend.from_frames(df_users, df_stores, df_subscriptions, path)
+    raise ValueError(f"Unknown backend {name!r}; expected 'pandas', 'cube' or 'sql'")
@@ -0,0 +1,428 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from multiprocessing import get_context
+from typing import Optional
+
+import pandas as pd
+
+import approx
+import export
+import pipeline
+import snapshot
+from backends import BACKEND, get_backend
+from filters import FilterState
+
+# -------------------------
+# Pipeline benchmark
+# -------------------------
+# Runs pipeline.run on generated snapshots of each scale (built once under
+# BENCH_DIR and reused) for two workloads, an unfiltered and a filtered view.
+# Per stage it reports the best wall time of repeated reruns and, from
+# one extra rerun under tracemalloc, the peak Python/NumPy memory above the
+# stage's start and the memory blocks it left allocated. Every scale runs in a
+# fresh process, so its max RSS is its own.
+#
+# A saved baseline turns it into a regression check: any stage slower or
+# hungrier than the baseline by more than TOLERANCE (and the noise floor)
+# is reported and the run exits with status 1.
+#
+# With --workers it instead times whole reruns at each worker count (see
+# pipeline.WORKERS) and reports the speedup over one worker. With --startup
+# it reports time to first paint: a fresh interpreter importing what the
+# dashboard imports up front, loading the snapshot, building the backend and
+# answering Key Metrics, once with the snapshot's derived-structure cache
+# emptied (cold) and once with it filled (warm). With --export it streams
+# every exportable table of the unfiltered view to CSV and Parquet and
+# reports rows/s and the peak memory above the start of the export. With
+# --approx it times approximate mode's estimates at every sample fraction
+# against the exact stages they stand in for, and reports the estimates'
+# largest relative error and how many exact values fell inside their
+# confidence intervals.
+SCALES = [1_000, 100_000, 1_000_000, 10_000_000]
+BENCH_DIR = os.environ.get("POSSAX_BENCH_DIR", "bench_data")
+BASELINE = "bench_baseline.json"
+TOLERANCE = 0.25
+NOISE_SECONDS = 0.005  # stages this close to the baseline are jitter, not regressions
+NOISE_MB = 1.0
+CHUNK_SIZE = 1_000_000
+METRICS = ["seconds", "peak_mb"]
+
+
+def dataset(users: int, root: str = BENCH_DIR) -> str:
+    """Snapshot directory of a users-sized dataset (half as many stores), built on first use."""
+    path = os.path.join(root, f"users_{users}")
+    if not snapshot.exists(path):
+        snapshot.build_snapshot(users, max(users // 2, 1), path, seed=42, chunk_size=CHUNK_SIZE)
+    return path
+
+
+def workloads(df_users: pd.DataFrame) -> dict[str, FilterState]:
+    # Middle half of the date range, a few cities, paid stores, owners, one expiry window
+    lo, hi = df_users["CreatedAt"].min(), df_users["CreatedAt"].max()
+    cities = sorted(df_users["City"].unique().tolist())[:3]
+    return {
+        "all": FilterState(),
+        "filtered": FilterState.from_widgets(
+            [(lo + (hi - lo) / 4).normalize(), (hi - (hi - lo) / 4).normalize()],
+            cities, ["Pro", "Basic"], ["Owner"], "30 days",
+        ),
+    }
+
+
+@contextmanager
+def _timed(into: dict, name: str):
+    start = time.perf_counter()
+    yield
+    into.setdefault(name, []).append(time.perf_counter() - start)
+
+
+@contextmanager
+def _traced(into: dict, name: str):
+    tracemalloc.reset_peak()
+    start = tracemalloc.get_traced_memory()[0]
+    blocks = sys.getallocatedblocks()
+    yield
+    into[name] = {
+        "peak_mb": (tracemalloc.get_traced_memory()[1] - start) / 2**20,
+        "blocks": sys.getallocatedblocks() - blocks,
+    }
+
+
+def _max_rss_mb() -> float:
+    # VmHWM is this process' own peak; ru_maxrss also keeps the peak of the
+    # parent it was spawned from
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:")) / 1024
+    except (OSError, StopIteration):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _rerun(backend, state: FilterState, today: datetime, stage) -> None:
+    # Each rerun starts from scratch, as after a filter change
+    clear = getattr(backend, "clear_memos", None)
+    if clear:
+        clear()
+    pipeline.run(backend, state, today, stage)
+
+
+def bench_scale(users: int, backend_name: str = BACKEND, repeat: int = 5, root: str = BENCH_DIR) -> dict:
+    """{"load" | workload: {stage: {"seconds", "peak_mb", "blocks"}}} for one scale."""
+    path = dataset(users, root)
+    today = datetime.now()
+    results = {}
+
+    # Loading maps Arrow buffers tracemalloc can't see: its memory is the
+    # growth of the process' max RSS instead
+    rss, blocks, start = _max_rss_mb(), sys.getallocatedblocks(), time.perf_counter()
+    frames = snapshot.load(path)
+    backend = get_backend(backend_name, *frames, path=path)
+    results["load"] = {"load": {
+        "seconds": time.perf_counter() - start,
+        "peak_mb": _max_rss_mb() - rss,
+        "blocks": sys.getallocatedblocks() - blocks,
+    }}
+
+    for name, state in workloads(frames[0]).items():
+        times, memory = {}, {}
+        for _ in range(repeat):
+            _rerun(backend, state, today, lambda stage: _timed(times, stage))
+        tracemalloc.start()
+        _rerun(backend, state, today, lambda stage: _traced(memory, stage))
+        tracemalloc.stop()
+        results[name] = {stage: {"seconds": min(times[stage]), **memory[stage]} for stage in pipeline.STAGES}
+    results["max_rss_mb"] = _max_rss_mb()
+    return results
+
+
+def bench(scales: list, backend_name: str = BACKEND, repeat: int = 5, root: str = BENCH_DIR) -> dict:
+    """bench_scale for every scale, each in its own process; keyed by str(users)."""
+    results = {}
+    for users in scales:
+        dataset(users, root)  # generated here so it doesn't count toward the scale's RSS
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            results[str(users)] = pool.submit(bench_scale, users, backend_name, repeat, root).result()
+    return results
+
+
+def bench_workers(users: int, workers: list, backend_name: str = BACKEND, repeat: int = 5, root: str = BENCH_DIR) -> dict:
+    """{workload: {str(workers): best rerun seconds}} for one scale."""
+    path = dataset(users, root)
+    today = datetime.now()
+    frames = snapshot.load(path)
+    backend = get_backend(backend_name, *frames, path=path)
+    results = {}
+    for name, state in workloads(frames[0]).items():
+        results[name] = {}
+        for n in workers:
+            times = []
+            for _ in range(repeat):
+                clear = getattr(backend, "clear_memos", None)
+                if clear:
+                    clear()
+                start = time.perf_counter()
+                pipeline.run(backend, state, today, workers=n)
+                times.append(time.perf_counter() - start)
+            results[name][str(n)] = min(times)
+    return results
+
+
+def speedup_report(results: dict) -> pd.DataFrame:
+    rows = []
+    for users, scale in results.items():
+        for workload, by_workers in scale.items():
+            for n, seconds in by_workers.items():
+                rows.append({
+                    "Users": int(users), "Workload": workload, "Workers": int(n), "ms": round(seconds * 1e3, 1),
+                    "Speedup": round(by_workers[min(by_workers, key=int)] / seconds, 2),
+                })
+    return pd.DataFrame(rows)
+
+
+FIRST_PAINT = """
+import json, time
+start = time.perf_counter()
+import streamlit
+import backends, chart_data, cohorts, filters, geo_bins, ledger, paging, panels, perf, pipeline, refresher, result_cache
+imported = time.perf_counter()
+data = refresher.Refresher({path!r}, interval=0).current
+loaded = time.perf_counter()
+backend = backends.get_backend({backend!r}, *data.frames, path=data.path)
+built = time.perf_counter()
+backend.key_metrics(filters.FilterState())
+painted = time.perf_counter()
+print(json.dumps({{"imports": imported - start, "load": loaded - imported, "backend": built - loaded, "metrics": painted - built}}))
+"""
+
+
+def first_paint(path: str, backend_name: str = BACKEND) -> dict:
+    """Seconds per startup step of a fresh interpreter, plus "total" including interpreter startup."""
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", FIRST_PAINT.format(path=os.path.abspath(path), backend=backend_name)],
+        check=True, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    return {**json.loads(out.stdout.splitlines()[-1]), "total": time.perf_counter() - start}
+
+
+def bench_startup(users: int, backend_name: str = BACKEND, root: str = BENCH_DIR) -> dict:
+    """{"cold" | "warm": first_paint steps} for one scale."""
+    path = dataset(users, root)
+    shutil.rmtree(os.path.join(path, snapshot.CACHE_DIR), ignore_errors=True)
+    return {"cold": first_paint(path, backend_name), "warm": first_paint(path, backend_name)}
+
+
+def startup_report(results: dict) -> pd.DataFrame:
+    rows = [
+        {"Users": int(users), "Start": start, **{step: round(s * 1e3) for step, s in steps.items()}}
+        for users, scale in results.items() for start, steps in scale.items()
+    ]
+    return pd.DataFrame(rows).rename(columns=lambda c: f"{c} ms" if c not in ("Users", "Start") else c)
+
+
+def bench_export(users: int, backend_name: str = BACKEND, root: str = BENCH_DIR) -> dict:
+    """{table: {format: {"rows", "seconds", "mb", "peak_mb"}}} for the unfiltered view at one scale."""
+    path = dataset(users, root)
+    backend = get_backend(backend_name, *snapshot.load(path), path=path)
+    state, today = FilterState(), datetime.now()
+    pipeline.prefilter(backend, state)  # the page has filtered before anyone exports
+    next(backend.export_chunks(state, "stores", today, 1))  # lookups built once per snapshot, not per export
+    out = os.path.join(root, "exports")
+    results = {}
+    for table in export.TABLES:
+        for fmt in export.FORMATS:
+            memory = {}
+            tracemalloc.start()
+            with _traced(memory, "export"):
+                result = export.write(backend.export_chunks(state, table, today), export.export_path(table, fmt, out), fmt)
+            tracemalloc.stop()
+            os.remove(result.path)
+            results.setdefault(table, {})[fmt] = {
+                "rows": result.rows, "seconds": result.seconds, "mb": result.bytes / 2**20,
+                "peak_mb": memory["export"]["peak_mb"],
+            }
+    return results
+
+
+def export_report(results: dict) -> pd.DataFrame:
+    rows = [
+        {
+            "Users": int(users), "Table": table, "Format": fmt, "Rows": m["rows"],
+            "Rows/s": round(m["rows"] / m["seconds"]) if m["seconds"] else None,
+            "File MB": round(m["mb"], 1), "Peak MB": round(m["peak_mb"], 1),
+        }
+        for users, scale in results.items() for table, formats in scale.items() for fmt, m in formats.items()
+    ]
+    return pd.DataFrame(rows)
+
+
+def bench_approx(users: int, backend_name: str = BACKEND, repeat: int = 5, root: str = BENCH_DIR) -> dict:
+    """{"sample_s": build seconds, workload: {fraction | "exact": {"seconds", "max_error", "in_ci", "metrics"}}} for one scale."""
+    path = dataset(users, root)
+    frames = snapshot.load(path)
+    start = time.perf_counter()
+    samples = approx.Samples(*frames)
+    results = {"sample_s": time.perf_counter() - start}
+    backend = get_backend(backend_name, *frames, path=path)
+    for name, state in workloads(frames[0]).items():
+        times = []
+        for _ in range(repeat):
+            clear = getattr(backend, "clear_memos", None)
+            if clear:
+                clear()
+            start = time.perf_counter()
+            exact = pipeline.run(backend, state, stages=["filter", "metrics", "trends", "pies"])["metrics"]
+            times.append(time.perf_counter() - start)
+        results[name] = {"exact": {"seconds": min(times), "max_error": 0.0, "in_ci": len(exact), "metrics": len(exact)}}
+        for fraction in approx.FRACTIONS:
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                metrics = samples.estimates(state, fraction)["metrics"]
+                times.append(time.perf_counter() - start)
+            errors = [abs(metrics[k] - v) / v if v else float(metrics[k] != 0) for k, v in exact.items()]
+            results[name][str(fraction)] = {
+                "seconds": min(times), "max_error": max(errors),
+                "in_ci": sum(abs(metrics[k] - v) <= metrics["margins"][k] for k, v in exact.items()),
+                "metrics": len(exact),
+            }
+    return results
+
+
+def approx_report(results: dict) -> pd.DataFrame:
+    rows = [
+        {
+            "Users": int(users), "Sample s": round(scale["sample_s"], 2), "Workload": workload,
+            "Source": source if source == "exact" else f"{float(source):.0%} sample",
+            "ms": round(m["seconds"] * 1e3, 1), "Max error %": round(m["max_error"] * 100, 2),
+            "In CI": f"{m['in_ci']}/{m['metrics']}",
+        }
+        for users, scale in results.items()
+        for workload, sources in scale.items() if workload != "sample_s"
+        for source, m in sources.items()
+    ]
+    return pd.DataFrame(rows)
+
+
+def report(results: dict, baseline: Optional[dict] = None) -> pd.DataFrame:
+    rows = []
+    for users, scale in results.items():
+        for workload, stages in scale.items():
+            if workload == "max_rss_mb":
+                continue
+            for stage, m in stages.items():
+                row = {
+                    "Users": int(users), "Workload": workload, "Stage": stage,
+                    "ms": round(m["seconds"] * 1e3, 2), "Peak MB": round(m["peak_mb"], 1), "Blocks": m["blocks"],
+                }
+                base = (baseline or {}).get(users, {}).get(workload, {}).get(stage)
+                if base:
+                    row["Base ms"] = round(base["seconds"] * 1e3, 2)
+                    row["Δ time %"] = round(100 * (m["seconds"] / base["seconds"] - 1), 1) if base["seconds"] else None
+                rows.append(row)
+        rows.append({"Users": int(users), "Workload": "process", "Stage": "max RSS", "Peak MB": round(scale["max_rss_mb"], 1)})
+    df = pd.DataFrame(rows)
+    df["Blocks"] = df["Blocks"].astype("Int64")
+    return df
+
+
+def regressions(results: dict, baseline: dict, tolerance: float = TOLERANCE) -> list[str]:
+    """One line per stage metric that exceeds its baseline by more than tolerance and the noise floor."""
+    found = []
+    noise = {"seconds": NOISE_SECONDS, "peak_mb": NOISE_MB}
+    for users, scale in results.items():
+        for workload, stages in scale.items():
+            if workload == "max_rss_mb" or users not in baseline:
+                continue
+            for stage, m in stages.items():
+                base = baseline[users].get(workload, {}).get(stage)
+                if not base:
+                    continue
+                for metric in METRICS:
+                    limit = base[metric] * (1 + tolerance) + noise[metric]
+                    if m[metric] > limit:
+                        found.append(
+                            f"{users} users / {workload} / {stage}: {metric} {m[metric]:.4g} > {limit:.4g} "
+                            f"(baseline {base[metric]:.4g})"
+                        )
+    return found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard pipeline at several dataset scales.")
+    parser.add_argument("--scales", type=lambda s: int(float(s)), nargs="+", default=SCALES, help="user counts, e.g. 1e3 1e5")
+    parser.add_argument("--backend", default=BACKEND)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--data", default=BENCH_DIR, help="where generated snapshots are kept")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--workers", type=int, nargs="+", help="report rerun speedup at these worker counts, e.g. 1 2 4 8")
+    parser.add_argument("--startup", action="store_true", help="report cold and warm time to first paint")
+    parser.add_argument("--export", action="store_true", help="report streaming export throughput and memory")
+    parser.add_argument("--approx", action="store_true", help="report approximate-mode latency and accuracy")
+    args = parser.parse_args()
+
+    if args.approx:
+        results = {str(users): bench_approx(users, args.backend, args.repeat, args.data) for users in args.scales}
+        print(approx_report(results).to_string(index=False))
+        return
+
+    if args.export:
+        results = {str(users): bench_export(users, args.backend, args.data) for users in args.scales}
+        print(export_report(results).to_string(index=False))
+        return
+
+    if args.startup:
+        results = {str(users): bench_startup(users, args.backend, args.data) for users in args.scales}
+        print(startup_report(results).to_string(index=False))
+        return
+
+    if args.workers:
+        results = {}
+        for users in args.scales:
+            dataset(users, args.data)
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                results[str(users)] = pool.submit(
+                    bench_workers, users, sorted(args.workers), args.backend, args.repeat, args.data
+                ).result()
+        print(f"{os.cpu_count()} CPUs")
+        print(speedup_report(results).to_string(index=False))
+        return
+
+    results = bench(args.scales, args.backend, args.repeat, args.data)
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        if stored["backend"] == args.backend:
+            baseline = stored["results"]
+        else:
+            print(f"Baseline is for backend {stored['backend']!r}; not comparing.")
+    print(report(results, baseline).to_string(index=False))
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump({"backend": args.backend, "created": datetime.now().isoformat(), "results": results}, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    elif baseline:
+        found = regressions(results, baseline, args.tolerance)
+        if found:
+            print(f"\n{len(found)} regression(s) against {args.baseline}:")
+            print("\n".join(f"  {line}" for line in found))
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%}).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# -------------------------
+# Chart data layer
+# -------------------------
+# Charts receive aggregated series from the backends (never raw rows, so
+# Vega has nothing to count in the browser). On top of that every chart gets
+# a point budget: a series longer than its share of POINTS_BUDGET is
+# downsampled with Largest-Triangle-Three-Buckets, which keeps the first and
+# last points and the visually significant peaks and dips.
+POINTS_BUDGET = 1_000
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+    """Indices of n points of (x, y) (x ascending) chosen by LTTB."""
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size)
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    # n - 2 buckets between the fixed first and last point
+    edges = np.r_[np.floor(np.linspace(1, size - 1, n - 1)).astype(np.int64), size]
+    keep = np.empty(n, dtype=np.int64)
+    keep[0], keep[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        nxt = slice(edges[i + 1], max(edges[i + 2], edges[i + 1] + 1))
+        avg_x, avg_y = x[nxt].mean(), y[nxt].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return np.unique(keep)
+
+
+def fit_budget(
+    df: pd.DataFrame, x: str, y: str, series: Optional[str] = None, budget: int = POINTS_BUDGET
+) -> tuple[pd.DataFrame, bool]:
+    """(chart frame within budget points, whether it was downsampled); the budget is split across series."""
+    if len(df) <= budget:
+        return df, False
+    groups = [df] if series is None else [g for _, g in df.groupby(series, observed=True, sort=True)]
+    per_series = max(budget // len(groups), 3)
+    parts = []
+    for g in groups:
+        g = g.sort_values(x, kind="stable")
+        xs = g[x].to_numpy()
+        if not pd.api.types.is_numeric_dtype(g[x]):
+            xs = pd.to_datetime(g[x]).to_numpy("datetime64[us]").astype(np.int64)
+        parts.append(g.iloc[lttb(xs, g[y].to_numpy(), per_series)])
+    return pd.concat(parts, ignore_index=True), True
+
+
+def payload_bytes(df: pd.DataFrame) -> int:
+    """Approximate bytes the chart data adds to the page (Vega-Lite JSON records)."""
+    return len(df.to_json(orient="records", date_format="iso"))
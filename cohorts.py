@@ -0,0 +1,200 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# -------------------------
+# Cohort retention and tier transitions
+# -------------------------
+# Everything is month arithmetic on integer month numbers (months since
+# 1970-01), so no loop ever runs per user, store or subscription:
+#   user retention   cohort = CreatedAt month; a user counts at month k while
+#                    LastActivity is k or more months after signup, so the
+#                    counts are one bincount of (cohort, months active) and a
+#                    reverse cumulative sum along k
+#   store retention  cohort = store CreatedAt month; a store counts at month k
+#                    when a Trial/Basic/Pro subscription covers that month.
+#                    Each store's subscription intervals are merged into
+#                    disjoint runs, then every run adds +1 at its first month
+#                    and -1 after its last, and a cumulative sum along k
+#                    counts distinct stores
+#   transitions      consecutive subscriptions of a store (renewal) or its
+#                    first and latest one (lifetime), as a From × To matrix
+# Months after `today` are not observed yet and are left out. The frames are
+# the filtered ones, so every view follows the global filters.
+TIERS = ["Non-Paid", "Trial", "Basic", "Pro"]  # lowest to highest
+ACTIVE_TIERS = ["Trial", "Basic", "Pro"]
+TRANSITIONS = ("renewal", "lifetime")
+RETENTION_COLS = ["Cohort", "Month", "Size", "Retained", "Retention"]
+TRANSITION_COLS = ["From", "To", "Count", "Share"]
+_NAT = np.iinfo(np.int64).min
+_US_PER_DAY = 86_400_000_000
+
+
+def month_number(values) -> np.ndarray:
+    """Months since 1970-01 of datetimes; NaT becomes the int64 minimum."""
+    us = np.asarray(values, dtype="datetime64[us]").astype(np.int64)
+    months = np.full(len(us), _NAT)
+    present = us != _NAT
+    if present.any():
+        # Calendar conversion of each distinct day only, then a table lookup
+        days = us[present] // _US_PER_DAY
+        lo = int(days.min())
+        table = np.arange(lo, int(days.max()) + 1).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        months[present] = table[days - lo]
+    return months
+
+
+def _store_order(store: np.ndarray, start: np.ndarray, sub_id: np.ndarray) -> np.ndarray:
+    # Subscriptions by (StoreID, StartDate, SubscriptionID). Tables in
+    # SubscriptionID order (snapshots, filtered or not) need only one stable
+    # sort of a combined (store, start rank) key, which they nearly are already
+    if len(sub_id) and (np.diff(sub_id) > 0).all():
+        rank, starts = pd.factorize(start, sort=True)
+        lo = int(store.min())
+        if (int(store.max()) - lo + 1) * len(starts) < 2**62:
+            return np.argsort((store - lo) * len(starts) + rank, kind="stable")
+    return np.lexsort((sub_id, start, store))
+
+
+def _tier_codes(values: pd.Series) -> np.ndarray:
+    # Position in TIERS (-1 for anything else), whatever the input's categories
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        lookup = np.array([TIERS.index(c) if c in TIERS else -1 for c in values.cat.categories] + [-1])
+        return lookup[values.cat.codes.to_numpy()]  # code -1 (missing) picks the trailing -1
+    return pd.Categorical(values, categories=TIERS).codes.astype(np.int64)
+
+
+def _retention_frame(first: int, sizes: np.ndarray, retained: np.ndarray, last: int) -> pd.DataFrame:
+    # Long (Cohort, Month) frame of the observed cells of non-empty cohorts
+    cohort, month = np.divmod(np.arange(retained.size), retained.shape[1])
+    keep = (sizes[cohort] > 0) & (first + cohort + month <= last)
+    cohort, month = cohort[keep], month[keep]
+    size = sizes[cohort]
+    count = retained[cohort, month]
+    return pd.DataFrame({
+        "Cohort": (first + cohort).astype("datetime64[M]").astype("datetime64[ns]"),
+        "Month": month.astype(np.int64),
+        "Size": size.astype(np.int64),
+        "Retained": count.astype(np.int64),
+        "Retention": count / size,
+    }, columns=RETENTION_COLS)
+
+
+def user_retention(users_f: pd.DataFrame, today: datetime) -> pd.DataFrame:
+    """Monthly signup cohorts × months since signup: users still active (LastActivity) k months in."""
+    created = month_number(users_f["CreatedAt"])
+    seen = month_number(users_f["LastActivity"])
+    last = int(month_number([today])[0])
+    valid = (created != _NAT) & (created <= last)
+    created, seen = created[valid], seen[valid]
+    if len(created) == 0:
+        return pd.DataFrame(columns=RETENTION_COLS)
+
+    first = int(created.min())
+    cohorts, months = int(created.max()) - first + 1, last - first + 1
+    cohort = created - first
+    # Missing LastActivity: active in the signup month only
+    active = np.clip(np.where(seen == _NAT, created, seen) - created, 0, months - 1)
+    counts = np.bincount(cohort * months + active, minlength=cohorts * months).reshape(cohorts, months)
+    retained = counts[:, ::-1].cumsum(axis=1)[:, ::-1]  # users active at least k months
+    return _retention_frame(first, retained[:, 0], retained, last)
+
+
+def _merged_runs(store: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Overlapping [lo, hi] month intervals of the same store merged into
+    # disjoint runs: in (store, lo) order a run starts wherever lo is past
+    # every earlier hi of the store (a running max, offset per store so it
+    # never carries across stores). Returns the input position of each run's
+    # first interval and the run's last month.
+    base, span = lo.min(), int(hi.max() - lo.min()) + 2
+    order = np.argsort((store - store.min()) * span + (lo - base), kind="stable")
+    store, lo, hi = store[order], lo[order] - base, hi[order] - base
+    group = np.r_[0, np.cumsum(store[1:] != store[:-1])] * span
+    reach = np.maximum.accumulate(hi + group)
+    starts = np.flatnonzero(lo + group > np.r_[-1, reach[:-1]])
+    ends = np.r_[starts[1:], len(lo)] - 1
+    return order[starts], reach[ends] - group[ends] + base
+
+
+def store_retention(stores_f: pd.DataFrame, subs_f: pd.DataFrame, today: datetime) -> pd.DataFrame:
+    """Monthly store cohorts × months since creation: stores on a Trial/Basic/Pro plan in month k."""
+    created = month_number(stores_f["CreatedAt"])
+    last = int(month_number([today])[0])
+    valid = (created != _NAT) & (created <= last)
+    if not valid.any():
+        return pd.DataFrame(columns=RETENTION_COLS)
+    created = created[valid]
+    first = int(created.min())
+    cohorts, months = int(created.max()) - first + 1, last - first + 1
+    sizes = np.bincount(created - first, minlength=cohorts)
+
+    # Store row of every active subscription, through a StoreID-indexed
+    # lookup (subscriptions of other stores are ignored)
+    ids = stores_f["StoreID"].to_numpy(dtype=np.int64)[valid]
+    sub_store = subs_f["StoreID"].to_numpy(dtype=np.int64)
+    rows = np.full(int(max(ids.max(), sub_store.max(initial=0))) + 1, -1)
+    rows[ids] = np.arange(len(ids))
+    active = np.array([t in ACTIVE_TIERS for t in TIERS] + [False])
+    paid = active[_tier_codes(subs_f["Type"])] & (rows[sub_store] >= 0)
+    row = rows[sub_store[paid]]
+    # Months of the subscription relative to signup, clipped to what is observable
+    lo = month_number(subs_f["StartDate"].to_numpy()[paid]) - created[row]
+    hi = month_number(subs_f["EndDate"].to_numpy()[paid]) - created[row]
+    lo, hi = np.maximum(lo, 0), np.minimum(hi, last - created[row])
+    keep = lo <= hi
+    row, lo, hi = row[keep], lo[keep], hi[keep]
+
+    diff = np.zeros(cohorts * (months + 1), dtype=np.int64)
+    if len(row):
+        first_interval, hi = _merged_runs(row, lo, hi)
+        row, lo = row[first_interval], lo[first_interval]
+        base = (created[row] - first) * (months + 1)
+        diff += np.bincount(base + lo, minlength=len(diff))
+        diff -= np.bincount(base + hi + 1, minlength=len(diff))
+    retained = diff.reshape(cohorts, months + 1).cumsum(axis=1)[:, :months]
+    return _retention_frame(first, sizes, retained, last)
+
+
+def tier_transitions(subs_f: pd.DataFrame, across: str = "renewal") -> pd.DataFrame:
+    """From × To plan counts: between consecutive subscriptions ("renewal") or first → latest ("lifetime")."""
+    if across not in TRANSITIONS:
+        raise ValueError(f"Unknown transition {across!r}; expected one of {TRANSITIONS}")
+    store = subs_f["StoreID"].to_numpy(dtype=np.int64)
+    order = _store_order(
+        store, subs_f["StartDate"].to_numpy(dtype="datetime64[us]").astype(np.int64),
+        subs_f["SubscriptionID"].to_numpy(dtype=np.int64),
+    )
+    store, tier = store[order], _tier_codes(subs_f["Type"])[order]
+    same = store[1:] == store[:-1]
+    if across == "renewal":
+        src, dst = tier[:-1][same], tier[1:][same]
+    else:
+        first = np.flatnonzero(np.r_[True, ~same])
+        last = np.r_[first[1:], len(store)] - 1
+        multi = last > first
+        src, dst = tier[first[multi]], tier[last[multi]]
+    known = (src >= 0) & (dst >= 0)
+    n = len(TIERS)
+    counts = np.bincount(src[known] * n + dst[known], minlength=n * n)
+    from_total = counts.reshape(n, n).sum(axis=1).repeat(n)
+    return pd.DataFrame({
+        "From": pd.Categorical(np.repeat(TIERS, n), categories=TIERS, ordered=True),
+        "To": pd.Categorical(np.tile(TIERS, n), categories=TIERS, ordered=True),
+        "Count": counts.astype(np.int64),
+        "Share": np.divide(counts, from_total, out=np.zeros(n * n), where=from_total > 0),
+    }, columns=TRANSITION_COLS)
+
+
+def transition_summary(transitions: pd.DataFrame) -> dict:
+    """Upgrades, downgrades, churn to Non-Paid and unchanged plans in a tier_transitions frame."""
+    src = transitions["From"].cat.codes.to_numpy()
+    dst = transitions["To"].cat.codes.to_numpy()
+    count = transitions["Count"].to_numpy()
+    churn = (dst == TIERS.index("Non-Paid")) & (src > dst)
+    return {
+        "upgrades": int(count[dst > src].sum()),
+        "downgrades": int(count[(dst < src) & ~churn].sum()),
+        "churned": int(count[churn].sum()),
+        "unchanged": int(count[dst == src].sum()),
+    }
@@ -0,0 +1,124 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# -------------------------
+# Compact memory layout
+# -------------------------
+# Low-cardinality strings are categoricals (int8 codes + one dictionary), and
+# the users → stores membership ("Stores") is an Arrow list<int32> column:
+# CSR offsets plus one flat int32 store-id array instead of a Python list per
+# user. Both round-trip through the snapshot files without conversion.
+CATEGORY_COLUMNS = {
+    "users": ["Role", "DeviceType", "ReferralCode", "City", "UserSubscriptionType"],
+    "stores": ["StoreType", "City", "SubscriptionType"],
+    "subscriptions": ["Type"],
+}
+STORES_TYPE = pa.list_(pa.int32())
+
+
+def arrow_types(t: pa.DataType):
+    # types_mapper for Table.to_pandas: keep list columns as CSR arrays
+    return pd.ArrowDtype(t) if pa.types.is_list(t) else None
+
+
+def list_column(offsets: np.ndarray, values: np.ndarray) -> pd.arrays.ArrowExtensionArray:
+    """Wrap CSR offsets/values as a pandas list<int32> column (no per-row objects)."""
+    return pd.arrays.ArrowExtensionArray(
+        pa.ListArray.from_arrays(pa.array(offsets, pa.int32()), pa.array(values, pa.int32()))
+    )
+
+
+def csr(column: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """(offsets, store ids) of a Stores column, either Arrow-backed or Python lists."""
+    if isinstance(column.dtype, pd.ArrowDtype):
+        arr = pa.chunked_array(pa.array(column)).combine_chunks() if len(column) else pa.array([], STORES_TYPE)
+        lengths = pc.list_value_length(arr).fill_null(0).to_numpy()
+        values = arr.flatten().to_numpy(zero_copy_only=False).astype(np.int32, copy=False)
+    else:
+        lengths = column.map(len).to_numpy()
+        values = np.fromiter((sid for row in column for sid in row), dtype=np.int32, count=int(lengths.sum()))
+    return np.r_[0, np.cumsum(lengths)].astype(np.int64), values
+
+
+def csr_max(values: np.ndarray, offsets: np.ndarray, empty: int = 0) -> np.ndarray:
+    """Per-row maximum of values over CSR rows; rows without values get empty."""
+    counts = np.diff(offsets)
+    out = np.full(len(counts), empty, dtype=values.dtype if len(values) else np.int64)
+    nonempty = counts > 0
+    if nonempty.any():
+        out[nonempty] = np.maximum.reduceat(values, offsets[:-1][nonempty])
+    return out
+
+
+def compact_frame(df: pd.DataFrame, table: str) -> pd.DataFrame:
+    out = df.copy()
+    for col in CATEGORY_COLUMNS[table]:
+        if col in out and not isinstance(out[col].dtype, pd.CategoricalDtype):
+            out[col] = out[col].astype("category")
+    if "Stores" in out and not isinstance(out["Stores"].dtype, pd.ArrowDtype):
+        out["Stores"] = list_column(*csr(out["Stores"]))
+    return out
+
+
+def legacy_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """The original layout: object strings and a Python list per user."""
+    out = df.copy()
+    for col in out.columns:
+        if isinstance(out[col].dtype, (pd.CategoricalDtype, pd.StringDtype)):
+            out[col] = out[col].astype(object).where(out[col].notna(), None)
+    if "Stores" in out and isinstance(out["Stores"].dtype, pd.ArrowDtype):
+        offsets, values = csr(out["Stores"])
+        flat = values.tolist()
+        out["Stores"] = pd.Series([flat[a:b] for a, b in zip(offsets[:-1], offsets[1:])], index=out.index, dtype=object)
+    return out
+
+
+def _deep_bytes(df: pd.DataFrame) -> int:
+    total = int(df.memory_usage(deep=True, index=False).sum())
+    # memory_usage counts a Python list but not the int objects inside it
+    if "Stores" in df and df["Stores"].dtype == object:
+        total += int(df["Stores"].map(len).sum()) * 28
+    return total
+
+
+def memory_report(frames: dict) -> pd.DataFrame:
+    """Bytes per table in the legacy layout vs the compact layout."""
+    rows = []
+    for table, df in frames.items():
+        compact = compact_frame(df, table)
+        before, after = _deep_bytes(legacy_frame(df)), _deep_bytes(compact)
+        rows.append({
+            "Table": table,
+            "Rows": len(df),
+            "LegacyBytes": before,
+            "CompactBytes": after,
+            "Saved %": round(100 * (1 - after / before), 1) if before else 0.0,
+        })
+    report = pd.DataFrame(rows)
+    total = report[["Rows", "LegacyBytes", "CompactBytes"]].sum()
+    report.loc[len(report)] = {
+        "Table": "total", **total.to_dict(),
+        "Saved %": round(100 * (1 - total["CompactBytes"] / total["LegacyBytes"]), 1) if total["LegacyBytes"] else 0.0,
+    }
+    return report
+
+
+def main() -> None:
+    from mock_data import generate_dataset
+
+    parser = argparse.ArgumentParser(description="Report table memory in the legacy and compact layouts.")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--stores", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    df_users, df_stores, df_subscriptions = generate_dataset(args.users, args.stores, seed=args.seed)
+    report = memory_report({"users": df_users, "stores": df_stores, "subscriptions": df_subscriptions})
+    print(report.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,462 +1,1144 @@
-import streamlit as st
-import pandas as pd
-import altair as alt
-import numpy as np
-import random
-from datetime import datetime, timedelta
-from mock_data import df_users, df_stores, df_subscriptions
-
-st.set_page_config(page_title="📊 Admin Dashboard", layout="wide")
-
-st.title("📊 Possax Admin Dashboard")
-
-
-# ======================================================
-# GLOBAL FILTERS (top of page)
-# ======================================================
-with st.popover("🔍 Filters"):
-    c1, c2 = st.columns(2)
-
-    # Expiry window (for expiring tab/analytics)
-    expiry_window = c1.selectbox("Expiry Window", ["All", "7 days", "14 days", "30 days", "Expired"], index=0)
-    
-    # Date range (users: CreatedAt, stores: CreatedAt)
-    min_date = min(df_users["CreatedAt"].min(), df_stores["CreatedAt"].min()).date()
-    max_date = max(df_users["CreatedAt"].max(), df_stores["CreatedAt"].max()).date()
-    date_range = c2.date_input("Date Range", [min_date, max_date])
-    
-    c3, c4, c5= st.columns(3)
-    
-    # City
-    city_options = sorted(df_users["City"].unique().tolist())
-    city_filter = c3.multiselect("City", city_options, default=city_options)
-    
-    # Subscription type (stores)
-    sub_options = sorted(df_stores["SubscriptionType"].unique().tolist())
-    sub_filter = c4.multiselect("Subscription Type", sub_options, default=sub_options)
-
-    # User role
-    role_options = sorted(df_users["Role"].unique().tolist())
-    role_filter = c5.multiselect("User Role", role_options, default=role_options)
-
-# Apply filters
-users_f = df_users.copy()
-stores_f = df_stores.copy()
-subs_f = df_subscriptions.copy()
-
-if len(date_range) == 2:
-    start, end = [pd.to_datetime(d) for d in date_range]
-    users_f = users_f[(users_f["CreatedAt"] >= start) & (users_f["CreatedAt"] <= end)]
-    stores_f = stores_f[(stores_f["CreatedAt"] >= start) & (stores_f["CreatedAt"] <= end)]
-
-if sub_filter:
-    stores_f = stores_f[stores_f["SubscriptionType"].isin(sub_filter)]
-
-if role_filter:
-    users_f = users_f[users_f["Role"].isin(role_filter)]
-
-if city_filter:
-    users_f = users_f[users_f["City"].isin(city_filter)]
-
-# Sync subs with filtered stores
-subs_f = subs_f[subs_f["StoreID"].isin(stores_f["StoreID"])]
-
-# ======================================================
-# METRICS
-# ======================================================
-with st.container():
-    with st.expander("⚡ Key Metrics", expanded=True):
-        m1, m2, m3, m4, m5 = st.columns(5)
-
-        total_users = len(users_f)
-        total_stores = len(stores_f)
-        total_pro_stores = (stores_f["SubscriptionType"] == "Pro").sum()
-        total_basic_stores = (stores_f["SubscriptionType"] == "Basic").sum()
-        total_income = subs_f[subs_f["Type"].isin(["Pro", "Basic"])]["AmountPaid"].sum()
-
-        m1.metric("Total Users", f"{total_users:,}", "+12 users", border=True)
-        m2.metric("Total Stores", f"{total_stores:,}", "+5 stores", border=True )
-        m3.metric("Pro Stores", f"{total_pro_stores}", "+6 Pro Users", border=True)
-        m4.metric("Basic Stores", f"{total_basic_stores}", "-4 Basic Users", border=True)
-        m5.metric("Total Income (IDR)", f"{total_income:,.0f}","+155000",border=True)
-
-
-
-tab1, tab2 = st.tabs(["📉 Charts & Infographics", "📋 Detailed Data"])
-
-# ======================================================
-# CHARTS & GRAPHICS
-# ======================================================
-with tab1:
-    #with st.expander("📉 Charts & Infographics", expanded=True):
-
-        # Trendline: users by subscription type (derived) over time
-        # Group by month and UserSubscriptionType
-        uf = users_f.copy()
-        uf["Month"] = uf["CreatedAt"].dt.to_period("M").dt.to_timestamp()
-        user_sub_trend = (
-            uf.groupby(["Month", "UserSubscriptionType"])
-            .size().reset_index(name="UserCount")
-        )
-
-        chart_user_sub_trend = (
-            alt.Chart(user_sub_trend)
-            .mark_line(point=True)
-            .encode(
-                x=alt.X("Month:T", title="Month"),
-                y=alt.Y("UserCount:Q", title="Users"),
-                color=alt.Color("UserSubscriptionType:N", title="Subscription"),
-                tooltip=["Month:T", "UserSubscriptionType:N", "UserCount:Q"]
-            )
-            .properties(title="Users by Subscription Type Over Time")
-        )
-
-        # Trend: store count over time (by created)
-        sf = stores_f.copy()
-        sf["Month"] = sf["CreatedAt"].dt.to_period("M").dt.to_timestamp()
-        store_trend = sf.groupby("Month").size().reset_index(name="StoreCount")
-        chart_store_trend = (
-            alt.Chart(store_trend)
-            .mark_line(point=True)
-            .encode(
-                x=alt.X("Month:T", title="Month"),
-                y=alt.Y("StoreCount:Q", title="Stores"),
-                tooltip=["Month:T", "StoreCount:Q"]
-            )
-            .properties(title="Store Count Over Time")
-        )
-
-        # Trend: user count over time (by created)
-        user_trend = uf.groupby("Month").size().reset_index(name="UserCount")
-        chart_user_trend = (
-            alt.Chart(user_trend)
-            .mark_line(point=True)
-            .encode(
-                x=alt.X("Month:T", title="Month"),
-                y=alt.Y("UserCount:Q", title="Users"),
-                tooltip=["Month:T", "UserCount:Q"]
-            )
-            .properties(title="User Count Over Time")
-        )
-
-        c1, c2, c3 = st.columns(3)
-        c1.altair_chart(chart_user_sub_trend, use_container_width=True)
-        c2.altair_chart(chart_store_trend, use_container_width=True)
-        c3.altair_chart(chart_user_trend, use_container_width=True)
-
-        # Leaderboards in three columns with their own expanders
-        l1, l2, l3 = st.columns(3)
-
-        with l1:
-            with st.expander("🏆 Top 10 Most Active Users", expanded=True):
-                top_active = users_f.nlargest(10, "TotalTransactions")[["Name", "TotalTransactions"]]
-                st.dataframe(top_active, use_container_width=True)
-
-        with l2:
-            with st.expander("🏙 Top 10 Cities by User Count", expanded=True):
-                top_cities = (
-                    users_f["City"].value_counts().head(10).reset_index()
-                )
-                top_cities.columns = ["City", "User Count"]
-                st.dataframe(top_cities, use_container_width=True)
-
-        with l3:
-            with st.expander("🔗 Top 10 Referral Codes Used", expanded=True):
-                top_refs = (
-                    users_f["ReferralCode"].dropna().value_counts().head(10).reset_index()
-                )
-                top_refs.columns = ["Referral Code", "Usage Count"]
-                st.dataframe(top_refs, use_container_width=True)
-
-        # Pie charts
-        p1, p2 = st.columns(2)
-        with p1:
-            pie_stores = (
-                alt.Chart(stores_f)
-                .mark_arc()
-                .encode(theta="count()", color=alt.Color("SubscriptionType:N", title="Subscription"))
-                .properties(title="Stores by Subscription Type")
-            )
-            st.altair_chart(pie_stores, use_container_width=True)
-
-        with p2:
-            pie_roles = (
-                alt.Chart(users_f)
-                .mark_arc()
-                .encode(theta="count()", color=alt.Color("Role:N", title="Role"))
-                .properties(title="Users by Role")
-            )
-            st.altair_chart(pie_roles, use_container_width=True)
-
-        # Map of user locations
-        st.markdown("#### 🗺️ User Locations")
-        map_df = users_f.rename(columns={"Latitude": "lat", "Longitude": "lon"})
-        st.map(map_df[["lat", "lon"]])
-
-# ======================================================
-# ADMIN: CREATE SUBSCRIPTION TRANSACTION (st.dialog)
-# ======================================================
-def create_subs():
-    with st.form("create_subscription_form", clear_on_submit=True):
-        st.write("Create a subscription transaction for users (single or bulk).")
-        # Select users (multi)
-        selected_users = st.multiselect(
-            "Select User(s)", options=df_users["UserID"].tolist(),
-            format_func=lambda uid: f"{uid} — {df_users.loc[df_users['UserID']==uid,'Name'].values[0]}"
-        )
-        # Apply to all stores of selected users or pick stores
-        apply_scope = st.radio("Apply to", ["All stores of selected users", "Specific stores"], index=0)
-        specific_store_ids = []
-        if apply_scope == "Specific stores":
-            specific_store_ids = st.multiselect(
-                "Select Store(s)",
-                options=df_stores["StoreID"].tolist(),
-                format_func=lambda sid: f"{sid} — {df_stores.loc[df_stores['StoreID']==sid,'StoreName'].values[0]}"
-            )
-
-        sub_type = st.selectbox("Subscription Type", ["Pro", "Basic", "Trial", "Non-Paid"], index=0)
-        duration_days = st.selectbox("Duration (days)", [30, 90, 180, 365], index=0)
-        # Suggested amount
-        suggested = 400_000 if sub_type == "Pro" else (200_000 if sub_type == "Basic" else 0)
-        amount = st.number_input("Amount (IDR)", min_value=0, value=suggested, step=50_000)
-
-        submitted = st.form_submit_button("Create Transaction")
-        if submitted:
-            # Resolve target stores
-            target_store_ids = set()
-            if apply_scope == "All stores of selected users":
-                for uid in selected_users:
-                    # any store owned by or associated with the user
-                    owned = df_stores[df_stores["OwnerUserID"] == uid]["StoreID"].tolist()
-                    # plus stores listed in user's "Stores" association
-                    assoc = df_users.loc[df_users["UserID"] == uid, "Stores"].values[0]
-                    target_store_ids.update(owned + assoc)
-            else:
-                target_store_ids.update(specific_store_ids)
-
-            target_store_ids = sorted(list(target_store_ids))
-            st.success(
-                f"Created {sub_type} ({duration_days} days) subscription transaction "
-                f"for {len(target_store_ids)} store(s); amount: IDR {amount:,.0f}."
-            )
-            if target_store_ids:
-                st.write("Target Stores:", target_store_ids)
-
-# ======================================================
-# ADMIN: DELETE SUBSCRIPTION TRANSACTION (st.dialog)
-# ======================================================
-
-def cancel_subscription():
-    with st.form("cancel_subscription_form", clear_on_submit=True):
-        st.write("Cancel a subscription transaction for a specific store.")
-
-        # Select a store
-        selected_store = st.selectbox(
-            "Select Store",
-            options=df_stores["StoreID"].tolist(),
-            format_func=lambda sid: f"{sid} — {df_stores.loc[df_stores['StoreID']==sid,'StoreName'].values[0]}"
-        )
-
-        # Enter transaction ID
-        transaction_id = st.text_input("Enter Transaction ID", placeholder="e.g., TXN-123456")
-
-        # Reason for cancellation
-        reason = st.text_area("Reason for cancellation", placeholder="Enter reason (optional)")
-
-        submitted = st.form_submit_button("Cancel Subscription")
-        if submitted:
-            if not transaction_id:
-                st.error("Transaction ID is required to cancel a subscription.")
-            else:
-                st.success(
-                    f"Cancelled subscription transaction {transaction_id} "
-                    f"for store {selected_store}."
-                )
-                if reason:
-                    st.info(f"Reason provided: {reason}")
-
-# ======================================================
-# DATA TABLES (Tabs)
-# ======================================================
-with tab2:
-    #with st.expander("📋 Detailed Data", expanded=True):
-        co1, co2, co3, co4, co5, co6 = st.columns(6,  gap="small")
-        with co1:
-            open_dialog = st.button("➕ Create Subscription Transaction")
-            if open_dialog:
-                @st.dialog("Create Subscription Transaction")
-                def show_dialog():
-                    create_subs()
-                show_dialog()
-        with co2:
-            open_dialog = st.button("⚠️ Cancel Subscription Transaction")
-            if open_dialog:
-                @st.dialog("Cancel Subscription Transaction")
-                def show_dialog():
-                    cancel_subscription()
-                show_dialog()
-
-
-        tab_users, tab_stores, tab_expiring, tab_subscription = st.tabs(["Users", "Stores", "Expiring", "Subscription"])
-        # ---------- Users Tab ----------
-        with tab_users:
-            st.markdown("**Users**")
-            cols = [
-                "UserID", "Name", "CreatedAt", "LastActivity", "Role", "Stores",
-                "DeviceType", "Phone", "Email", "ReferralCode", "City", "TotalTransactions"
-            ]
-            st.dataframe(users_f[cols], use_container_width=True)
-
-        with tab_stores:
-            st.markdown("**Stores**")
-
-            # Join owner name
-            owner_names = df_users.set_index("UserID")["Name"]
-            stores_display = stores_f.copy()
-            stores_display["Owner"] = stores_display["OwnerUserID"].map(owner_names)
-            stores_display["DaysToExpiry"] = (stores_display["CurrentEnd"] - datetime.now()).dt.days
-
-            cols = [
-                "StoreID", "StoreName", "StoreType", "Owner", "City",
-                "SubscriptionType", "CurrentStart", "CurrentEnd",
-                "ReoccuringSubs", "TotalMoneySpent", "DaysToExpiry", "Is_Branch"
-            ]
-
-            # Sort by soonest expiry
-            stores_display = stores_display.sort_values("DaysToExpiry", ascending=True)
-
-            # Add a link column
-            stores_display["View Details"] = stores_display["StoreID"].apply(
-                lambda x: f"#store-{x}"
-            )
-
-            edited_df = st.data_editor(
-                stores_display[cols + ["View Details"]],
-                use_container_width=True,
-                disabled=True,
-                column_config={
-                    "View Details": st.column_config.LinkColumn(
-                        "View Details",
-                        display_text="View",
-                        help="Click to view store details",
-                    )
-                },
-                hide_index=True,
-            )
-
-            selected_store_id = None
-            if "selected_store" not in st.session_state:
-                st.session_state.selected_store = None
-
-
-            if st.session_state.selected_store:
-                row = stores_display[stores_display["StoreID"] == st.session_state.selected_store].iloc[0]
-
-                with st.dialog("Store Details"):
-                    st.write("### Store Information")
-                    for col in cols:
-                        st.write(f"**{col}:** {row[col]}")  
-
-
-        # ---------- Expiring Tab ----------
-        with tab_expiring:
-            st.markdown("**Expiring / Expired Subscriptions**")
-            today = datetime.now()
-            exp_df = stores_f.copy()
-            exp_df["DaysToExpiry"] = (exp_df["CurrentEnd"] - today).dt.days
-
-            # Apply expiry window
-            if expiry_window == "7 days":
-                exp_df = exp_df[(exp_df["DaysToExpiry"] >= 0) & (exp_df["DaysToExpiry"] <= 7)]
-            elif expiry_window == "14 days":
-                exp_df = exp_df[(exp_df["DaysToExpiry"] >= 0) & (exp_df["DaysToExpiry"] <= 14)]
-            elif expiry_window == "30 days":
-                exp_df = exp_df[(exp_df["DaysToExpiry"] >= 0) & (exp_df["DaysToExpiry"] <= 30)]
-            elif expiry_window == "Expired":
-                exp_df = exp_df[exp_df["DaysToExpiry"] < 0]
-            # else "All" → keep as is
-
-            # Table: expiring stores
-            owner_names = df_users.set_index("UserID")["Name"]
-            exp_df["Owner"] = exp_df["OwnerUserID"].map(owner_names)
-            cols = [
-                "StoreID", "StoreName", "StoreType", "Owner", "City",
-                "SubscriptionType", "CurrentEnd", "DaysToExpiry", "ReoccuringSubs", "TotalMoneySpent"
-            ]
-
-            # Add "View Details" link column
-            exp_df["View Details"] = exp_df["StoreID"].apply(lambda x: f"#store-{x}")
-
-            st.data_editor(
-                exp_df.sort_values("DaysToExpiry")[cols + ["View Details"]],
-                use_container_width=True,
-                disabled=True,  # 🔒 make table read-only
-                column_config={
-                    "View Details": st.column_config.LinkColumn(
-                        "View Details",
-                        display_text="View",
-                        help="Click to view store details",
-                    )
-                },
-                hide_index=True,
-            )
-
-            # Trendline: counts of expiring stores per subscription type (by CurrentEnd date)
-            if not exp_df.empty:
-                exp_df["EndDateOnly"] = exp_df["CurrentEnd"].dt.date
-                trend_exp = (
-                    exp_df.groupby(["EndDateOnly", "SubscriptionType"])
-                    .size().reset_index(name="Count")
-                )
-                chart_exp = (
-                    alt.Chart(trend_exp)
-                    .mark_line(point=True)
-                    .encode(
-                        x=alt.X("EndDateOnly:T", title="End Date"),
-                        y=alt.Y("Count:Q", title="Stores"),
-                        color=alt.Color("SubscriptionType:N", title="Subscription"),
-                        tooltip=["EndDateOnly:T", "SubscriptionType:N", "Count:Q"]
-                    )
-                    .properties(title=f"Expiring Stores Trend ({expiry_window})")
-                )
-                st.altair_chart(chart_exp, use_container_width=True)
-
-            # Owners (users) affected by expiring stores
-            affected_user_ids = exp_df["OwnerUserID"].unique().tolist()
-            if affected_user_ids:
-                st.markdown("**Affected Owners**")
-                owners_df = df_users[df_users["UserID"].isin(affected_user_ids)][
-                    ["UserID", "Name", "Role", "Phone", "Email", "City", "TotalTransactions"]
-                ]
-                st.data_editor(
-                    owners_df,
-                    use_container_width=True,
-                    disabled=True,  # make owners table also non-editable
-                    hide_index=True,
-                )
-            else:
-                st.info("No owners in this expiry window.")
-        
-        with tab_subscription:
-            n_logs = 50
-
-            subscription_logs = pd.DataFrame({
-                "StoreID": np.random.choice(df_stores["StoreID"], size=n_logs),
-                "Datetime": [datetime.now() - timedelta(days=random.randint(0, 365), hours=random.randint(0,23)) for _ in range(n_logs)],
-                "SubscriptionType": np.random.choice(df_stores["SubscriptionType"], size=n_logs),
-                "SubscriptionPeriod": np.random.choice([30, 90, 180, 365], size=n_logs),
-                "Amount": [random.choice([0, 200_000, 400_000]) for _ in range(n_logs)],
-                "TransactionID": [f"TXN-{random.randint(100000,999999)}" for _ in range(n_logs)],
-                "ReferralCodeUsed": np.random.choice(df_users["ReferralCode"].dropna().tolist() + [None]*10, size=n_logs)
-            })
-
-            # -------------------------
-            # Display in Streamlit
-            # -------------------------
-            st.markdown("**Subscription Logs**")
-            st.data_editor(
-                subscription_logs,
-                use_container_width=True,
-                disabled=True,  # make table non-editable
-                hide_index=True
-            )
\ No newline at end of file
+import functools
+import os
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+import streamlit as st
+from datetime import datetime, timedelta
+from chart_data import fit_budget, payload_bytes
+from filters import FilterState
+from geo_bins import LEVELS
+from ledger import LEDGER_PATH, Ledger
+from paging import PAGE_SIZES, TablePage
+from result_cache import ResultCache
+from refresher import Dataset, Refresher
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+if TYPE_CHECKING:
+    import approx
+    from search_index import SearchIndex
+
+# Startup: only what the first paint (filters, Key Metrics) needs is imported
+# here. The backends, approximate mode, the worker pool, exports, cohorts and
+# profiling are imported where they are used, altair by the chart panels, the
+# admin indexes by the dialogs, and the data is loaded on first access with a
+# spinner; derived
+# structures come from the snapshot's on-disk cache when it is warm.
+
+st.set_page_config(page_title="📊 Admin Dashboard", layout="wide")
+
+
+# Full tables are memory-mapped from the on-disk snapshot (built on first run),
+# so every server process shares the same pages instead of its own copy. The
+# refresher rebuilds it in the background ($POSSAX_REFRESH_SECONDS) and swaps
+# versions between reruns, see refresher.py
+@st.cache_resource(show_spinner="Loading data…")
+def load_refresher():
+    return Refresher().start()
+
+
+def load_data() -> Dataset:
+    # The version this session's page was rendered from, while it is alive;
+    # a fragment rerunning after it was released moves to the current one
+    return load_refresher().get(st.session_state.get("data_id"))
+
+
+# Filtered frames and panel results shared by every session (result_cache.py)
+@st.cache_resource
+def load_result_cache():
+    return ResultCache()
+
+
+# Query backend ("pandas" or "sql", from $POSSAX_BACKEND) answering every
+# panel; this and the indexes below are built once per data version
+def load_backend(name: Optional[str] = None):
+    from backends import BACKEND, get_backend
+
+    data, name = load_data(), name or BACKEND
+    key = f"backend_{name}"
+    build = lambda: get_backend(name, *data.frames, path=data.path, cache=load_result_cache())
+    if data.has(key):
+        return data.resource(key, build)
+    with st.spinner("Preparing the dashboard…"):
+        return data.resource(key, build)
+
+
+# Stratified samples behind approximate mode (approx.py), once per data
+# version and kept in the snapshot's cache
+def load_samples() -> "approx.Samples":
+    import approx
+    import snapshot
+
+    data = load_data()
+    return data.resource(
+        "samples", lambda: snapshot.cached("samples", lambda: approx.Samples(*data.frames), data.path)
+    )
+
+
+# Owner/member ↔ store indexes for bulk subscription targeting
+def load_store_index():
+    from store_index import StoreIndex
+
+    data = load_data()
+    return data.resource("store_index", lambda: StoreIndex(*data.frames[:2]))
+
+
+# Type-ahead indexes over user names/emails/phones and store names
+def load_search_indexes():
+    from search_index import SearchIndex
+
+    data = load_data()
+    return data.resource(
+        "search_indexes", lambda: (SearchIndex.users(data.frames[0]), SearchIndex.stores(data.frames[1]))
+    )
+
+
+# Append-only subscription transaction ledger, shared by all sessions
+@st.cache_resource
+def load_ledger():
+    return Ledger(LEDGER_PATH)
+
+
+# Per-store subscription rollup, kept current with the ledger batch by batch
+def load_rollup():
+    from store_rollup import StoreRollup
+
+    data, index = load_data(), load_store_index()  # not inside build: resources are built under one lock
+
+    def build():
+        rollup = StoreRollup(*data.frames, index=index)
+        rollup.sync(load_ledger())
+        return rollup
+    return data.resource("rollup", build)
+
+
+# Ledger transactions the backend has not applied yet (written by any session
+# or process), through the rollup into its tables; one at a time per version
+def sync_ledger():
+    data, ledger, backend = load_data(), load_ledger(), load_backend()
+    if backend.ledger_id == ledger.id and backend.ledger_seq >= ledger.version():
+        return []
+    with data.resource("ledger_lock", threading.Lock):
+        rollup = load_rollup()
+        rollup.sync(ledger)
+        return backend.sync_ledger(ledger, rollup)
+
+
+# Filter widget bounds and options of a data version
+def filter_options(df_users, df_stores) -> dict:
+    return {
+        "dates": (
+            min(df_users["CreatedAt"].min(), df_stores["CreatedAt"].min()).date(),
+            max(df_users["CreatedAt"].max(), df_stores["CreatedAt"].max()).date(),
+        ),
+        "cities": sorted(df_users["City"].unique().tolist()),
+        "sub_types": sorted(df_stores["SubscriptionType"].unique().tolist()),
+        "roles": sorted(df_users["Role"].unique().tolist()),
+    }
+
+
+# ======================================================
+# RERUN SCOPE
+# ======================================================
+# Every panel below is a fragment: its own widgets (map detail, sorting,
+# paging, the expiry window) rerun only that panel. Panel results are kept in
+# session_state until their inputs change, so full reruns that don't touch
+# the filters (tab switches, dialogs) reuse them, and tabs are lazy: a tab's
+# panels run when it is first opened. With POSSAX_WORKERS > 1 an opened tab's
+# computations all start at once on the worker pool (pipeline.py) and each
+# panel renders as soon as its own result is ready.
+TODAY_TTL = timedelta(minutes=10)
+
+
+def fragment_rerun() -> bool:
+    ctx = get_script_run_ctx()
+    return bool(ctx and ctx.fragment_ids_this_run)
+
+
+def span(name: str, rows_in=None):
+    # Spans go to the current run: the full rerun, or a fragment rerunning alone
+    return st.session_state.perf_run.span(name, rows_in)
+
+
+def panel(fn):
+    @st.fragment
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        if not fragment_rerun() or st.session_state.get("perf_fragment"):
+            return fn(*args, **kwargs)
+        # outermost fragment of a fragment rerun: its spans are a run of their own
+        from backends import BACKEND
+        from perf import Rerun
+
+        st.session_state.perf_fragment = True
+        st.session_state.perf_run = Rerun(BACKEND, scope=fn.__name__)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            st.session_state.perf_fragment = False
+            st.session_state.perf_run.export()
+    return run
+
+
+def shared(slot: str, key, compute):
+    # compute, answered from the process-wide result cache when another
+    # session (or this one, earlier) already computed the same slot and key
+    # on the same data version and ledger Seq
+    backend = load_backend()
+    version = (load_data().version, backend.ledger_id, backend.ledger_seq)
+    return lambda: load_result_cache().get((slot, key, version), compute)
+
+
+def memo(slot: str, key, compute):
+    cached = st.session_state.get(f"memo_{slot}")
+    if cached is None or cached[0] != key:
+        cached = (key, shared(slot, key, compute)())
+    elif isinstance(cached[1], Future):
+        cached = (key, cached[1].result())
+    st.session_state[f"memo_{slot}"] = cached
+    return cached[1]
+
+
+def prefetch(state: FilterState, jobs: dict) -> None:
+    # Submit every stale {slot: (key, compute)} to the pool; memo() waits for it
+    from pipeline import WORKERS, prefilter, submit
+
+    stale = {slot: job for slot, job in jobs.items() if st.session_state.get(f"memo_{slot}", (None,))[0] != job[0]}
+    if WORKERS <= 1 or not stale:
+        return
+    backend = load_backend()
+    if not st.session_state.get("approx_mode"):
+        prefilter(backend, state)  # once here, shared by the workers (approximate mode: filtered on the pool)
+    for slot, (key, compute) in stale.items():
+        st.session_state[f"memo_{slot}"] = (key, submit(backend, shared(slot, key, compute)))
+
+
+def forget_panels() -> None:
+    # Subscription changes move store expiries: recompute the tables
+    for slot in [k for k in st.session_state if k.startswith("memo_")]:
+        del st.session_state[slot]
+
+
+# One span per section of this rerun (Performance panel at the bottom); a
+# sampling profile only when requested from that panel
+from backends import BACKEND
+from perf import Rerun, SamplingProfiler
+
+st.session_state.perf_run = Rerun(BACKEND)
+profiler = SamplingProfiler().start() if st.session_state.pop("profile_next", False) else None
+
+# The data version this rerun renders, taken once: a refresh landing mid-run
+# is picked up by the next rerun. Held until the end of the script.
+with span("load") as sp:
+    dataset = load_refresher().current
+    st.session_state.data_id = dataset.version
+    sp.rows_out = sum(len(df) for df in dataset.frames)
+
+# A new snapshot or ledger write invalidates the shared results, and this
+# session's copies of them
+sync_ledger()
+data_version = (dataset.version, load_ledger().version())
+load_result_cache().validate(data_version)
+if st.session_state.get("data_version") != data_version:
+    st.session_state.data_version = data_version
+    forget_panels()
+
+st.title("📊 Possax Admin Dashboard")
+
+
+# ======================================================
+# GLOBAL FILTERS (top of page)
+# ======================================================
+with st.popover("🔍 Filters"):
+    options = dataset.resource("filter_options", lambda: filter_options(*dataset.frames[:2]))
+
+    # Date range (users: CreatedAt, stores: CreatedAt)
+    min_date, max_date = options["dates"]
+    date_range = st.date_input("Date Range", [min_date, max_date])
+    
+    c3, c4, c5= st.columns(3)
+    
+    # City
+    city_options = options["cities"]
+    city_filter = c3.multiselect("City", city_options, default=city_options)
+    
+    # Subscription type (stores)
+    sub_options = options["sub_types"]
+    sub_filter = c4.multiselect("Subscription Type", sub_options, default=sub_options)
+
+    # User role
+    role_options = options["roles"]
+    role_filter = c5.multiselect("User Role", role_options, default=role_options)
+
+    # Sampled Key Metrics and charts first, exact ones in the background
+    import approx
+
+    st.toggle(
+        "Approximate mode", key="approx_mode",
+        value=sum(len(df) for df in dataset.frames[:2]) >= approx.APPROX_ROWS,
+        help="Show estimates from a stratified sample (City × Subscription Type) with 95% confidence "
+        "intervals while the exact values are computed",
+    )
+
+# Apply filters (the expiry window lives in the Expiring tab)
+state = FilterState.from_widgets(date_range, city_filter, sub_filter, role_filter)
+
+
+def refilter(state: FilterState) -> None:
+    # panels recompute for the new view; filter the frames once for all of them
+    from pipeline import prefilter
+
+    with span("filter", rows_in=len(dataset.frames[0]) + len(dataset.frames[1])) as sp:
+        filtered = prefilter(load_backend(), state)
+        sp.rows_out = len(filtered[0]) + len(filtered[1]) if filtered else None
+
+
+# "today" stays fixed while the filters do, so cached DaysToExpiry agree
+# across panels; it moves on when they change or after TODAY_TTL
+view = st.session_state.get("view")
+if view is None or view[0] != state or datetime.now() - view[1] > TODAY_TTL:
+    view = st.session_state.view = (state, datetime.now())
+    if not st.session_state.approx_mode:
+        refilter(state)  # approximate mode filters on the worker pool instead
+today = view[1]
+
+
+# ======================================================
+# APPROXIMATE MODE
+# ======================================================
+# Key Metrics, trends and pies first render from the smallest stratified
+# sample (approx.py), with 95% confidence intervals. The larger samples of
+# approx.FRACTIONS and then the exact results are computed one after another
+# on the worker pool; each panel shows the best result ready, marked as
+# approximate until it is exact, and a watcher fragment reruns the page as
+# each one lands.
+REFINE_POLL = 1.0  # seconds
+
+
+def refine(state: FilterState, jobs: dict) -> None:
+    # Start the estimates of the view and its exact {slot: (key, compute)} jobs in the background
+    import approx
+    from pipeline import background
+
+    backend = load_backend()
+    if st.session_state.get("memo_approx", (None,))[0] != state:
+        samples = load_samples()
+        with span("approx") as sp:
+            first = Future()
+            first.set_result((approx.FRACTIONS[0], samples.estimates(state, approx.FRACTIONS[0])))
+            sp.rows_in = len(samples.users.frame) + len(samples.stores.frame)
+        later = [
+            background(backend, lambda fraction=fraction: (fraction, samples.estimates(state, fraction)))
+            for fraction in approx.FRACTIONS[1:]
+        ]
+        st.session_state.memo_approx = (state, [first] + later)
+    for slot, (key, compute) in jobs.items():
+        if st.session_state.get(f"memo_{slot}", (None,))[0] != key:
+            st.session_state[f"memo_{slot}"] = (key, background(backend, shared(slot, key, compute)))
+
+
+def pending(future) -> bool:
+    return isinstance(future, Future) and not future.done()
+
+
+def estimated(state: FilterState) -> tuple:
+    # (sample fraction, {slot: estimate}) of the largest sample ready for the view
+    levels = st.session_state.get("memo_approx", (None, []))
+    ready = [f.result() for f in levels[1] if f.done() and not f.exception()] if levels[0] == state else []
+    return ready[-1] if ready else (None, {})
+
+
+def refined(slot: str, key, compute):
+    # memo(), except that an exact result still being computed in approximate
+    # mode is stood in for by the best estimate so far
+    cached = st.session_state.get(f"memo_{slot}")
+    if st.session_state.approx_mode and cached and cached[0] == key and pending(cached[1]):
+        estimate = estimated(key)[1].get(slot)
+        if estimate is not None:
+            return estimate
+    return memo(slot, key, compute)
+
+
+def approx_note(state: FilterState) -> None:
+    fraction = estimated(state)[0]
+    st.caption(
+        f"≈ Approximate: estimated from a {fraction:.0%} stratified sample (City × Subscription Type), "
+        "± 95% confidence intervals. Refining to exact values in the background…"
+    )
+
+
+@st.fragment(run_every=REFINE_POLL)
+def refine_watch(futures: list) -> None:
+    # Polls the refinements running at the last full rerun: the page reruns when one is done
+    if any(f.done() for f in futures):
+        st.rerun()
+
+# ======================================================
+# METRICS
+# ======================================================
+@panel
+def key_metrics(state: FilterState):
+    with st.expander("⚡ Key Metrics", expanded=True):
+        m1, m2, m3, m4, m5 = st.columns(5)
+
+        with span("metrics"):
+            backend = load_backend()
+            job = (state, lambda: backend.key_metrics(state))
+            if st.session_state.approx_mode:
+                refine(state, {"metrics": job})
+            metrics = refined("metrics", *job)
+
+        # Estimates: "≈" values, their confidence intervals in the help
+        margins = metrics.get("margins")
+        about = "≈ " if margins else ""
+        ci = lambda key: f"± {margins[key]:,} (95% confidence interval)" if margins else None
+        m1.metric("Total Users", f"{about}{metrics['total_users']:,}", "+12 users", border=True, help=ci("total_users"))
+        m2.metric("Total Stores", f"{about}{metrics['total_stores']:,}", "+5 stores", border=True, help=ci("total_stores"))
+        m3.metric("Pro Stores", f"{about}{metrics['total_pro_stores']}", "+6 Pro Users", border=True, help=ci("total_pro_stores"))
+        m4.metric("Basic Stores", f"{about}{metrics['total_basic_stores']}", "-4 Basic Users", border=True, help=ci("total_basic_stores"))
+        m5.metric("Total Income (IDR)", f"{about}{metrics['total_income']:,.0f}","+155000",border=True, help=ci("total_income"))
+        if margins:
+            approx_note(state)
+
+
+key_metrics(state)
+
+tab1, tab2, tab3 = st.tabs(
+    ["📉 Charts & Infographics", "📋 Detailed Data", "🔁 Cohorts"], key="main_tab", on_change="rerun"
+)
+
+
+def chart_jobs(state: FilterState, level=None) -> dict:
+    # The chart panels' computations: {memo slot: (inputs, compute)}
+    backend = load_backend()
+    return {
+        "user_sub_trend": (state, lambda: fit_budget(
+            backend.user_sub_trend(state), "Month", "UserCount", "UserSubscriptionType"
+        )[0]),
+        "store_trend": (state, lambda: fit_budget(backend.store_trend(state), "Month", "StoreCount")[0]),
+        "user_trend": (state, lambda: fit_budget(backend.user_trend(state), "Month", "UserCount")[0]),
+        "top_active": (state, lambda: backend.top_active(state, 10)),
+        "top_cities": (state, lambda: backend.top_cities(state, 10)),
+        "top_refs": (state, lambda: backend.top_refs(state, 10)),
+        "store_type_counts": (state, lambda: backend.store_type_counts(state)),
+        "role_counts": (state, lambda: backend.role_counts(state)),
+        "map": ((state, level), lambda: backend.user_map(state, level)),
+    }
+
+
+# ======================================================
+# CHARTS & GRAPHICS
+# ======================================================
+def titled(title: str, df) -> str:
+    return f"{title} (≈ approximate)" if "Margin" in df.columns else title
+
+
+def with_band(chart, df, y: str, color=None):
+    # An estimated series gets its 95% confidence band under the line
+    import altair as alt
+
+    if "Margin" not in df.columns:
+        return chart
+    band = (
+        alt.Chart(df)
+        .transform_calculate(Low=f"datum.{y} - datum.Margin", High=f"datum.{y} + datum.Margin")
+        .mark_area(opacity=0.2)
+        .encode(x="Month:T", y=alt.Y("Low:Q", axis=None), y2="High:Q", **({"color": f"{color}:N"} if color else {}))
+    )
+    return alt.layer(band, chart)
+
+
+@panel
+def trends(state: FilterState):
+    import altair as alt
+
+    # Trendline: users by subscription type (derived) over time
+    # Group by month and UserSubscriptionType
+    # (every chart gets aggregated series only, capped at the point budget)
+    jobs = chart_jobs(state)
+    with span("user_sub_trend") as sp:
+        user_sub_trend = refined("user_sub_trend", *jobs["user_sub_trend"])
+        sp.output(user_sub_trend, chart=True)
+
+    chart_user_sub_trend = (
+        alt.Chart(user_sub_trend)
+        .mark_line(point=True)
+        .encode(
+            x=alt.X("Month:T", title="Month"),
+            y=alt.Y("UserCount:Q", title="Users"),
+            color=alt.Color("UserSubscriptionType:N", title="Subscription"),
+            tooltip=["Month:T", "UserSubscriptionType:N", "UserCount:Q", *user_sub_trend.columns.intersection(["Margin"])]
+        )
+    )
+    chart_user_sub_trend = with_band(chart_user_sub_trend, user_sub_trend, "UserCount", "UserSubscriptionType").properties(
+        title=titled("Users by Subscription Type Over Time", user_sub_trend)
+    )
+
+    # Trend: store count over time (by created)
+    with span("store_trend") as sp:
+        store_trend = refined("store_trend", *jobs["store_trend"])
+        sp.output(store_trend, chart=True)
+    chart_store_trend = (
+        alt.Chart(store_trend)
+        .mark_line(point=True)
+        .encode(
+            x=alt.X("Month:T", title="Month"),
+            y=alt.Y("StoreCount:Q", title="Stores"),
+            tooltip=["Month:T", "StoreCount:Q", *store_trend.columns.intersection(["Margin"])]
+        )
+    )
+    chart_store_trend = with_band(chart_store_trend, store_trend, "StoreCount").properties(
+        title=titled("Store Count Over Time", store_trend)
+    )
+
+    # Trend: user count over time (by created)
+    with span("user_trend") as sp:
+        user_trend = refined("user_trend", *jobs["user_trend"])
+        sp.output(user_trend, chart=True)
+    chart_user_trend = (
+        alt.Chart(user_trend)
+        .mark_line(point=True)
+        .encode(
+            x=alt.X("Month:T", title="Month"),
+            y=alt.Y("UserCount:Q", title="Users"),
+            tooltip=["Month:T", "UserCount:Q", *user_trend.columns.intersection(["Margin"])]
+        )
+    )
+    chart_user_trend = with_band(chart_user_trend, user_trend, "UserCount").properties(
+        title=titled("User Count Over Time", user_trend)
+    )
+
+    with span("trend_charts"):
+        c1, c2, c3 = st.columns(3)
+        c1.altair_chart(chart_user_sub_trend, use_container_width=True)
+        c2.altair_chart(chart_store_trend, use_container_width=True)
+        c3.altair_chart(chart_user_trend, use_container_width=True)
+    if any("Margin" in df.columns for df in (user_sub_trend, store_trend, user_trend)):
+        approx_note(state)
+
+
+@panel
+def leaderboards(state: FilterState):
+    # Leaderboards in three columns with their own expanders
+    jobs = chart_jobs(state)
+    l1, l2, l3 = st.columns(3)
+
+    with l1:
+        with st.expander("🏆 Top 10 Most Active Users", expanded=True):
+            with span("top_active") as sp:
+                top_active = memo("top_active", *jobs["top_active"])
+                st.dataframe(top_active, use_container_width=True)
+                sp.output(top_active)
+
+    with l2:
+        with st.expander("🏙 Top 10 Cities by User Count", expanded=True):
+            with span("top_cities") as sp:
+                top_cities = memo("top_cities", *jobs["top_cities"])
+                st.dataframe(top_cities, use_container_width=True)
+                sp.output(top_cities)
+
+    with l3:
+        with st.expander("🔗 Top 10 Referral Codes Used", expanded=True):
+            with span("top_refs") as sp:
+                top_refs = memo("top_refs", *jobs["top_refs"])
+                st.dataframe(top_refs, use_container_width=True)
+                sp.output(top_refs)
+            if "Max Overcount" in top_refs.columns:
+                st.caption("Approximate counts: too many distinct codes, each count may be high by up to its Max Overcount.")
+
+
+@panel
+def pies(state: FilterState):
+    import altair as alt
+
+    jobs = chart_jobs(state)
+    p1, p2 = st.columns(2)
+    with p1, span("store_type_pie") as sp:
+        store_types = refined("store_type_counts", *jobs["store_type_counts"])
+        pie_stores = (
+            alt.Chart(store_types)
+            .mark_arc()
+            .encode(
+                theta="Count:Q", color=alt.Color("SubscriptionType:N", title="Subscription"),
+                tooltip=list(store_types.columns),
+            )
+            .properties(title=titled("Stores by Subscription Type", store_types))
+        )
+        st.altair_chart(pie_stores, use_container_width=True)
+        sp.output(store_types, chart=True)
+
+    with p2, span("role_pie") as sp:
+        roles = refined("role_counts", *jobs["role_counts"])
+        pie_roles = (
+            alt.Chart(roles)
+            .mark_arc()
+            .encode(theta="Count:Q", color=alt.Color("Role:N", title="Role"), tooltip=list(roles.columns))
+            .properties(title=titled("Users by Role", roles))
+        )
+        st.altair_chart(pie_roles, use_container_width=True)
+        sp.output(roles, chart=True)
+    if "Margin" in store_types.columns or "Margin" in roles.columns:
+        approx_note(state)
+
+
+@panel
+def user_locations(state: FilterState):
+    st.markdown("#### 🗺️ User Locations")
+    # Users are pre-binned into grid cells per snapshot; one dot per cell
+    # (sized by user count) unless only a few users match the filters
+    detail = st.selectbox("Map detail", ["Auto"] + list(LEVELS), index=0, key="map_detail")
+    level = None if detail == "Auto" else detail
+    jobs = chart_jobs(state, level)
+    with span("map") as sp:
+        map_df, map_level = memo("map", *jobs["map"])
+        st.map(map_df, size="size")
+        sp.rows_in = int(map_df["count"].sum())
+        sp.output(map_df, chart=True)
+    if map_level is None:
+        st.caption(f"{len(map_df):,} users")
+    else:
+        st.caption(f"{int(map_df['count'].sum()):,} users in {len(map_df):,} cells ({map_level} grid, {LEVELS[map_level]}°)")
+
+
+if tab1.open:
+    import approx
+
+    detail = st.session_state.get("map_detail", "Auto")
+    jobs = chart_jobs(state, None if detail == "Auto" else detail)
+    if st.session_state.approx_mode:
+        refine(state, {slot: job for slot, job in jobs.items() if slot in approx.PANELS})
+    prefetch(state, jobs)
+    with tab1:
+        trends(state)
+        leaderboards(state)
+        pies(state)
+        user_locations(state)
+
+# ======================================================
+# PAGED TABLES
+# ======================================================
+def table_page(name: str, state: FilterState, sorts: list, default_sort: str, ascending: bool = True) -> TablePage:
+    # Sort key/direction, page size and cursor live in session_state per
+    # table; the cursor goes back to the first page when filters or sort change
+    c1, c2, c3 = st.columns([3, 2, 2])
+    sort = c1.selectbox("Sort by", sorts, index=sorts.index(default_sort), key=f"{name}_sort")
+    order = c2.radio("Order", ["Ascending", "Descending"], index=0 if ascending else 1, horizontal=True, key=f"{name}_order")
+    limit = c3.selectbox("Rows per page", PAGE_SIZES, index=1, key=f"{name}_limit")
+    view = (state, sort, order, limit)
+    if st.session_state.get(f"{name}_view") != view:
+        st.session_state[f"{name}_view"] = view
+        st.session_state[f"{name}_offset"] = 0
+    return TablePage(sort, order == "Ascending", st.session_state[f"{name}_offset"], limit)
+
+
+def page_nav(name: str, page: TablePage, total: int) -> None:
+    def move(offset: int) -> None:
+        st.session_state[f"{name}_offset"] = offset
+
+    last = max(total - 1, 0) // page.limit * page.limit
+    c1, c2, c3 = st.columns([1, 4, 1])
+    c1.button("◀ Prev", key=f"{name}_prev", disabled=page.offset == 0,
+              on_click=move, args=(max(page.offset - page.limit, 0),))
+    c2.caption(
+        f"Rows {min(page.offset + 1, total):,}–{min(page.offset + page.limit, total):,} of {total:,} "
+        f"· page {page.offset // page.limit + 1:,} of {last // page.limit + 1:,}"
+    )
+    c3.button("Next ▶", key=f"{name}_next", disabled=page.offset >= last,
+              on_click=move, args=(page.offset + page.limit,))
+
+
+# ======================================================
+# ADMIN: CREATE SUBSCRIPTION TRANSACTION (st.dialog)
+# ======================================================
+def search_picker(label: str, index: "SearchIndex", key: str, multi: bool = True):
+    # Only the top matches of the typed query (plus what is already picked)
+    # are sent as options; labels come from the index, not per-option scans
+    query = st.text_input(f"Search {label}", key=f"{key}_query", placeholder="Name, email, phone or ID")
+    picked = st.session_state.get(key)
+    picked = list(picked or []) if multi else [picked] if picked is not None else []
+    options = list(dict.fromkeys(picked + index.search(query)))
+    if multi:
+        return st.multiselect(label, options=options, format_func=index.label, key=key)
+    return st.selectbox(label, options=options, format_func=index.label, key=key)
+
+
+def create_subs():
+    user_index, store_index = load_search_indexes()
+    st.write("Create a subscription transaction for users (single or bulk).")
+    # Select users (multi); pickers sit outside the form so they update per keystroke
+    selected_users = search_picker("Select User(s)", user_index, "create_users")
+    # Apply to all stores of selected users or pick stores
+    apply_scope = st.radio("Apply to", ["All stores of selected users", "Specific stores"], index=0)
+    specific_store_ids = []
+    if apply_scope == "Specific stores":
+        specific_store_ids = search_picker("Select Store(s)", store_index, "create_stores")
+
+    with st.form("create_subscription_form", clear_on_submit=True):
+        sub_type = st.selectbox("Subscription Type", ["Pro", "Basic", "Trial", "Non-Paid"], index=0)
+        duration_days = st.selectbox("Duration (days)", [30, 90, 180, 365], index=0)
+        # Suggested amount
+        suggested = 400_000 if sub_type == "Pro" else (200_000 if sub_type == "Basic" else 0)
+        amount = st.number_input("Amount (IDR)", min_value=0, value=suggested, step=50_000)
+
+        submitted = st.form_submit_button("Create Transaction")
+        if submitted:
+            # Resolve target stores
+            if apply_scope == "All stores of selected users":
+                # any store owned by or associated with the users, in one index lookup
+                target_store_ids = load_store_index().stores_of_users(selected_users).tolist()
+            else:
+                target_store_ids = sorted(set(specific_store_ids))
+            # One ledger transaction per store, written in a single commit
+            txn_ids = load_ledger().create(target_store_ids, sub_type, duration_days, amount)
+            changed = sync_ledger()
+            forget_panels()
+            st.success(
+                f"Created {sub_type} ({duration_days} days) subscription transaction "
+                f"for {len(target_store_ids)} store(s); amount: IDR {amount:,.0f}."
+            )
+            if target_store_ids:
+                st.write("Target Stores:", target_store_ids)
+                st.write("Transaction IDs:", txn_ids[:20] + (["…"] if len(txn_ids) > 20 else []))
+            st.caption(f"Subscription rollup updated for {len(changed):,} store(s).")
+
+# ======================================================
+# EXPORT
+# ======================================================
+# The whole filtered table, not only the page on screen: streamed chunk by
+# chunk into a file under EXPORT_DIR (export.py); the download button reads
+# that file when clicked
+def export_control(state: FilterState, today: datetime, tables: list, key: str):
+    import export
+
+    with st.popover("⬇️ Export"):
+        table = tables[0]
+        if len(tables) > 1:
+            table = st.selectbox("Table", tables, format_func=export.TABLES.get, key=f"{key}_export_table")
+        fmt = st.radio("Format", list(export.FORMATS), format_func=str.upper, horizontal=True, key=f"{key}_export_format")
+        if st.button(f"Export {export.TABLES[table]}", key=f"{key}_export"):
+            export.prune()
+            backend = load_backend()
+            with span(f"export_{table}") as sp, st.spinner(f"Exporting {export.TABLES[table]}…"):
+                result = export.write(backend.export_chunks(state, table, today), export.export_path(table, fmt), fmt)
+                sp.rows_out = result.rows
+            st.session_state[f"{key}_export_result"] = ((state, today, table, fmt), result)
+
+        done = st.session_state.get(f"{key}_export_result")
+        if done and done[0] == (state, today, table, fmt) and os.path.exists(done[1].path):
+            result = done[1]
+            name = os.path.basename(result.path)
+            st.download_button(
+                f"Download {name}", data=Path(result.path).read_bytes, file_name=name,
+                mime=export.FORMATS[fmt], key=f"{key}_download", on_click="ignore",
+            )
+            st.caption(
+                f"{result.rows:,} rows · {result.chunks:,} chunks · {result.bytes / 2**20:,.1f} MB · "
+                f"{result.seconds:,.2f} s · {result.rows_per_s:,.0f} rows/s"
+            )
+
+
+# ======================================================
+# ADMIN: DELETE SUBSCRIPTION TRANSACTION (st.dialog)
+# ======================================================
+
+def cancel_subscription():
+    st.write("Cancel a subscription transaction for a specific store.")
+    # Select a store
+    selected_store = search_picker("Select Store", load_search_indexes()[1], "cancel_store", multi=False)
+
+    with st.form("cancel_subscription_form", clear_on_submit=True):
+        # Enter transaction ID
+        transaction_id = st.text_input("Enter Transaction ID", placeholder="e.g., TXN-123456")
+
+        # Reason for cancellation
+        reason = st.text_area("Reason for cancellation", placeholder="Enter reason (optional)")
+
+        submitted = st.form_submit_button("Cancel Subscription")
+        if submitted:
+            if selected_store is None:
+                st.error("Search for and select a store first.")
+            elif not transaction_id:
+                st.error("Transaction ID is required to cancel a subscription.")
+            else:
+                # Idempotent: cancelling the same transaction again changes nothing
+                status = load_ledger().cancel(transaction_id.strip(), selected_store, reason)
+                if status == "not found":
+                    st.error(f"No transaction {transaction_id} found for store {selected_store}.")
+                elif status == "already cancelled":
+                    st.warning(f"Transaction {transaction_id} was already cancelled.")
+                else:
+                    sync_ledger()
+                    forget_panels()
+                    st.success(
+                        f"Cancelled subscription transaction {transaction_id} "
+                        f"for store {selected_store}."
+                    )
+                    if reason:
+                        st.info(f"Reason provided: {reason}")
+
+
+# ======================================================
+# DATA TABLES (Tabs)
+# ======================================================
+@panel
+def admin_actions():
+    co1, co2, co3, co4, co5, co6 = st.columns(6,  gap="small")
+    with co1:
+        open_dialog = st.button("➕ Create Subscription Transaction")
+        if open_dialog:
+            @st.dialog("Create Subscription Transaction")
+            def show_dialog():
+                create_subs()
+            show_dialog()
+    with co2:
+        open_dialog = st.button("⚠️ Cancel Subscription Transaction")
+        if open_dialog:
+            @st.dialog("Cancel Subscription Transaction")
+            def show_dialog():
+                cancel_subscription()
+            show_dialog()
+
+
+# ---------- Users Tab ----------
+@panel
+def users_tab(state: FilterState, today: datetime):
+    import panels
+
+    backend = load_backend()
+    st.markdown("**Users**")
+    export_control(state, today, ["users"], "users")
+    # Only the visible page is computed and sent to the browser
+    page = table_page("users", state, panels.USER_SORTS, "UserID")
+    with span("users_table") as sp:
+        users_page, users_total = memo("users_page", (state, page), lambda: backend.users_page(state, page))
+        st.dataframe(users_page, use_container_width=True)
+        sp.rows_in = users_total
+        sp.output(users_page)
+    page_nav("users", page, users_total)
+
+
+# ---------- Stores Tab ----------
+@panel
+def stores_tab(state: FilterState, today: datetime):
+    import panels
+
+    backend = load_backend()
+    st.markdown("**Stores**")
+    export_control(state, today, ["stores"], "stores")
+
+    # Owner name joined, sorted by soonest expiry by default; one page at a time
+    page = table_page("stores", state, panels.STORE_SORTS, "DaysToExpiry")
+    with span("stores_table") as sp:
+        stores_display, stores_total = memo(
+            "stores_page", (state, page, today), lambda: backend.stores_page(state, page, today)
+        )
+        cols = panels.STORE_COLS
+
+        # Selecting a row opens its details; the widget key follows the view,
+        # so a selection never carries over to another page's row
+        event = st.dataframe(
+            stores_display[cols],
+            use_container_width=True,
+            hide_index=True,
+            on_select="rerun",
+            selection_mode="single-row",
+            key=f"stores_select_{hash((state, page))}",
+        )
+        sp.rows_in = stores_total
+        sp.output(stores_display[cols])
+    st.caption("Select a row to view store details.")
+    page_nav("stores", page, stores_total)
+
+    rows = event.selection.rows
+    selected = int(stores_display["StoreID"].iloc[rows[0]]) if rows else None
+    if selected != st.session_state.get("selected_store"):
+        # only when the selection changes, so closing the dialog keeps it closed
+        st.session_state.selected_store = selected
+        if selected is not None:
+            row = stores_display.iloc[rows[0]]
+
+            @st.dialog("Store Details")
+            def show_dialog():
+                st.write("### Store Information")
+                for col in cols:
+                    st.write(f"**{col}:** {row[col]}")
+            show_dialog()
+
+
+# ---------- Expiring Tab ----------
+@panel
+def expiring_tab(state: FilterState, today: datetime):
+    import altair as alt
+    import panels
+
+    backend = load_backend()
+    st.markdown("**Expiring / Expired Subscriptions**")
+    # Expiry window: only this tab depends on it, so changing it reruns this tab alone
+    c1, _ = st.columns(2)
+    expiry_window = c1.selectbox("Expiry Window", list(panels.EXPIRY_WINDOWS) + ["Custom"], index=0)
+    if expiry_window == "Custom":
+        # Any DaysToExpiry range, e.g. expiring between day 31 and 60
+        expiry_window = c1.slider("Days to expiry", min_value=-365, max_value=365, value=(31, 60))
+    state = state.with_expiry_window(expiry_window)
+    export_control(state, today, ["expiring", "owners"], "expiring")
+
+    # The trend and affected owners read the whole window: start them on the
+    # pool while the table's page is read from the expiry index
+    detail_job = ((state, today), lambda: (
+        fit_budget(backend.expiring_trend(state, today), "EndDateOnly", "Count", "SubscriptionType"),
+        backend.affected_owners(state, today),
+    ))
+    prefetch(state, {"expiring_detail": detail_job})
+
+    # Table: expiring stores in the expiry window, soonest first by default
+    page = table_page("expiring", state, panels.EXPIRING_SORTS, "DaysToExpiry")
+    with span("expiring_table") as sp:
+        exp_df, exp_total = memo(
+            "expiring_page", (state, page, today), lambda: backend.expiring_page(state, page, today)
+        )
+        cols = panels.EXPIRING_COLS
+
+        # Add "View Details" link column
+        exp_df = exp_df.assign(**{"View Details": exp_df["StoreID"].apply(lambda x: f"#store-{x}")})
+
+        st.data_editor(
+            exp_df[cols + ["View Details"]],
+            use_container_width=True,
+            disabled=True,  # 🔒 make table read-only
+            column_config={
+                "View Details": st.column_config.LinkColumn(
+                    "View Details",
+                    display_text="View",
+                    help="Click to view store details",
+                )
+            },
+            hide_index=True,
+        )
+        sp.rows_in = exp_total
+        sp.output(exp_df[cols + ["View Details"]])
+    page_nav("expiring", page, exp_total)
+
+    # Trendline: counts of expiring stores per subscription type (by CurrentEnd date)
+    if exp_total:
+        # Daily series: downsampled (LTTB) to the chart point budget when long
+        with span("expiring_trend") as sp:
+            (trend_exp, downsampled), owners_df = memo("expiring_detail", *detail_job)
+            sp.output(trend_exp, chart=True)
+        chart_exp = (
+            alt.Chart(trend_exp)
+            .mark_line(point=True)
+            .encode(
+                x=alt.X("EndDateOnly:T", title="End Date"),
+                y=alt.Y("Count:Q", title="Stores"),
+                color=alt.Color("SubscriptionType:N", title="Subscription"),
+                tooltip=["EndDateOnly:T", "SubscriptionType:N", "Count:Q"]
+            )
+            .properties(title=f"Expiring Stores Trend ({panels.expiry_label(state.expiry_window)})")
+        )
+        st.altair_chart(chart_exp, use_container_width=True)
+        if downsampled:
+            st.caption(f"Downsampled to {len(trend_exp):,} points ({payload_bytes(trend_exp) / 1024:,.0f} KB)")
+
+    # Owners (users) affected by expiring stores
+    if exp_total:
+        st.markdown("**Affected Owners**")
+        with span("owners") as sp:
+            owners_df = memo("expiring_detail", *detail_job)[1]
+            st.data_editor(
+                owners_df,
+                use_container_width=True,
+                disabled=True,  # make owners table also non-editable
+                hide_index=True,
+            )
+            sp.output(owners_df)
+    else:
+        st.info("No owners in this expiry window.")
+
+
+# ---------- Subscription Tab ----------
+@panel
+def subscription_tab():
+    # Newest first, one page at a time; cursors of the pages before
+    # the current one are kept so Prev can go back
+    ledger = load_ledger()
+    cursors = st.session_state.setdefault("ledger_cursors", [None])
+    st.markdown("**Subscription Logs**")
+    with span("ledger_table") as sp:
+        logs, next_cursor = ledger.page(before=cursors[-1], limit=50)
+        st.data_editor(
+            logs,
+            use_container_width=True,
+            disabled=True,  # make table non-editable
+            hide_index=True
+        )
+        sp.output(logs)
+
+    def older(cursor: int) -> None:
+        st.session_state.ledger_cursors.append(cursor)
+
+    def newer() -> None:
+        st.session_state.ledger_cursors.pop()
+
+    n1, n2, n3 = st.columns([1, 4, 1])
+    n1.button("◀ Newer", key="ledger_newer", disabled=len(cursors) == 1, on_click=newer)
+    n2.caption(f"{ledger.count():,} transactions · page {len(cursors):,}")
+    n3.button("Older ▶", key="ledger_older", disabled=next_cursor is None, on_click=older, args=(next_cursor,))
+
+
+if tab2.open:
+    with tab2:
+        admin_actions()
+        # Only the open tab is computed; switching tabs reruns the page, and
+        # tabs seen before come back from the session memo
+        tab_users, tab_stores, tab_expiring, tab_subscription = st.tabs(
+            ["Users", "Stores", "Expiring", "Subscription"], key="detail_tab", on_change="rerun"
+        )
+        if tab_users.open:
+            with tab_users:
+                users_tab(state, today)
+        if tab_stores.open:
+            with tab_stores:
+                stores_tab(state, today)
+        if tab_expiring.open:
+            with tab_expiring:
+                expiring_tab(state, today)
+        if tab_subscription.open:
+            with tab_subscription:
+                subscription_tab()
+
+
+# ======================================================
+# COHORTS
+# ======================================================
+# Monthly signup cohorts of users (still active k months in) and stores (on a
+# Trial/Basic/Pro plan k months in), and plan transitions between renewals or
+# over each store's lifetime; all follow the global filters (cohorts.py)
+TRANSITION_LABELS = {"renewal": "Between renewals", "lifetime": "First → latest plan"}
+
+
+def cohort_jobs(state: FilterState, today: datetime, across: str = "renewal") -> dict:
+    backend = load_backend()
+    return {
+        "user_retention": ((state, today), lambda: backend.user_retention(state, today)),
+        "store_retention": ((state, today), lambda: backend.store_retention(state, today)),
+        "tier_transitions": ((state, across), lambda: backend.tier_transitions(state, across)),
+    }
+
+
+def retention_chart(df, title: str):
+    import altair as alt
+
+    return (
+        alt.Chart(df)
+        .mark_rect()
+        .encode(
+            x=alt.X("Month:O", title="Months since signup"),
+            y=alt.Y("yearmonth(Cohort):O", title="Cohort"),
+            color=alt.Color("Retention:Q", title="Retained", scale=alt.Scale(domain=[0, 1]), legend=alt.Legend(format="%")),
+            tooltip=[
+                alt.Tooltip("yearmonth(Cohort):O", title="Cohort"), "Month:O", "Size:Q", "Retained:Q",
+                alt.Tooltip("Retention:Q", format=".1%"),
+            ],
+        )
+        .properties(title=title)
+    )
+
+
+@panel
+def cohorts_tab(state: FilterState, today: datetime):
+    import altair as alt
+    import cohorts
+
+    across = st.segmented_control(
+        "Plan transitions", list(TRANSITION_LABELS), format_func=TRANSITION_LABELS.get,
+        default="renewal", key="cohort_transitions",
+    ) or "renewal"
+    jobs = cohort_jobs(state, today, across)
+    prefetch(state, jobs)
+
+    r1, r2 = st.columns(2)
+    with r1, span("user_retention") as sp:
+        user_retention = memo("user_retention", *jobs["user_retention"])
+        st.altair_chart(retention_chart(user_retention, "User Retention by Signup Month"), use_container_width=True)
+        sp.output(user_retention, chart=True)
+    with r2, span("store_retention") as sp:
+        store_retention = memo("store_retention", *jobs["store_retention"])
+        st.altair_chart(retention_chart(store_retention, "Subscribed Stores by Creation Month"), use_container_width=True)
+        sp.output(store_retention, chart=True)
+
+    with span("tier_transitions") as sp:
+        transitions = memo("tier_transitions", *jobs["tier_transitions"])
+        summary = cohorts.transition_summary(transitions)
+        t1, t2, t3, t4 = st.columns(4)
+        t1.metric("Upgrades", f"{summary['upgrades']:,}", border=True)
+        t2.metric("Downgrades", f"{summary['downgrades']:,}", border=True)
+        t3.metric("Churned to Non-Paid", f"{summary['churned']:,}", border=True)
+        t4.metric("Unchanged", f"{summary['unchanged']:,}", border=True)
+        base = alt.Chart(transitions).encode(
+            x=alt.X("To:O", sort=cohorts.TIERS, title="To"),
+            y=alt.Y("From:O", sort=cohorts.TIERS, title="From"),
+        )
+        matrix = base.mark_rect().encode(
+            color=alt.Color("Share:Q", title="Share of From", legend=alt.Legend(format="%")),
+            tooltip=["From:O", "To:O", "Count:Q", alt.Tooltip("Share:Q", format=".1%")],
+        ) + base.mark_text().encode(text=alt.Text("Count:Q", format=","))
+        st.altair_chart(
+            matrix.properties(title=f"Plan Transitions · {TRANSITION_LABELS[across]}"), use_container_width=True
+        )
+        sp.output(transitions, chart=True)
+
+
+if tab3.open:
+    with tab3:
+        cohorts_tab(state, today)
+
+
+# Refinements of this view still running: the watcher reruns the page as they land
+if st.session_state.approx_mode:
+    import approx
+
+    running = [f for f in st.session_state.get("memo_approx", (None, []))[1] if pending(f)]
+    for slot in approx.PANELS:
+        cached = st.session_state.get(f"memo_{slot}")
+        if cached and cached[0] == state and pending(cached[1]):
+            running.append(cached[1])
+    if running:
+        refine_watch(running)
+
+
+# ======================================================
+# PERFORMANCE (admin)
+# ======================================================
+# Spans of this rerun; every rerun is also exported to PERF_DIR as JSON lines
+# and Prometheus text whether or not the panel is open. A fragment rerunning
+# alone exports its own spans (scope = its name) and leaves this panel as is.
+from perf import PERF_DIR
+
+perf = st.session_state.perf_run
+del dataset  # the page's fragments keep this module alive: don't pin the version
+if profiler:
+    profiler.stop()
+perf.export()
+
+if st.toggle("⏱ Performance panel", key="perf_panel"):
+    spans = perf.frame()
+    st.caption(
+        f"Rerun {perf.id} · {BACKEND} backend · {spans['ms'].sum():,.1f} ms in spans · "
+        f"{spans['payload_bytes'].sum() / 1024:,.0f} KB sent · exported to {PERF_DIR}/"
+    )
+    st.dataframe(spans, use_container_width=True, hide_index=True)
+    cache = load_result_cache().stats()
+    st.caption(
+        f"Result cache · {cache['entries']:,} entries · {cache['bytes'] / 2**20:,.1f} of "
+        f"{cache['max_bytes'] / 2**20:,.0f} MB · {cache['hits']:,} hits / {cache['misses']:,} misses "
+        f"({cache['hit_rate']:.0%}) · {cache['evictions']:,} evictions · {cache['invalidations']:,} invalidations"
+    )
+    st.button(
+        "Profile next rerun", key="perf_profile",
+        on_click=lambda: st.session_state.update(profile_next=True),
+        help="Sample the Python stack every 5 ms during one rerun",
+    )
+    if profiler:
+        st.markdown(f"**Sampling profile** · {profiler.samples:,} samples · `{profiler.write()}`")
+        st.dataframe(profiler.top(20), use_container_width=True, hide_index=True)
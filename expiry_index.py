@@ -0,0 +1,143 @@
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+# -------------------------
+# Store expiry index
+# -------------------------
+# Stores kept ordered by (CurrentEnd, StoreID). DaysToExpiry is monotone in
+# CurrentEnd, so any window of whole days to expiry ("7 days", "Expired",
+# day 31–60, ...) is one contiguous slice found by binary search, and a page
+# sorted by DaysToExpiry only needs the rows of the days it touches. Stores
+# without a CurrentEnd sort last and only appear in the unbounded window.
+US_PER_DAY = 86_400_000_000
+_MISSING = np.iinfo(np.int64).max
+
+
+def _us(ts) -> int:
+    return int(pd.Timestamp(ts).value // 1000)
+
+
+def _end_us(ends: pd.Series) -> np.ndarray:
+    values = ends.to_numpy("datetime64[us]")
+    return np.where(np.isnat(values), _MISSING, values.astype(np.int64))
+
+
+class ExpiryIndex:
+    """StoreIDs presorted by CurrentEnd for range lookups by days to expiry."""
+
+    def __init__(self, df_stores: pd.DataFrame):
+        ids = df_stores["StoreID"].to_numpy(dtype=np.int64)
+        ends = _end_us(df_stores["CurrentEnd"])
+        order = np.lexsort((ids, ends))
+        self.ends, self.ids = ends[order], ids[order]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ---------- Lookups ----------
+    def range(self, today, lo: Optional[int], hi: Optional[int]) -> slice:
+        """Positions of stores with lo <= DaysToExpiry <= hi (None = unbounded)."""
+        if lo is None and hi is None:
+            return slice(0, len(self.ids))
+        t = _us(today)
+        # floor((end - t) / day) >= lo  ⇔  end >= t + lo days; <= hi  ⇔  end < t + (hi + 1) days
+        start = 0 if lo is None else np.searchsorted(self.ends, t + lo * US_PER_DAY)
+        stop = np.searchsorted(self.ends, _MISSING if hi is None else t + (hi + 1) * US_PER_DAY)
+        return slice(int(start), int(max(start, stop)))
+
+    def days(self, positions, today) -> np.ndarray:
+        """DaysToExpiry (float, NaN when unknown) of the stores at positions."""
+        ends = self.ends[positions]
+        days = (ends - _us(today)) // US_PER_DAY
+        return np.where(ends == _MISSING, np.nan, days)
+
+    def page(
+        self,
+        today,
+        lo: Optional[int],
+        hi: Optional[int],
+        offset: int = 0,
+        limit: Optional[int] = None,
+        ascending: bool = True,
+        keep: Optional[np.ndarray] = None,
+    ) -> tuple[np.ndarray, int]:
+        """(StoreIDs ordered by DaysToExpiry then StoreID, total in window).
+
+        keep is an optional StoreID-indexed boolean mask of the filtered stores.
+        Only the window slice and the days around the page are touched.
+        """
+        sl = self.range(today, lo, hi)
+        ids, pos = self.ids[sl], np.arange(sl.start, sl.stop)
+        if keep is not None:
+            sel = keep[ids]
+            ids, pos = ids[sel], pos[sel]
+        total = len(ids)
+        days = self.days(pos, today)
+        if not ascending:
+            # descending days, missing still last, ties still by StoreID
+            valid = int(np.count_nonzero(~np.isnan(days)))
+            days = np.r_[-days[:valid][::-1], days[valid:]]
+            ids = np.r_[ids[:valid][::-1], ids[valid:]]
+        days = np.where(np.isnan(days), np.inf, days)
+        stop = total if limit is None else min(offset + limit, total)
+        if offset >= stop:
+            return ids[:0], total
+        # the page spans whole days [a, b); reorder only those rows by (days, StoreID)
+        a = int(np.searchsorted(days, days[offset], "left"))
+        b = int(np.searchsorted(days, days[stop - 1], "right"))
+        order = np.lexsort((ids[a:b], days[a:b]))
+        return ids[a:b][order][offset - a:stop - a], total
+
+    def chunks(
+        self, today, lo: Optional[int], hi: Optional[int], size: int, keep: Optional[np.ndarray] = None
+    ) -> Iterator[np.ndarray]:
+        """StoreIDs of a window in page order (DaysToExpiry, StoreID), about size at a time.
+
+        Blocks end on a day boundary, so reordering by StoreID stays inside
+        one block and only one block of the window is in memory at a time.
+        """
+        sl = self.range(today, lo, hi)
+        t, start = _us(today), sl.start
+        while start < sl.stop:
+            stop = min(start + size, sl.stop)
+            if self.ends[stop - 1] != _MISSING:
+                # finish the day of the last row (missing ends are already in StoreID order)
+                day = (self.ends[stop - 1] - t) // US_PER_DAY
+                stop = max(stop, min(int(np.searchsorted(self.ends, t + (day + 1) * US_PER_DAY)), sl.stop))
+            ids, pos = self.ids[start:stop], np.arange(start, stop)
+            if keep is not None:
+                sel = keep[ids]
+                ids, pos = ids[sel], pos[sel]
+            days = self.days(pos, today)
+            yield ids[np.lexsort((ids, np.where(np.isnan(days), np.inf, days)))]
+            start = stop
+
+    # ---------- Maintenance ----------
+    def update(self, store_ids, ends) -> None:
+        """Set CurrentEnd of store_ids (new stores are added), keeping the order."""
+        store_ids = np.asarray(store_ids, dtype=np.int64)
+        new_ends = _end_us(pd.Series(pd.to_datetime(ends)))
+        keep = ~np.isin(self.ids, store_ids)
+        ids, old_ends = self.ids[keep], self.ends[keep]
+        order = np.lexsort((store_ids, new_ends))
+        store_ids, new_ends = store_ids[order], new_ends[order]
+        # merge the sorted batch into the sorted remainder
+        at = _merge_positions(old_ends, ids, new_ends, store_ids)
+        self.ids = np.insert(ids, at, store_ids)
+        self.ends = np.insert(old_ends, at, new_ends)
+
+    def remove(self, store_ids) -> None:
+        keep = ~np.isin(self.ids, np.asarray(store_ids, dtype=np.int64))
+        self.ids, self.ends = self.ids[keep], self.ends[keep]
+
+
+def _merge_positions(ends: np.ndarray, ids: np.ndarray, new_ends: np.ndarray, new_ids: np.ndarray) -> np.ndarray:
+    # Insertion points of (new_ends, new_ids) into arrays sorted by (ends, ids)
+    lo = np.searchsorted(ends, new_ends, "left")
+    hi = np.searchsorted(ends, new_ends, "right")
+    at = lo.copy()
+    for k in np.flatnonzero(hi > lo):
+        at[k] = lo[k] + np.searchsorted(ids[lo[k]:hi[k]], new_ids[k])
+    return at
@@ -0,0 +1,112 @@
+import os
+import time
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+# -------------------------
+# Streaming table export
+# -------------------------
+# Backends yield an exported table (export_chunks) CHUNK_ROWS rows at a time
+# in the table's on-screen order. Each chunk is converted to Arrow and appended
+# to the file (a CSV block, or one Parquet row group), then dropped. Memory
+# therefore follows the chunk size, not the result. Files are written under a
+# temporary name and renamed when complete, so a download never sees a
+# partial export. Exports older than EXPORT_TTL are deleted on the next export.
+CHUNK_ROWS = int(os.environ.get("POSSAX_EXPORT_ROWS", 50_000))
+EXPORT_DIR = os.environ.get("POSSAX_EXPORT_DIR", "exports")
+EXPORT_TTL = 3600  # seconds
+TABLES = {"users": "Users", "stores": "Stores", "expiring": "Expiring", "owners": "Affected Owners"}
+FORMATS = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+# Integer columns that can be missing in some chunks only: nullable, so every
+# chunk has the same type
+NULLABLE_INT = ["DaysToExpiry", "ReoccuringSubs", "TotalMoneySpent"]
+
+
+@dataclass
+class ExportResult:
+    path: str
+    rows: int
+    chunks: int
+    bytes: int
+    seconds: float
+
+    @property
+    def rows_per_s(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def _arrow(chunk: pd.DataFrame, schema: Optional[pa.Schema]) -> pa.Table:
+    chunk = chunk.astype({c: "Int64" for c in NULLABLE_INT if c in chunk.columns})
+    # without pandas metadata: the file is for any Parquet/CSV reader
+    table = pa.Table.from_pandas(chunk, preserve_index=False).replace_schema_metadata(None)
+    return table if schema is None else table.cast(schema)
+
+
+def _csv_table(table: pa.Table) -> pa.Table:
+    # CSV has no list type: store-id lists become "id;id;..."
+    for i, field in enumerate(table.schema):
+        if pa.types.is_list(field.type) or pa.types.is_large_list(field.type):
+            column = table.column(i)
+            strings = pc.cast(column, pa.list_(pa.string()))
+            table = table.set_column(i, field.name, pc.binary_join(strings, ";"))
+    return table
+
+
+def write(chunks: Iterable[pd.DataFrame], path: str, fmt: str) -> ExportResult:
+    """Stream chunks into a CSV or Parquet file at path (replaced atomically)."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {list(FORMATS)}")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    start = time.perf_counter()
+    rows = count = 0
+    schema = writer = None
+    try:
+        for chunk in chunks:
+            table = _arrow(chunk, schema)
+            if writer is None:
+                schema = table.schema
+                if fmt == "parquet":
+                    writer = pq.ParquetWriter(tmp, schema)
+                else:
+                    writer = pa_csv.CSVWriter(tmp, _csv_table(table).schema)
+            writer.write_table(table if fmt == "parquet" else _csv_table(table))
+            rows += table.num_rows
+            count += 1
+        if writer is None:  # no chunks at all
+            open(tmp, "wb").close()
+        else:
+            writer.close()
+        os.replace(tmp, path)
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return ExportResult(path, rows, count, os.path.getsize(path), time.perf_counter() - start)
+
+
+def export_path(table: str, fmt: str, root: str = EXPORT_DIR) -> str:
+    """A new file name under root for an export of table."""
+    return os.path.join(root, f"{table}-{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10**6:06d}.{fmt}")
+
+
+def prune(root: str = EXPORT_DIR, ttl: float = EXPORT_TTL) -> None:
+    """Delete exports older than ttl seconds."""
+    if not os.path.isdir(root):
+        return
+    cutoff = time.time() - ttl
+    for name in os.listdir(root):
+        file = os.path.join(root, name)
+        try:
+            if os.path.getmtime(file) < cutoff:
+                os.remove(file)
+        except OSError:
+            pass
@@ -0,0 +1,138 @@
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from filters import FilterState
+
+# -------------------------
+# Filter index
+# -------------------------
+# Users and stores are kept in CreatedAt order, so a date range is one
+# contiguous slice found by binary search. Over that order every value of a
+# filter dimension (City, Role, SubscriptionType) has a packed bitmap: a
+# multiselect is the OR of its values' bitmaps, dimensions are AND-ed, and
+# only the bytes of the date slice are touched. A dimension with every value
+# selected is skipped, so the cost follows the selection, not the table.
+# Subscriptions of the selected stores are read from a StoreID → row-range
+# offset index instead of an isin over the whole table.
+USER_DIMS = {"cities": "City", "roles": "Role"}
+STORE_DIMS = {"sub_types": "SubscriptionType"}
+_MISSING = np.iinfo(np.int64).max
+
+
+def _codes(column: pd.Series) -> tuple[np.ndarray, pd.Index]:
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy(), column.cat.categories
+    codes, categories = pd.factorize(column)
+    return codes, pd.Index(categories)
+
+
+class TableIndex:
+    """CreatedAt order, and per-value bitmaps over it, of one table."""
+
+    def __init__(self, df: pd.DataFrame, dims: dict[str, str], date_col: str = "CreatedAt"):
+        dates = df[date_col].to_numpy("datetime64[us]")
+        keys = np.where(np.isnat(dates), _MISSING, dates.astype(np.int64))
+        self.order = np.argsort(keys, kind="stable")
+        self.dates = keys[self.order]
+        self.rows = len(df)
+        self.dims = dims
+        self.bitmaps: dict[str, dict[str, np.ndarray]] = {}
+        self.complete: dict[str, bool] = {}  # no missing values: selecting all values is no filter
+        for column in dims.values():
+            codes, categories = _codes(df[column])
+            codes = codes[self.order]
+            present = np.bincount(codes[codes >= 0], minlength=len(categories))
+            self.bitmaps[column] = {
+                value: np.packbits(codes == code) for code, value in enumerate(categories) if present[code]
+            }
+            self.complete[column] = bool((codes >= 0).all())
+
+    def update(self, rows: np.ndarray, df: pd.DataFrame) -> None:
+        """Re-mark rows (table positions) with their dimension values in df, the edited table."""
+        at = np.empty(self.rows, dtype=np.int64)
+        at[self.order] = np.arange(self.rows)
+        at = at[np.asarray(rows, dtype=np.int64)]
+        byte, mask = at >> 3, (0x80 >> (at & 7)).astype(np.uint8)  # packbits is big-endian
+        for column in self.dims.values():
+            bitmaps = self.bitmaps[column]
+            for bitmap in bitmaps.values():
+                np.bitwise_and.at(bitmap, byte, ~mask)
+            values = df[column].to_numpy()[rows]
+            known = pd.notna(values)
+            for value in pd.unique(values[known]):
+                bitmap = bitmaps.setdefault(value, np.zeros((self.rows + 7) // 8, dtype=np.uint8))
+                hit = values == value
+                np.bitwise_or.at(bitmap, byte[hit], mask[hit])
+            self.complete[column] = self.complete[column] and bool(known.all())
+
+    def date_slice(self, date_range: Optional[tuple]) -> tuple[int, int]:
+        if date_range is None:
+            return 0, self.rows
+        lo, hi = (None if d is None else np.datetime64(pd.Timestamp(d), "us").astype(np.int64) for d in date_range)
+        start = 0 if lo is None else int(np.searchsorted(self.dates, lo, "left"))
+        stop = int(np.searchsorted(self.dates, _MISSING - 1 if hi is None else hi, "right"))
+        return start, max(start, stop)
+
+    def positions(self, date_range: Optional[tuple], selections: dict[str, tuple]) -> np.ndarray:
+        """Row positions (ascending) in the date range whose dimension values are all selected."""
+        start, stop = self.date_slice(date_range)
+        b0, b1 = start // 8, (stop + 7) // 8
+        acc = None
+        for column, selected in selections.items():
+            bitmaps = self.bitmaps[column]
+            if not selected or (self.complete[column] and set(bitmaps) <= set(selected)):
+                continue
+            picked = [bitmaps[v][b0:b1] for v in selected if v in bitmaps]
+            dim = np.bitwise_or.reduce(picked) if picked else np.zeros(b1 - b0, dtype=np.uint8)
+            acc = dim if acc is None else acc & dim
+        if acc is None:
+            hits = self.order[start:stop]
+        else:
+            bits = np.unpackbits(acc, count=(b1 - b0) * 8)[start - b0 * 8:stop - b0 * 8]
+            hits = self.order[start + np.flatnonzero(bits)]
+        return np.sort(hits)
+
+
+class FilterIndex:
+    """Filtered (users, stores, subscriptions) of a FilterState without full-column scans."""
+
+    def __init__(self, df_users: pd.DataFrame, df_stores: pd.DataFrame, df_subscriptions: pd.DataFrame):
+        self.df_users, self.df_stores, self.df_subscriptions = df_users, df_stores, df_subscriptions
+        self.users = TableIndex(df_users, USER_DIMS)
+        self.stores = TableIndex(df_stores, STORE_DIMS)
+        # Subscription rows grouped by StoreID: rows of store s are sub_order[starts[s]:ends[s]]
+        sub_stores = df_subscriptions["StoreID"].to_numpy(dtype=np.int64)
+        self.sub_order = np.argsort(sub_stores, kind="stable")
+        bound = int(max(sub_stores.max(initial=0), df_stores["StoreID"].max()) if len(df_stores) else 0) + 2
+        self.sub_starts = np.searchsorted(sub_stores[self.sub_order], np.arange(bound))
+
+    def update_stores(self, df_stores: pd.DataFrame, rows: np.ndarray) -> None:
+        """Adopt df_stores, a copy of the stores frame with rows (positions) edited."""
+        self.df_stores = df_stores
+        self.stores.update(rows, df_stores)
+
+    def subscription_rows(self, store_ids: np.ndarray) -> np.ndarray:
+        """Positions (ascending) of the subscriptions of store_ids."""
+        store_ids = np.asarray(store_ids, dtype=np.int64)
+        starts = self.sub_starts[store_ids]
+        lengths = self.sub_starts[store_ids + 1] - starts
+        # the ranges starts[i] .. starts[i] + lengths[i], concatenated without a Python loop
+        before = np.cumsum(lengths) - lengths
+        ranks = np.repeat(starts - before, lengths) + np.arange(int(lengths.sum()))
+        return np.sort(self.sub_order[ranks])
+
+    @staticmethod
+    def _take(df: pd.DataFrame, rows: np.ndarray) -> pd.DataFrame:
+        return df if len(rows) == len(df) else df.iloc[rows].reset_index(drop=True)
+
+    def filter(self, state: FilterState) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        users = self.users.positions(state.date_range, {c: getattr(state, k) for k, c in USER_DIMS.items()})
+        stores = self.stores.positions(state.date_range, {c: getattr(state, k) for k, c in STORE_DIMS.items()})
+        stores_f = self._take(self.df_stores, stores)
+        if len(stores) == len(self.df_stores):
+            subs_f = self.df_subscriptions
+        else:
+            subs_f = self._take(self.df_subscriptions, self.subscription_rows(stores_f["StoreID"].to_numpy()))
+        return self._take(self.df_users, users), stores_f, subs_f
@@ -0,0 +1,76 @@
+from dataclasses import dataclass, replace
+from typing import Iterable, Optional, Union
+
+import pandas as pd
+
+
+# -------------------------
+# Global filter state
+# -------------------------
+def _window(expiry_window):
+    return tuple(sorted(map(int, expiry_window))) if isinstance(expiry_window, (tuple, list)) else expiry_window
+
+
+@dataclass(frozen=True)
+class FilterState:
+    """Normalized global filters; empty tuples mean "no filter" (as in the dashboard)."""
+
+    date_range: Optional[tuple[pd.Timestamp, pd.Timestamp]] = None
+    cities: tuple[str, ...] = ()
+    sub_types: tuple[str, ...] = ()
+    roles: tuple[str, ...] = ()
+    # a panels.EXPIRY_WINDOWS name or a custom (lo, hi) DaysToExpiry range
+    expiry_window: Union[str, tuple[int, int]] = "All"
+
+    @classmethod
+    def from_widgets(
+        cls,
+        date_range: Iterable = (),
+        cities: Iterable[str] = (),
+        sub_types: Iterable[str] = (),
+        roles: Iterable[str] = (),
+        expiry_window: Union[str, tuple[int, int]] = "All",
+    ) -> "FilterState":
+        date_range = list(date_range or ())
+        return cls(
+            date_range=tuple(pd.to_datetime(d) for d in date_range) if len(date_range) == 2 else None,
+            cities=tuple(sorted(set(cities or ()))),
+            sub_types=tuple(sorted(set(sub_types or ()))),
+            roles=tuple(sorted(set(roles or ()))),
+            expiry_window=_window(expiry_window),
+        )
+
+    def with_expiry_window(self, expiry_window: Union[str, tuple[int, int]]) -> "FilterState":
+        return replace(self, expiry_window=_window(expiry_window))
+
+    # Date range applies to users and stores, City and Role to users only,
+    # SubscriptionType to stores only
+    def users_where(self) -> dict:
+        return {
+            "CreatedAt": self.date_range,
+            "Role": list(self.roles) or None,
+            "City": list(self.cities) or None,
+        }
+
+    def stores_where(self) -> dict:
+        return {
+            "CreatedAt": self.date_range,
+            "SubscriptionType": list(self.sub_types) or None,
+        }
+
+
+def apply_where(df: pd.DataFrame, where: dict) -> pd.DataFrame:
+    """Rows of df matching where: column → (lo, hi) inclusive range or → list of values; None values are ignored."""
+    mask = pd.Series(True, index=df.index)
+    for column, value in where.items():
+        if value is None:
+            continue
+        if isinstance(value, tuple):
+            lo, hi = value
+            if lo is not None:
+                mask &= df[column] >= lo
+            if hi is not None:
+                mask &= df[column] <= hi
+        else:
+            mask &= df[column].isin(value)
+    return df[mask]
@@ -0,0 +1,85 @@
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# -------------------------
+# Level-of-detail binning for the User Locations map
+# -------------------------
+# Every user is assigned, once per snapshot, to a square lat/lon grid cell at
+# each level of LEVELS (coarse → fine). Cells are numbered globally from
+# (-90, -180), so the SQL backend can store the same numbers. A filtered map
+# is then a bincount of the precomputed cell ids of the filtered users: the
+# finest level with at most MAX_CELLS non-empty cells is drawn, one dot per
+# cell at the centroid of its users and sized by count. When only a few
+# users match, the raw points are drawn instead.
+LEVELS = {"Country": 1.0, "Region": 0.25, "City": 0.05}  # cell size in degrees
+MAX_CELLS = 2_000
+RAW_POINTS = 2_000
+METERS_PER_DEGREE = 111_000
+RAW_RADIUS = 300  # meters
+
+
+def cell_ids(lat: np.ndarray, lon: np.ndarray, size: float) -> np.ndarray:
+    """Global grid cell number of each point for a cell size in degrees."""
+    cols = int(np.ceil(360 / size))
+    row = np.floor((np.asarray(lat, dtype=np.float64) + 90) / size).astype(np.int64)
+    col = np.floor((np.asarray(lon, dtype=np.float64) + 180) / size).astype(np.int64)
+    return row * cols + np.minimum(col, cols - 1)
+
+
+def choose_level(cells_per_level: dict) -> str:
+    """Finest level whose number of non-empty cells fits MAX_CELLS (else the coarsest)."""
+    fits = [name for name in LEVELS if cells_per_level[name] <= MAX_CELLS]
+    return fits[-1] if fits else next(iter(LEVELS))
+
+
+def map_frame(lat, lon, count, level: Optional[str]) -> pd.DataFrame:
+    """lat/lon/count/size frame for st.map; size is a radius in meters."""
+    count = np.asarray(count, dtype=np.int64)
+    if level is None:
+        size = np.full(len(count), RAW_RADIUS, dtype=np.float64)
+    else:
+        # area ∝ count, the fullest cell filling half its width
+        scale = np.sqrt(count / count.max()) if len(count) else count
+        size = np.maximum(scale * LEVELS[level] * METERS_PER_DEGREE / 2, RAW_RADIUS)
+    return pd.DataFrame({"lat": lat, "lon": lon, "count": count, "size": size})
+
+
+class GeoBins:
+    """Per-level cell ids of every user, for filtered maps without re-binning."""
+
+    def __init__(self, df_users: pd.DataFrame):
+        ids = df_users["UserID"].to_numpy()
+        self.lat = df_users["Latitude"].to_numpy(dtype=np.float64)
+        self.lon = df_users["Longitude"].to_numpy(dtype=np.float64)
+        # UserID → row position
+        self.pos = np.full(int(ids.max(initial=0)) + 1, -1, dtype=np.int64)
+        self.pos[ids] = np.arange(len(ids))
+        # level → (dense cell index per user, number of cells); dense indexes
+        # keep the bincounts small at fine levels
+        self.codes = {}
+        for name, size in LEVELS.items():
+            codes, cells = pd.factorize(cell_ids(self.lat, self.lon, size))
+            self.codes[name] = (codes.astype(np.int32), len(cells))
+
+    def positions(self, user_ids) -> np.ndarray:
+        return self.pos[np.asarray(user_ids, dtype=np.int64)]
+
+    def query(self, rows: np.ndarray, level: Optional[str] = None) -> tuple[pd.DataFrame, Optional[str]]:
+        """(map frame, level drawn) for users at row positions rows; level None = auto."""
+        if level is None:
+            if len(rows) <= RAW_POINTS:
+                return map_frame(self.lat[rows], self.lon[rows], np.ones(len(rows)), None), None
+            counts = {
+                name: int(np.count_nonzero(np.bincount(codes[rows], minlength=n)))
+                for name, (codes, n) in self.codes.items()
+            }
+            level = choose_level(counts)
+        codes, n = self.codes[level]
+        cell = codes[rows]
+        count = np.bincount(cell, minlength=n)
+        lat = np.bincount(cell, weights=self.lat[rows], minlength=n)
+        lon = np.bincount(cell, weights=self.lon[rows], minlength=n)
+        hit = count > 0
+        return map_frame(lat[hit] / count[hit], lon[hit] / count[hit], count[hit], level), level
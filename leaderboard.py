@@ -0,0 +1,310 @@
+import heapq
+from itertools import chain
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from filters import FilterState
+
+# -------------------------
+# Incrementally maintained leaderboards
+# -------------------------
+# Users are partitioned by the user filter dimensions: City × Role × CreatedAt
+# month. Every partition keeps its rows ordered by CreatedAt, a bounded heap of
+# its HEAP_SIZE most active users and counts per referral code, all updated as
+# users arrive, leave or transact. A filtered top-n merges the heaps and
+# counters of the partitions the filters cover entirely; only the two months
+# cut by a date range are read row by row.
+#
+# The cube backend passes the users a ledger sync rewrites through
+# update_users (old rows, new rows); a refresh builds the next version's
+# leaderboards from scratch.
+#
+# Referral codes are counted exactly while there are at most EXACT_CODES of
+# them. Past that each partition keeps a Space-Saving summary of SKETCH_SIZE
+# counters instead, whose counts overestimate by at most their error.
+HEAP_SIZE = 25  # top-n is exact for n <= HEAP_SIZE
+EXACT_CODES = 10_000
+SKETCH_SIZE = 1_000
+
+
+def _us(ts) -> int:
+    return int(pd.Timestamp(ts).value // 1000)
+
+
+class Summary:
+    """Heavy-hitter counts: sorted codes with counts and overcount bounds.
+
+    size None keeps every code (exact). Otherwise at most size codes survive
+    (Space-Saving); a code not kept may have occurred up to floor times.
+    """
+
+    def __init__(self, codes=None, counts=None, errors=None, floor: int = 0, size: Optional[int] = None):
+        self.codes = np.empty(0, dtype=np.int64) if codes is None else codes
+        self.counts = np.zeros(len(self.codes), dtype=np.int64) if counts is None else counts
+        self.errors = np.zeros(len(self.codes), dtype=np.int64) if errors is None else errors
+        self.floor = floor
+        self.size = size
+
+    @classmethod
+    def of(cls, codes: np.ndarray, size: Optional[int] = None) -> "Summary":
+        """Exact counts of the non-negative codes, truncated to size."""
+        codes, counts = np.unique(codes[codes >= 0], return_counts=True)
+        return cls.merge([cls(codes, counts.astype(np.int64))], size)
+
+    @classmethod
+    def merge(cls, parts: list, size: Optional[int] = None) -> "Summary":
+        # A code missing from a part counts that part's floor, so
+        # count(x) = Σ floor + Σ over parts holding x of (count - floor)
+        parts = [p for p in parts if len(p.codes) or p.floor]
+        if not parts:
+            return cls(size=size)
+        floors = np.array([p.floor for p in parts], dtype=np.int64)
+        lengths = [len(p.codes) for p in parts]
+        codes = np.concatenate([p.codes for p in parts])
+        base = np.repeat(floors, lengths)
+        uniq, inverse = np.unique(codes, return_inverse=True)
+        counts = floors.sum() + np.bincount(inverse, np.concatenate([p.counts for p in parts]) - base, len(uniq))
+        errors = floors.sum() + np.bincount(inverse, np.concatenate([p.errors for p in parts]) - base, len(uniq))
+        counts, errors, floor = counts.astype(np.int64), errors.astype(np.int64), int(floors.sum())
+        if size is not None and len(uniq) > size:
+            keep = np.sort(np.argsort(-counts, kind="stable")[:size])
+            floor = max(floor, int(np.delete(counts, keep).max()))
+            uniq, counts, errors = uniq[keep], counts[keep], errors[keep]
+        return cls(uniq, counts, errors, floor, size)
+
+    @property
+    def exact(self) -> bool:
+        return not self.errors.any()
+
+
+class Partition:
+    """Users of one City × Role × month, ordered by (CreatedAt, UserID)."""
+
+    def __init__(self, city, role, created, ids, totals, names, refs, sketch: Optional[int]):
+        self.city, self.role, self.sketch = city, role, sketch
+        self.created, self.ids, self.totals, self.names, self.refs = created, ids, totals, names, refs
+        self.refresh()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def refresh(self) -> None:
+        """Rebuild the heap and referral counts from the rows."""
+        self.heap = _heap(self.ids, self.totals, self.names, HEAP_SIZE)
+        self.ref_counts = Summary.of(self.refs, self.sketch)
+
+    def insert(self, created, ids, totals, names, refs) -> None:
+        order = np.lexsort((ids, created))
+        created, ids, totals, names, refs = created[order], ids[order], totals[order], names[order], refs[order]
+        at = np.searchsorted(self.created, created, "right")
+        self.created = np.insert(self.created, at, created)
+        self.ids = np.insert(self.ids, at, ids)
+        self.totals = np.insert(self.totals, at, totals)
+        self.names = np.insert(self.names, at, names)
+        self.refs = np.insert(self.refs, at, refs)
+        for entry in zip(totals.tolist(), (-ids).tolist(), names.tolist()):
+            _push(self.heap, entry)
+        self.ref_counts = Summary.merge([self.ref_counts, Summary.of(refs)], self.sketch)
+
+    def remove(self, ids) -> None:
+        keep = ~np.isin(self.ids, ids)
+        self.created, self.ids, self.totals = self.created[keep], self.ids[keep], self.totals[keep]
+        self.names, self.refs = self.names[keep], self.refs[keep]
+        self.refresh()
+
+    def set_totals(self, ids, totals) -> None:
+        sorter = np.argsort(self.ids)
+        pos = sorter[np.searchsorted(self.ids, ids, sorter=sorter)]
+        old = self.totals[pos]
+        self.totals[pos] = totals
+        members = {-e[1] for e in self.heap}
+        if members.intersection(ids[totals < old].tolist()):
+            # a heap member dropped: the next best may be outside the heap
+            self.heap = _heap(self.ids, self.totals, self.names, HEAP_SIZE)
+            return
+        for uid, total, name in zip(ids.tolist(), totals.tolist(), self.names[pos].tolist()):
+            at = next((i for i, e in enumerate(self.heap) if e[1] == -uid), None)
+            if at is None:
+                _push(self.heap, (total, -uid, name))
+            else:
+                self.heap[at] = (total, -uid, name)
+                heapq.heapify(self.heap)
+
+    def span(self, lo: Optional[int], hi: Optional[int]) -> tuple[int, int]:
+        """Row range [a, b) with lo <= CreatedAt <= hi (µs, None = unbounded)."""
+        a = 0 if lo is None else int(np.searchsorted(self.created, lo, "left"))
+        b = len(self) if hi is None else int(np.searchsorted(self.created, hi, "right"))
+        return a, max(a, b)
+
+
+def _heap(ids: np.ndarray, totals: np.ndarray, names: np.ndarray, k: int) -> list:
+    # Min-heap of the k best (TotalTransactions desc, UserID asc) rows
+    best = np.lexsort((ids, -totals))[:k]
+    heap = list(zip(totals[best].tolist(), (-ids[best]).tolist(), names[best].tolist()))
+    heapq.heapify(heap)
+    return heap
+
+
+def _push(heap: list, entry: tuple) -> None:
+    if len(heap) < HEAP_SIZE:
+        heapq.heappush(heap, entry)
+    elif entry > heap[0]:
+        heapq.heapreplace(heap, entry)
+
+
+class Leaderboards:
+    """Top active users, cities and referral codes for any user filter."""
+
+    def __init__(self, df_users: pd.DataFrame, sketch: Optional[int] = None):
+        codes, vocab = pd.factorize(df_users["ReferralCode"].astype(object))
+        if sketch is None and len(vocab) > EXACT_CODES:
+            sketch = SKETCH_SIZE
+        self.sketch = sketch
+        self.vocab = np.asarray(vocab, dtype=object)
+        self._codes = {v: i for i, v in enumerate(self.vocab.tolist())}
+        self.name_dtype = df_users["Name"].dtype
+        self.parts: list[Partition] = []
+        self._keys: dict[tuple, int] = {}  # (City, Role, month) → partition number
+        self._part_of = np.empty(0, dtype=np.int32)  # UserID → partition number, -1 = none
+        self._add(df_users, codes.astype(np.int64))
+
+    @property
+    def approximate(self) -> bool:
+        return self.sketch is not None
+
+    # ---------- Incremental updates ----------
+    def _encode(self, refs: pd.Series) -> np.ndarray:
+        values = refs.astype(object).tolist()
+        for v in values:
+            if v is not None and v == v and v not in self._codes:
+                self._codes[v] = len(self._codes)
+        self.vocab = np.array(list(self._codes), dtype=object)
+        if self.sketch is None and len(self._codes) > EXACT_CODES:
+            # cardinality exploded: switch every partition to a summary
+            self.sketch = SKETCH_SIZE
+            for part in self.parts:
+                part.sketch = SKETCH_SIZE
+                part.ref_counts = Summary.merge([part.ref_counts], SKETCH_SIZE)
+        return np.array([self._codes.get(v, -1) if v is not None and v == v else -1 for v in values], dtype=np.int64)
+
+    def add_users(self, df: pd.DataFrame) -> None:
+        self._add(df, self._encode(df["ReferralCode"]))
+
+    def _add(self, df: pd.DataFrame, refs: np.ndarray) -> None:
+        ids = df["UserID"].to_numpy(dtype=np.int64)
+        created = df["CreatedAt"].to_numpy("datetime64[us]")
+        month = created.astype("datetime64[M]").astype(np.int64)
+        created = created.astype(np.int64)
+        city = df["City"].astype(object).to_numpy()
+        role = df["Role"].astype(object).to_numpy()
+        totals = df["TotalTransactions"].to_numpy(dtype=np.int64)
+        names = df["Name"].astype(object).to_numpy()
+        keys = pd.MultiIndex.from_arrays([city, role, month])
+        if len(ids) and ids.max() >= len(self._part_of):
+            self._part_of = np.r_[self._part_of, np.full(ids.max() + 1 - len(self._part_of), -1, dtype=np.int32)]
+        for key, rows in pd.Series(np.arange(len(ids))).groupby(keys, sort=False).indices.items():
+            cols = created[rows], ids[rows], totals[rows], names[rows], refs[rows]
+            number = self._keys.get(key)
+            if number is None:
+                order = np.lexsort((cols[1], cols[0]))
+                number = self._keys[key] = len(self.parts)
+                self.parts.append(Partition(key[0], key[1], *(c[order] for c in cols), self.sketch))
+            else:
+                self.parts[number].insert(*cols)
+            self._part_of[ids[rows]] = number
+
+    def remove_users(self, user_ids) -> None:
+        ids = np.asarray(user_ids, dtype=np.int64)
+        for number, rows in pd.Series(ids).groupby(self._part_of[ids]).indices.items():
+            self.parts[number].remove(ids[rows])
+        self._part_of[ids] = -1
+
+    def update_users(self, before: pd.DataFrame, after: pd.DataFrame) -> None:
+        """Move users from their rows in before to those in after (same UserIDs, same order).
+
+        Users whose partition, name or referral code changed are removed and
+        added again; a changed TotalTransactions alone is set in place.
+        """
+        moved = np.zeros(len(after), dtype=bool)
+        for column in ["CreatedAt", "City", "Role", "Name", "ReferralCode"]:
+            old, new = before[column].astype(object).to_numpy(), after[column].astype(object).to_numpy()
+            moved |= ~((old == new) | (pd.isna(old) & pd.isna(new)))
+        if moved.any():
+            self.remove_users(before["UserID"].to_numpy()[moved])
+            self.add_users(after[moved])
+        totals = after["TotalTransactions"].to_numpy(dtype=np.int64)
+        changed = ~moved & (before["TotalTransactions"].to_numpy(dtype=np.int64) != totals)
+        if changed.any():
+            self.set_transactions(after["UserID"].to_numpy()[changed], totals[changed])
+
+    def set_transactions(self, user_ids, totals) -> None:
+        """Set TotalTransactions of existing users."""
+        ids = np.asarray(user_ids, dtype=np.int64)
+        totals = np.asarray(totals, dtype=np.int64)
+        for number, rows in pd.Series(ids).groupby(self._part_of[ids]).indices.items():
+            self.parts[number].set_totals(ids[rows], totals[rows])
+
+    # ---------- Queries ----------
+    def _selected(self, state: FilterState):
+        # (partition, a, b) for every partition with filtered rows [a, b)
+        lo, hi = state.date_range or (None, None)
+        lo = None if lo is None else _us(lo)
+        hi = None if hi is None else _us(hi)
+        cities, roles = set(state.cities), set(state.roles)
+        for part in self.parts:
+            if (cities and part.city not in cities) or (roles and part.role not in roles) or not len(part):
+                continue
+            a, b = part.span(lo, hi)
+            if b > a:
+                yield part, a, b
+
+    def top_active(self, state: FilterState, n: int = 10) -> pd.DataFrame:
+        if n > HEAP_SIZE:
+            raise ValueError(f"top_active keeps the top {HEAP_SIZE} per partition; n={n}")
+        candidates = []
+        for part, a, b in self._selected(state):
+            if a == 0 and b == len(part):
+                candidates.append(part.heap)
+            else:
+                candidates.append(_heap(part.ids[a:b], part.totals[a:b], part.names[a:b], n))
+        best = heapq.nlargest(n, chain.from_iterable(candidates))
+        return pd.DataFrame({
+            "Name": pd.array([e[2] for e in best], dtype=self.name_dtype),
+            "TotalTransactions": np.array([e[0] for e in best], dtype=np.int64),
+        })
+
+    def top_cities(self, state: FilterState, n: int = 10) -> pd.DataFrame:
+        counts = {}
+        for part, a, b in self._selected(state):
+            counts[part.city] = counts.get(part.city, 0) + b - a
+        top = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))[:n]
+        return pd.DataFrame({
+            "City": pd.array([k for k, _ in top], dtype=object),
+            "User Count": np.array([v for _, v in top], dtype=np.int64),
+        })
+
+    def ref_summary(self, state: FilterState) -> Summary:
+        parts = [
+            part.ref_counts if a == 0 and b == len(part) else Summary.of(part.refs[a:b])
+            for part, a, b in self._selected(state)
+        ]
+        return Summary.merge(parts, self.sketch)
+
+    def top_refs(self, state: FilterState, n: int = 10) -> pd.DataFrame:
+        """Top referral codes; with a sketch, counts are upper bounds and Max Overcount their error."""
+        summary = self.ref_summary(state)
+        labels = self.vocab[summary.codes]
+        # ties by code value, as the other backends
+        top = np.lexsort((labels.astype(str), -summary.counts))[:n]
+        df = pd.DataFrame({"Referral Code": labels[top], "Usage Count": summary.counts[top]})
+        if self.approximate:
+            df["Max Overcount"] = summary.errors[top]
+        return df
+
+    def memory_bytes(self) -> int:
+        return sum(
+            p.created.nbytes + p.ids.nbytes + p.totals.nbytes + p.refs.nbytes + p.names.nbytes
+            for p in self.parts
+        )
@@ -0,0 +1,273 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Iterable, Optional
+
+import pandas as pd
+
+# -------------------------
+# Subscription transaction ledger
+# -------------------------
+# Append-only SQLite file in WAL mode. Rows are never updated: a cancellation
+# is its own row pointing at the transaction it cancels, and a unique index
+# on that pointer makes repeated cancels of one TransactionID no-ops.
+# Writes from all sessions go through one writer thread that commits
+# whatever has queued up in a single transaction (group commit), so a bulk
+# campaign of N stores costs one fsync, not N. A batch that fails is retried
+# one request at a time, so a bad request fails alone. The file carries a
+# random id written when it is created, so stores derived from the ledger
+# (the SQL backend's tables) can tell a recreated ledger from the one they
+# synced with.
+LEDGER_PATH = os.environ.get("POSSAX_LEDGER", "ledger.sqlite")
+MAX_BATCH = 50_000  # rows per commit
+APPEND_TIMEOUT = 60.0  # seconds append() waits for its commit
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS transactions (
+    Seq INTEGER PRIMARY KEY,
+    TransactionID TEXT NOT NULL UNIQUE,
+    Kind TEXT NOT NULL,                 -- 'create' | 'cancel'
+    StoreID INTEGER NOT NULL,
+    Datetime INTEGER NOT NULL,          -- µs since epoch
+    SubscriptionType TEXT,
+    SubscriptionPeriod INTEGER,
+    Amount INTEGER,
+    ReferralCodeUsed TEXT,
+    Cancels TEXT,                       -- TransactionID of the cancelled create
+    Reason TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS transactions_cancels ON transactions (Cancels) WHERE Cancels IS NOT NULL;
+CREATE INDEX IF NOT EXISTS transactions_store ON transactions (StoreID, Seq);
+"""
+
+COLUMNS = [
+    "TransactionID", "Kind", "StoreID", "Datetime", "SubscriptionType",
+    "SubscriptionPeriod", "Amount", "ReferralCodeUsed", "Cancels", "Reason",
+]
+LOG_COLS = [
+    "Seq", "StoreID", "Datetime", "Kind", "SubscriptionType", "SubscriptionPeriod",
+    "Amount", "TransactionID", "ReferralCodeUsed", "Cancels", "Reason", "Cancelled",
+]
+
+
+def new_transaction_id() -> str:
+    return f"TXN-{uuid.uuid4().hex[:12].upper()}"
+
+
+def _us(ts) -> int:
+    return int(pd.Timestamp(ts).value // 1000)
+
+
+def numbered(inserts: pd.DataFrame, first_id: int) -> pd.DataFrame:
+    """subscription_changes() inserts as subscription rows with integer SubscriptionIDs.
+
+    A row's id is first_id + Seq, so every backend numbers it alike; its
+    TransactionID is kept alongside for cancels.
+    """
+    df = inserts.rename(columns={"SubscriptionID": "TransactionID"})
+    df.insert(0, "SubscriptionID", first_id + df.pop("Seq").astype("int64"))
+    return df.reset_index(drop=True)
+
+
+class Ledger:
+    """Durable append-only log of subscription transactions."""
+
+    def __init__(self, path: str = LEDGER_PATH):
+        self.path = path
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('id', ?)", (uuid.uuid4().hex,))
+        self.id = conn.execute("SELECT value FROM meta WHERE key = 'id'").fetchone()[0]
+        conn.close()
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="ledger-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # One reader connection per thread; WAL readers never block the writer
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # ---------- Writes ----------
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        while True:
+            pending = [self._queue.get()]
+            size = len(pending[0][0])
+            while size < MAX_BATCH:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                pending.append(item)
+                size += len(item[0])
+            try:
+                results = self._commit(conn, [rows for rows, _ in pending])
+            except Exception as exc:  # never let the writer die: callers wait on it
+                results = [exc] * len(pending)
+            for (_, done), result in zip(pending, results):
+                done.put(result)
+
+    def _commit(self, conn: sqlite3.Connection, requests: list) -> list:
+        # Every request in one transaction; if that fails, each in its own, so
+        # only the request at fault gets the exception
+        try:
+            with conn:
+                return [self._insert(conn, rows) for rows in requests]
+        except Exception as exc:
+            if len(requests) == 1:
+                return [exc]
+        results = []
+        for rows in requests:
+            try:
+                with conn:
+                    results.append(self._insert(conn, rows))
+            except Exception as exc:
+                results.append(exc)
+        return results
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, rows: list) -> int:
+        # OR IGNORE: a second cancel of the same transaction (or a retried
+        # batch) leaves the ledger unchanged
+        before = conn.total_changes
+        conn.executemany(
+            f"INSERT OR IGNORE INTO transactions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+            ([row.get(c) for c in COLUMNS] for row in rows),
+        )
+        return conn.total_changes - before
+
+    def append(self, rows: list) -> int:
+        """Append rows (dicts keyed by COLUMNS) in one commit; returns rows written."""
+        if not rows:
+            return 0
+        done = queue.Queue(maxsize=1)
+        self._queue.put((rows, done))
+        deadline = time.monotonic() + APPEND_TIMEOUT
+        while True:
+            try:
+                result = done.get(timeout=1.0)
+                break
+            except queue.Empty:
+                if not self._writer.is_alive():
+                    raise RuntimeError("ledger writer thread is not running") from None
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"ledger write not committed within {APPEND_TIMEOUT:.0f}s") from None
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def create(
+        self,
+        store_ids: Iterable[int],
+        sub_type: str,
+        period_days: int,
+        amount: int,
+        referral_code: Optional[str] = None,
+        at: Optional[datetime] = None,
+    ) -> list[str]:
+        """Record one subscription transaction per store; returns their TransactionIDs."""
+        now = _us(at or datetime.now())
+        rows = [
+            {
+                "TransactionID": new_transaction_id(), "Kind": "create", "StoreID": int(sid), "Datetime": now,
+                "SubscriptionType": sub_type, "SubscriptionPeriod": int(period_days), "Amount": int(amount),
+                "ReferralCodeUsed": referral_code,
+            }
+            for sid in store_ids
+        ]
+        self.append(rows)
+        return [row["TransactionID"] for row in rows]
+
+    def cancel(self, transaction_id: str, store_id: int, reason: str = "", at: Optional[datetime] = None) -> str:
+        """Cancel a create transaction of store_id: "cancelled", "already cancelled" or "not found"."""
+        found = self.conn.execute(
+            "SELECT 1 FROM transactions WHERE TransactionID = ? AND StoreID = ? AND Kind = 'create'",
+            (transaction_id, int(store_id)),
+        ).fetchone()
+        if not found:
+            return "not found"
+        written = self.append([{
+            "TransactionID": f"{transaction_id}-CANCEL", "Kind": "cancel", "StoreID": int(store_id),
+            "Datetime": _us(at or datetime.now()), "Cancels": transaction_id, "Reason": reason or None,
+        }])
+        return "cancelled" if written else "already cancelled"
+
+    # ---------- Reads ----------
+    def subscription_changes(
+        self, after: int = 0, until: Optional[int] = None
+    ) -> tuple[pd.DataFrame, list, int]:
+        """(created subscriptions, cancelled TransactionIDs, last Seq) for rows with after < Seq <= until.
+
+        Created transactions become subscription rows keyed by TransactionID,
+        running SubscriptionPeriod days from their Datetime, with their Seq.
+        """
+        cur = self.conn.execute(
+            "SELECT Seq, TransactionID, Kind, StoreID, Datetime, SubscriptionType, SubscriptionPeriod, Amount, Cancels "
+            "FROM transactions WHERE Seq > ? AND Seq <= ? ORDER BY Seq",
+            (int(after), 2**63 - 1 if until is None else int(until)),
+        )
+        rows = pd.DataFrame(cur.fetchall(), columns=[d[0] for d in cur.description])
+        creates = rows[rows["Kind"] == "create"]
+        start = pd.to_datetime(creates["Datetime"], unit="us")
+        inserts = pd.DataFrame({
+            "SubscriptionID": creates["TransactionID"],
+            "StoreID": creates["StoreID"],
+            "Type": creates["SubscriptionType"],
+            "StartDate": start,
+            "EndDate": start + pd.to_timedelta(creates["SubscriptionPeriod"], unit="D"),
+            "AmountPaid": creates["Amount"],
+            "Seq": creates["Seq"],
+        })
+        cancels = rows.loc[rows["Kind"] == "cancel", "Cancels"].tolist()
+        return inserts.reset_index(drop=True), cancels, int(rows["Seq"].max()) if len(rows) else int(after)
+
+    def version(self) -> int:
+        """Seq of the latest transaction (0 when empty); changes with every write."""
+        return self.conn.execute("SELECT COALESCE(MAX(Seq), 0) FROM transactions").fetchone()[0]
+
+    def count(self, store_id: Optional[int] = None) -> int:
+        if store_id is None:
+            return self.conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM transactions WHERE StoreID = ?", (int(store_id),)).fetchone()[0]
+
+    def page(
+        self, before: Optional[int] = None, limit: int = 50, store_id: Optional[int] = None
+    ) -> tuple[pd.DataFrame, Optional[int]]:
+        """(newest-first rows with Seq < before, cursor for the next page or None)."""
+        clauses, params = [], {"limit": int(limit)}
+        if before is not None:
+            clauses.append("t.Seq < :before")
+            params["before"] = int(before)
+        if store_id is not None:
+            clauses.append("t.StoreID = :store")
+            params["store"] = int(store_id)
+        where = " AND ".join(clauses) or "1"
+        cur = self.conn.execute(
+            f"""
+            SELECT t.*, EXISTS (SELECT 1 FROM transactions c WHERE c.Cancels = t.TransactionID) AS Cancelled
+            FROM transactions t WHERE {where} ORDER BY t.Seq DESC LIMIT :limit
+            """,
+            params,
+        )
+        df = pd.DataFrame(cur.fetchall(), columns=[d[0] for d in cur.description])
+        df["Datetime"] = pd.to_datetime(df["Datetime"], unit="us")
+        df["Cancelled"] = df["Cancelled"].astype(bool)
+        cursor = int(df["Seq"].iloc[-1]) if len(df) == limit else None
+        return df[LOG_COLS], cursor
@@ -1,170 +1,248 @@
-import pandas as pd
-import random
-from datetime import datetime, timedelta
-
-random.seed(42)
-
-# -------------------------
-# Helpers
-# -------------------------
-CITIES = [
-    "Jakarta", "Bandung", "Surabaya", "Medan", "Makassar",
-    "Yogyakarta", "Denpasar", "Semarang", "Palembang", "Balikpapan",
-    "Bekasi", "Tangerang", "Depok"
-]
-
-CITY_COORDS = {
-    "Jakarta": (-6.2, 106.8),
-    "Bandung": (-6.9, 107.6),
-    "Surabaya": (-7.25, 112.75),
-    "Medan": (3.59, 98.67),
-    "Makassar": (-5.15, 119.43),
-    "Yogyakarta": (-7.8, 110.37),
-    "Denpasar": (-8.65, 115.22),
-    "Semarang": (-6.99, 110.42),
-    "Palembang": (-2.99, 104.76),
-    "Balikpapan": (-1.27, 116.83),
-    "Bekasi": (-6.24, 106.99),
-    "Tangerang": (-6.18, 106.63),
-    "Depok": (-6.4, 106.82),
-}
-
-ROLES = ["Owner", "Kasir", "Manager", "Supervisor"]
-DEVICE_TYPES = ["Android", "iOS"]
-STORE_TYPES = ["Retail", "F&B", "Service", "Cafe", "Restaurant", "Bakery"]
-SUB_TYPES = ["Pro", "Basic", "Trial", "Non-Paid"]
-REF_CODES = ["REF123", "JOIN2025", "PROMO50", "DISCOUNT10", "VIP", "FREEMONTH", "HELLO", "TRYME", "BONUS", "SUPER"]
-
-def jitter(coord: float, spread: float = 0.15) -> float:
-    return coord + random.uniform(-spread, spread)
-
-# -------------------------
-# Users
-# -------------------------
-NUM_USERS = 120
-users = []
-for uid in range(1, NUM_USERS + 1):
-    city = random.choice(CITIES)
-    base_lat, base_lon = CITY_COORDS[city]
-    created_at = datetime.now() - timedelta(days=random.randint(0, 365))
-    last_activity = datetime.now() - timedelta(days=random.randint(0, 7))
-    user = {
-        "UserID": uid,
-        "Name": f"User {uid}",
-        "CreatedAt": created_at,
-        "LastActivity": last_activity,
-        "Role": random.choice(ROLES),
-        "DeviceType": random.choice(DEVICE_TYPES),
-        "Phone": f"+62{random.randint(8110000000, 8999999999)}",
-        "Email": f"user{uid}@example.com",
-        "ReferralCode": random.choice(REF_CODES + [None, None]),  # some Nones
-        "City": city,
-        "Latitude": jitter(base_lat, 0.2),
-        "Longitude": jitter(base_lon, 0.2),
-        "TotalTransactions": random.randint(0, 1000),
-    }
-    users.append(user)
-
-df_users = pd.DataFrame(users)
-
-# -------------------------
-# Stores
-# -------------------------
-NUM_STORES = 80
-stores = []
-for sid in range(1, NUM_STORES + 1):
-    city = random.choice(CITIES)
-    owner_id = random.randint(1, NUM_USERS)
-    created_at = datetime.now() - timedelta(days=random.randint(0, 540))
-    current_type = random.choice(SUB_TYPES)
-    stores.append({
-        "StoreID": sid,
-        "StoreName": f"Store {sid}",
-        "StoreType": random.choice(STORE_TYPES),
-        "OwnerUserID": owner_id,
-        "City": city,
-        "CreatedAt": created_at,
-        "SubscriptionType": current_type,  # current tier
-        "Is_Branch": random.choice([True, False])
-    })
-
-df_stores = pd.DataFrame(stores)
-
-# -------------------------
-# Subscriptions (history, per store)
-# -------------------------
-sub_records = []
-sub_id = 1
-for _, s in df_stores.iterrows():
-    # 1 to 5 historical records, last one defines current EndDate
-    n_rec = random.randint(1, 5)
-    start = s["CreatedAt"] - timedelta(days=random.randint(0, 60))
-    for i in range(n_rec):
-        sub_type = s["SubscriptionType"] if i == n_rec - 1 else random.choice(SUB_TYPES)
-        duration = random.choice([30, 90, 180])
-        s_start = start + timedelta(days=sum(random.choice([30, 90, 180]) for _ in range(i)))
-        s_end = s_start + timedelta(days=duration)
-        paid = 0
-        if sub_type == "Pro":
-            paid = 400_000
-        elif sub_type == "Basic":
-            paid = 200_000
-        sub_records.append({
-            "SubscriptionID": sub_id,
-            "StoreID": s["StoreID"],
-            "Type": sub_type,
-            "StartDate": s_start,
-            "EndDate": s_end,
-            "AmountPaid": paid,
-        })
-        sub_id += 1
-
-df_subscriptions = pd.DataFrame(sub_records)
-
-# Aggregate back onto stores: current Start/End, recurring count, total spent
-agg = (
-    df_subscriptions.sort_values(["StoreID", "EndDate"])
-    .groupby("StoreID")
-    .agg(
-        CurrentStart=("StartDate", "last"),
-        CurrentEnd=("EndDate", "last"),
-        ReoccuringSubs=("SubscriptionID", "count"),
-        TotalMoneySpent=("AmountPaid", "sum"),
-    )
-    .reset_index()
-)
-df_stores = df_stores.merge(agg, on="StoreID", how="left")
-
-# -------------------------
-# Users → store membership (for "Stores" column in Users table)
-# -------------------------
-# Randomly assign each user 0–3 associated stores
-store_ids = df_stores["StoreID"].tolist()
-user_stores_map = {}
-for uid in df_users["UserID"]:
-    k = random.choice([0, 1, 2, 3])
-    user_stores_map[uid] = sorted(random.sample(store_ids, k)) if k > 0 else []
-
-df_users["Stores"] = df_users["UserID"].map(user_stores_map)
-
-# -------------------------
-# Derived: UserSubscriptionType (highest tier across their stores)
-# Ranking: Pro > Basic > Trial > Non-Paid
-# -------------------------
-rank = {"Pro": 3, "Basic": 2, "Trial": 1, "Non-Paid": 0}
-
-store_type_map = df_stores.set_index("StoreID")["SubscriptionType"].to_dict()
-
-def user_tier(store_list):
-    if not store_list:
-        return "Non-Paid"
-    tiers = [store_type_map.get(sid, "Non-Paid") for sid in store_list]
-    return sorted(tiers, key=lambda t: rank[t], reverse=True)[0]
-
-df_users["UserSubscriptionType"] = df_users["Stores"].apply(user_tier)
-
-# -------------------------
-# Trend scaffolds (we’ll compute from CreatedAt / CreatedAt)
-# -------------------------
-
-__all__ = ["df_users", "df_stores", "df_subscriptions"]
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Iterator, Optional
+
+from compact import csr_max, list_column
+
+# -------------------------
+# Helpers
+# -------------------------
+CITIES = [
+    "Jakarta", "Bandung", "Surabaya", "Medan", "Makassar",
+    "Yogyakarta", "Denpasar", "Semarang", "Palembang", "Balikpapan",
+    "Bekasi", "Tangerang", "Depok"
+]
+
+CITY_COORDS = {
+    "Jakarta": (-6.2, 106.8),
+    "Bandung": (-6.9, 107.6),
+    "Surabaya": (-7.25, 112.75),
+    "Medan": (3.59, 98.67),
+    "Makassar": (-5.15, 119.43),
+    "Yogyakarta": (-7.8, 110.37),
+    "Denpasar": (-8.65, 115.22),
+    "Semarang": (-6.99, 110.42),
+    "Palembang": (-2.99, 104.76),
+    "Balikpapan": (-1.27, 116.83),
+    "Bekasi": (-6.24, 106.99),
+    "Tangerang": (-6.18, 106.63),
+    "Depok": (-6.4, 106.82),
+}
+
+ROLES = ["Owner", "Kasir", "Manager", "Supervisor"]
+DEVICE_TYPES = ["Android", "iOS"]
+STORE_TYPES = ["Retail", "F&B", "Service", "Cafe", "Restaurant", "Bakery"]
+SUB_TYPES = ["Pro", "Basic", "Trial", "Non-Paid"]
+REF_CODES = ["REF123", "JOIN2025", "PROMO50", "DISCOUNT10", "VIP", "FREEMONTH", "HELLO", "TRYME", "BONUS", "SUPER"]
+
+# Ranking: Pro > Basic > Trial > Non-Paid
+rank = {"Pro": 3, "Basic": 2, "Trial": 1, "Non-Paid": 0}
+SUB_PRICES = {"Pro": 400_000, "Basic": 200_000, "Trial": 0, "Non-Paid": 0}
+SUB_DURATIONS = [30, 90, 180]
+
+NUM_USERS = 120
+NUM_STORES = 80
+MAX_HISTORY = 5
+
+# Lookup arrays indexed by position in SUB_TYPES / rank value
+_CITY_LAT = np.array([CITY_COORDS[c][0] for c in CITIES])
+_CITY_LON = np.array([CITY_COORDS[c][1] for c in CITIES])
+_SUB_RANK = np.array([rank[t] for t in SUB_TYPES], dtype=np.int8)
+_SUB_PRICE = np.array([SUB_PRICES[t] for t in SUB_TYPES], dtype=np.int64)
+_RANK_TO_SUB = np.array(sorted(rank, key=rank.get), dtype=object)
+
+# Independent RNG streams, so any chunk can be generated on its own
+_TIER_STREAM, _STORE_STREAM, _USER_STREAM = 0, 1, 2
+
+
+def _rng(seed: int, stream: int, chunk: int = 0) -> np.random.Generator:
+    return np.random.default_rng([seed, stream, chunk])
+
+
+def _days_before(now: np.datetime64, days: np.ndarray) -> np.ndarray:
+    return now - days.astype("timedelta64[D]")
+
+
+def _pick(options: list, idx: np.ndarray) -> pd.Categorical:
+    # Categorical with sorted categories; None options become missing values
+    categories = sorted({o for o in options if o is not None})
+    codes = np.array([categories.index(o) if o is not None else -1 for o in options], dtype=np.int8)
+    return pd.Categorical.from_codes(codes[idx], categories=categories)
+
+
+def _chunks(total: int, chunk_size: Optional[int]) -> Iterator[tuple[int, int, int]]:
+    # An empty table is still one (empty) chunk, so every table has a schema
+    step = chunk_size or max(total, 1)
+    for i, lo in enumerate(range(0, max(total, 1), step)):
+        yield i, lo, min(lo + step, total)
+
+
+# -------------------------
+# Stores → subscription rollup
+# -------------------------
+def aggregate_subscriptions(df_subscriptions: pd.DataFrame) -> pd.DataFrame:
+    """Current Start/End (latest EndDate), recurring count and total spent per store."""
+    store = df_subscriptions["StoreID"].to_numpy()
+    end = df_subscriptions["EndDate"].to_numpy()
+    order = np.lexsort((end, store))
+    store = store[order]
+    if len(store) == 0:
+        return pd.DataFrame({
+            "StoreID": store, "CurrentStart": df_subscriptions["StartDate"].to_numpy()[:0], "CurrentEnd": end[:0],
+            "ReoccuringSubs": np.zeros(0, dtype=np.int64), "TotalMoneySpent": np.zeros(0, dtype=np.int64),
+        })
+    first = np.flatnonzero(np.r_[True, store[1:] != store[:-1]])
+    last = np.r_[first[1:], len(store)] - 1
+    paid = df_subscriptions["AmountPaid"].to_numpy()[order]
+    return pd.DataFrame({
+        "StoreID": store[first],
+        "CurrentStart": df_subscriptions["StartDate"].to_numpy()[order][last],
+        "CurrentEnd": end[order][last],
+        "ReoccuringSubs": (last - first + 1).astype(np.int64),
+        "TotalMoneySpent": np.add.reduceat(paid, first).astype(np.int64),
+    })
+
+
+def _store_tiers(num_stores: int, seed: int) -> np.ndarray:
+    # Current tier (index into SUB_TYPES) of every store, needed up front by
+    # the user chunks to derive UserSubscriptionType
+    return _rng(seed, _TIER_STREAM).integers(0, len(SUB_TYPES), num_stores).astype(np.int8)
+
+
+def _stores_chunk(rng, lo, hi, num_users, tiers, now, max_history, first_sub_id):
+    n = hi - lo
+    store_ids = np.arange(lo + 1, hi + 1, dtype=np.int64)
+    created = _days_before(now, rng.integers(0, 541, n))
+    tier = tiers[lo:hi]
+    stores = pd.DataFrame({
+        "StoreID": store_ids,
+        "StoreName": "Store " + pd.Series(store_ids).astype(str),
+        "StoreType": _pick(STORE_TYPES, rng.integers(0, len(STORE_TYPES), n)),
+        "OwnerUserID": rng.integers(1, num_users + 1, n),
+        "City": _pick(CITIES, rng.integers(0, len(CITIES), n)),
+        "CreatedAt": created,
+        "SubscriptionType": _pick(SUB_TYPES, tier),
+        "Is_Branch": rng.integers(0, 2, n).astype(bool),
+    })
+
+    # 1 to max_history historical records, last one defines current EndDate
+    n_rec = rng.integers(1, max_history + 1, n)
+    total = int(n_rec.sum())
+    owner = np.repeat(np.arange(n), n_rec)
+    pos = np.arange(total) - np.repeat(np.cumsum(n_rec) - n_rec, n_rec)
+    is_last = pos == n_rec[owner] - 1
+    sub_type = np.where(is_last, tier[owner], rng.integers(0, len(SUB_TYPES), total))
+    duration = np.asarray(SUB_DURATIONS)[rng.integers(0, len(SUB_DURATIONS), total)]
+    # Record i starts after the sum of i random periods
+    periods = rng.multinomial(pos, [1 / len(SUB_DURATIONS)] * len(SUB_DURATIONS)) @ np.asarray(SUB_DURATIONS)
+    start = _days_before(created, rng.integers(0, 61, n))
+    s_start = start[owner] + periods.astype("timedelta64[D]")
+    subs = pd.DataFrame({
+        "SubscriptionID": np.arange(first_sub_id, first_sub_id + total, dtype=np.int64),
+        "StoreID": store_ids[owner],
+        "Type": _pick(SUB_TYPES, sub_type),
+        "StartDate": s_start,
+        "EndDate": s_start + duration.astype("timedelta64[D]"),
+        "AmountPaid": _SUB_PRICE[sub_type],
+    })
+
+    stores = stores.merge(aggregate_subscriptions(subs), on="StoreID", how="left")
+    return stores, subs
+
+
+def _users_chunk(rng, lo, hi, num_stores, tiers, now):
+    n = hi - lo
+    user_ids = np.arange(lo + 1, hi + 1, dtype=np.int64)
+    ids = pd.Series(user_ids).astype(str)
+    city = rng.integers(0, len(CITIES), n)
+    users = pd.DataFrame({
+        "UserID": user_ids,
+        "Name": "User " + ids,
+        "CreatedAt": _days_before(now, rng.integers(0, 366, n)),
+        "LastActivity": _days_before(now, rng.integers(0, 8, n)),
+        "Role": _pick(ROLES, rng.integers(0, len(ROLES), n)),
+        "DeviceType": _pick(DEVICE_TYPES, rng.integers(0, len(DEVICE_TYPES), n)),
+        "Phone": "+62" + pd.Series(rng.integers(8110000000, 9000000000, n)).astype(str),
+        "Email": "user" + ids + "@example.com",
+        "ReferralCode": _pick(REF_CODES + [None, None], rng.integers(0, len(REF_CODES) + 2, n)),  # some Nones
+        "City": _pick(CITIES, city),
+        "Latitude": _CITY_LAT[city] + rng.uniform(-0.2, 0.2, n),
+        "Longitude": _CITY_LON[city] + rng.uniform(-0.2, 0.2, n),
+        "TotalTransactions": rng.integers(0, 1001, n),
+    })
+
+    # Randomly assign each user 0–3 distinct associated stores, stored as
+    # CSR offsets + one flat int32 store-id array
+    width = min(3, num_stores)
+    k = np.minimum(rng.integers(0, 4, n), width)
+    if width:
+        picks = rng.integers(1, num_stores + 1, (n, width), dtype=np.int32)
+    else:  # no stores to pick from (integers(1, 1) has an empty range)
+        picks = np.zeros((n, 0), dtype=np.int32)
+    while width > 1:
+        srt = np.sort(picks, axis=1)
+        dup = (srt[:, 1:] == srt[:, :-1]).any(axis=1)
+        if not dup.any():
+            break
+        picks[dup] = rng.integers(1, num_stores + 1, (int(dup.sum()), width), dtype=np.int32)
+    valid = np.arange(width) < k[:, None]
+    picks = np.sort(np.where(valid, picks, np.iinfo(np.int32).max), axis=1)
+    store_ids = picks[np.arange(width) < k[:, None]]
+    offsets = np.r_[0, np.cumsum(k)]
+    users["Stores"] = list_column(offsets, store_ids)
+
+    # Derived: UserSubscriptionType (highest tier across their stores),
+    # a max-rank reduction over the CSR rows
+    user_rank = csr_max(_SUB_RANK[tiers[store_ids - 1]], offsets, empty=rank["Non-Paid"])
+    users["UserSubscriptionType"] = pd.Categorical(_RANK_TO_SUB[user_rank], categories=sorted(rank))
+    return users
+
+
+# -------------------------
+# Generator
+# -------------------------
+def iter_dataset(
+    num_users: int = NUM_USERS,
+    num_stores: int = NUM_STORES,
+    *,
+    seed: int = 42,
+    chunk_size: Optional[int] = None,
+    max_history: int = MAX_HISTORY,
+    now: Optional[datetime] = None,
+) -> Iterator[tuple[str, pd.DataFrame]]:
+    """Yield ("stores" | "subscriptions" | "users", frame) chunks of at most chunk_size rows.
+
+    Stores come first, each followed by the subscription history of the same
+    stores, then users. Output is reproducible for a given seed and chunk_size.
+    """
+    if num_stores and not num_users:
+        raise ValueError("stores need at least one user to own them")
+    now = np.datetime64(now or datetime.now(), "us")
+    tiers = _store_tiers(num_stores, seed)
+
+    next_sub_id = 1
+    for i, lo, hi in _chunks(num_stores, chunk_size):
+        stores, subs = _stores_chunk(_rng(seed, _STORE_STREAM, i), lo, hi, num_users, tiers, now, max_history, next_sub_id)
+        next_sub_id += len(subs)
+        yield "stores", stores
+        yield "subscriptions", subs
+
+    for i, lo, hi in _chunks(num_users, chunk_size):
+        yield "users", _users_chunk(_rng(seed, _USER_STREAM, i), lo, hi, num_stores, tiers, now)
+
+
+def generate_dataset(
+    num_users: int = NUM_USERS,
+    num_stores: int = NUM_STORES,
+    **kwargs,
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Build (df_users, df_stores, df_subscriptions) in memory; see iter_dataset for options."""
+    parts = {"users": [], "stores": [], "subscriptions": []}
+    for name, frame in iter_dataset(num_users, num_stores, **kwargs):
+        parts[name].append(frame)
+    return tuple(
+        pd.concat(parts[name], ignore_index=True) if len(parts[name]) > 1 else parts[name][0]
+        for name in ("users", "stores", "subscriptions")
+    )
+
@@ -0,0 +1,65 @@
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# -------------------------
+# Server-side table paging
+# -------------------------
+# A table view is (sort column, direction, offset, limit). Only the rows of
+# the visible window are selected: a top-k partition on the sort column
+# instead of a full sort, ties broken by the table key and missing values
+# last, so every page (and the SQL backend's ORDER BY) agree on row order.
+PAGE_SIZES = (25, 50, 100, 250)
+
+
+@dataclass(frozen=True)
+class TablePage:
+    sort: str
+    ascending: bool = True
+    offset: int = 0
+    limit: int = PAGE_SIZES[1]
+
+
+def sort_values(col: pd.Series) -> np.ndarray:
+    """float64 values ordering like col, NaN for missing."""
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        # categories are kept sorted, so codes order like the labels
+        codes = col.cat.codes.to_numpy()
+        if not col.cat.ordered and list(col.cat.categories) != sorted(col.cat.categories):
+            codes = pd.factorize(col.astype(object), sort=True)[0]
+        return np.where(codes >= 0, codes, np.nan)
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return np.where(col.notna(), col.to_numpy("datetime64[us]").astype(np.int64), np.nan).astype(np.float64)
+    if pd.api.types.is_bool_dtype(col) or pd.api.types.is_numeric_dtype(col):
+        return col.to_numpy(dtype=np.float64, na_value=np.nan)
+    codes = pd.factorize(col, sort=True)[0]
+    return np.where(codes >= 0, codes, np.nan)
+
+
+def top_k(values: np.ndarray, tie: np.ndarray, k: int, ascending: bool = True) -> np.ndarray:
+    """Positions of the first k rows ordered by (values, tie), NaN last, without a full sort."""
+    values = np.asarray(values, dtype=np.float64)
+    values = np.where(np.isnan(values), np.inf, values if ascending else -values)
+    k = min(k, len(values))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(values):
+        kth = np.partition(values, k - 1)[k - 1]
+        below = np.flatnonzero(values < kth)
+        at = np.flatnonzero(values == kth)
+        # rows tied on the boundary value: keep the smallest keys
+        at = at[np.argsort(tie[at], kind="stable")[:k - len(below)]]
+        cand = np.r_[below, at]
+    else:
+        cand = np.arange(len(values))
+    return cand[np.lexsort((tie[cand], values[cand]))]
+
+
+def window(values: np.ndarray, tie: np.ndarray, page: TablePage, rows: Optional[np.ndarray] = None) -> np.ndarray:
+    """Positions of the rows on page, optionally among the row positions in rows only."""
+    if rows is not None:
+        values, tie = values[rows], tie[rows]
+    pos = top_k(values, tie, page.offset + page.limit, page.ascending)[page.offset:]
+    return pos if rows is None else rows[pos]
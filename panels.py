@@ -0,0 +1,187 @@
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from paging import TablePage, sort_values, window
+
+# -------------------------
+# Panel computations (pandas)
+# -------------------------
+# Each function takes already-filtered frames and returns what one dashboard
+# panel renders. sql_backend.SQLBackend answers the same panels in SQL and
+# must return identical numbers.
+
+# Expiry windows as inclusive DaysToExpiry ranges; None = unbounded
+EXPIRY_WINDOWS = {
+    "All": (None, None),
+    "7 days": (0, 7),
+    "14 days": (0, 14),
+    "30 days": (0, 30),
+    "Expired": (None, -1),
+}
+
+
+def expiry_bounds(window) -> tuple:
+    """(lo, hi) DaysToExpiry bounds of a named window or a custom (lo, hi) day range."""
+    return tuple(window) if isinstance(window, (tuple, list)) else EXPIRY_WINDOWS[window]
+
+
+def expiry_label(window) -> str:
+    if isinstance(window, (tuple, list)):
+        return f"day {window[0]}–{window[1]}"
+    return window
+
+
+USER_COLS = [
+    "UserID", "Name", "CreatedAt", "LastActivity", "Role", "Stores",
+    "DeviceType", "Phone", "Email", "ReferralCode", "City", "TotalTransactions"
+]
+STORE_COLS = [
+    "StoreID", "StoreName", "StoreType", "Owner", "City",
+    "SubscriptionType", "CurrentStart", "CurrentEnd",
+    "ReoccuringSubs", "TotalMoneySpent", "DaysToExpiry", "Is_Branch"
+]
+EXPIRING_COLS = [
+    "StoreID", "StoreName", "StoreType", "Owner", "City",
+    "SubscriptionType", "CurrentEnd", "DaysToExpiry", "ReoccuringSubs", "TotalMoneySpent"
+]
+OWNER_COLS = ["UserID", "Name", "Role", "Phone", "Email", "City", "TotalTransactions"]
+# Columns a paged table can be sorted on (not the Stores lists)
+USER_SORTS = [c for c in USER_COLS if c != "Stores"]
+STORE_SORTS = STORE_COLS
+EXPIRING_SORTS = EXPIRING_COLS
+
+
+def _month(col: pd.Series) -> pd.Series:
+    return col.dt.to_period("M").dt.to_timestamp()
+
+
+def _top_counts(col: pd.Series, n: int, names: list) -> pd.DataFrame:
+    # Ties broken by value so every backend returns the same order
+    counts = col.value_counts().sort_index().sort_values(ascending=False, kind="stable")
+    counts = counts[counts > 0]  # categoricals also count unused categories
+    top = counts.head(n).reset_index()
+    top.columns = names
+    return top
+
+
+def key_metrics(users_f: pd.DataFrame, stores_f: pd.DataFrame, subs_f: pd.DataFrame) -> dict:
+    return {
+        "total_users": len(users_f),
+        "total_stores": len(stores_f),
+        "total_pro_stores": int((stores_f["SubscriptionType"] == "Pro").sum()),
+        "total_basic_stores": int((stores_f["SubscriptionType"] == "Basic").sum()),
+        "total_income": int(subs_f[subs_f["Type"].isin(["Pro", "Basic"])]["AmountPaid"].sum()),
+    }
+
+
+def user_sub_trend(users_f: pd.DataFrame) -> pd.DataFrame:
+    return (
+        users_f.assign(Month=_month(users_f["CreatedAt"]))
+        .groupby(["Month", "UserSubscriptionType"], observed=True)
+        .size().reset_index(name="UserCount")
+    )
+
+
+def store_trend(stores_f: pd.DataFrame) -> pd.DataFrame:
+    return stores_f.groupby(_month(stores_f["CreatedAt"]).rename("Month")).size().reset_index(name="StoreCount")
+
+
+def user_trend(users_f: pd.DataFrame) -> pd.DataFrame:
+    return users_f.groupby(_month(users_f["CreatedAt"]).rename("Month")).size().reset_index(name="UserCount")
+
+
+def top_active(users_f: pd.DataFrame, n: int = 10) -> pd.DataFrame:
+    return users_f.nlargest(n, "TotalTransactions")[["Name", "TotalTransactions"]].reset_index(drop=True)
+
+
+def top_cities(users_f: pd.DataFrame, n: int = 10) -> pd.DataFrame:
+    return _top_counts(users_f["City"], n, ["City", "User Count"])
+
+
+def top_refs(users_f: pd.DataFrame, n: int = 10) -> pd.DataFrame:
+    return _top_counts(users_f["ReferralCode"].dropna(), n, ["Referral Code", "Usage Count"])
+
+
+def store_type_counts(stores_f: pd.DataFrame) -> pd.DataFrame:
+    return stores_f.groupby("SubscriptionType", observed=True).size().reset_index(name="Count")
+
+
+def role_counts(users_f: pd.DataFrame) -> pd.DataFrame:
+    return users_f.groupby("Role", observed=True).size().reset_index(name="Count")
+
+
+def users_page(users_f: pd.DataFrame, page: TablePage) -> tuple[pd.DataFrame, int]:
+    """(rows on page, total rows) of the Users table."""
+    pos = window(sort_values(users_f[page.sort]), users_f["UserID"].to_numpy(), page)
+    return users_f[USER_COLS].iloc[pos].reset_index(drop=True), len(users_f)
+
+
+def _days_to_expiry(stores_f: pd.DataFrame, today: datetime) -> np.ndarray:
+    return (stores_f["CurrentEnd"] - today).dt.days.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _store_window(
+    stores_f: pd.DataFrame, df_users: pd.DataFrame, page: TablePage, today: datetime, rows: np.ndarray = None
+) -> pd.DataFrame:
+    # Derived sort keys are computed as arrays; Owner / DaysToExpiry columns
+    # are only joined onto the rows of the page
+    if page.sort == "DaysToExpiry":
+        values = _days_to_expiry(stores_f, today)
+    elif page.sort == "Owner":
+        values = sort_values(stores_f["OwnerUserID"].map(df_users.set_index("UserID")["Name"]))
+    else:
+        values = sort_values(stores_f[page.sort])
+    pos = window(values, stores_f["StoreID"].to_numpy(), page, rows)
+    return with_expiry(stores_f.iloc[pos], df_users, today).reset_index(drop=True)
+
+
+def stores_page(stores_f: pd.DataFrame, df_users: pd.DataFrame, page: TablePage, today: datetime) -> tuple[pd.DataFrame, int]:
+    """(rows on page, total rows) of the Stores table."""
+    return _store_window(stores_f, df_users, page, today)[STORE_COLS], len(stores_f)
+
+
+def expiring_page(
+    stores_f: pd.DataFrame, df_users: pd.DataFrame, window_name, page: TablePage, today: datetime
+) -> tuple[pd.DataFrame, int]:
+    """(rows on page, total rows) of the Expiring table for an expiry window."""
+    days = _days_to_expiry(stores_f, today)
+    lo, hi = expiry_bounds(window_name)
+    mask = np.ones(len(days), dtype=bool)
+    if lo is not None:
+        mask &= days >= lo
+    if hi is not None:
+        mask &= days <= hi
+    rows = np.flatnonzero(mask)
+    return _store_window(stores_f, df_users, page, today, rows)[EXPIRING_COLS], len(rows)
+
+
+def owner_names(df_users: pd.DataFrame) -> pd.Series:
+    return df_users.set_index("UserID")["Name"]
+
+
+def with_expiry(
+    stores_f: pd.DataFrame, df_users: pd.DataFrame, today: datetime, names: Optional[pd.Series] = None
+) -> pd.DataFrame:
+    # names: owner_names(df_users), when the caller already has it
+    names = owner_names(df_users) if names is None else names
+    out = stores_f.copy()
+    out["Owner"] = out["OwnerUserID"].map(names)
+    out["DaysToExpiry"] = (out["CurrentEnd"] - today).dt.days
+    return out
+
+
+def expiring_trend(exp_df: pd.DataFrame) -> pd.DataFrame:
+    # Counts of expiring stores per subscription type by CurrentEnd date
+    return (
+        exp_df.assign(EndDateOnly=exp_df["CurrentEnd"].dt.date)
+        .groupby(["EndDateOnly", "SubscriptionType"], observed=True)
+        .size().reset_index(name="Count")
+    )
+
+
+def affected_owners(exp_df: pd.DataFrame, df_users: pd.DataFrame) -> pd.DataFrame:
+    affected_user_ids = exp_df["OwnerUserID"].unique()
+    return df_users[df_users["UserID"].isin(affected_user_ids)][OWNER_COLS].reset_index(drop=True)
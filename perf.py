@@ -0,0 +1,183 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+
+from chart_data import payload_bytes
+
+# -------------------------
+# Rerun instrumentation
+# -------------------------
+# Each dashboard rerun records one span per section: wall time (computation
+# plus the st.* call that serializes it), rows read and shown, and the bytes
+# of what was sent to the browser (Arrow for tables, Vega/deck JSON for
+# charts and the map). At the end of the rerun the spans are appended to
+# PERF_DIR/spans.jsonl and folded into process-wide totals, written as a
+# Prometheus text-format file (for node_exporter's textfile collector or any
+# scraper that reads files).
+#
+# SamplingProfiler is the opt-in deep view: a background thread samples the
+# rerun's stack every SAMPLE_INTERVAL and counts collapsed stacks, which is
+# cheap enough to leave on for one whole rerun.
+PERF_DIR = os.environ.get("POSSAX_PERF_DIR", "perf")
+SPANS_FILE = "spans.jsonl"
+METRICS_FILE = "possax.prom"
+SAMPLE_INTERVAL = 0.005  # seconds
+
+_lock = threading.Lock()
+_totals: dict[str, Counter] = {}  # span name → summed measures across reruns
+_last: dict[str, float] = {}  # span name → seconds of its latest run
+
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    """Bytes of df as Arrow, the format st.dataframe/st.data_editor send."""
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False).nbytes
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return int(df.memory_usage(deep=True, index=False).sum())
+
+
+@dataclass
+class Span:
+    name: str
+    seconds: float = 0.0
+    rows_in: Optional[int] = None
+    rows_out: Optional[int] = None
+    payload_bytes: Optional[int] = None
+
+    def output(self, df: pd.DataFrame, chart: bool = False) -> None:
+        """Record df as what this section shows (chart data is sent as JSON)."""
+        self.rows_out = (self.rows_out or 0) + len(df)
+        self.payload_bytes = (self.payload_bytes or 0) + (payload_bytes(df) if chart else frame_bytes(df))
+
+
+class Rerun:
+    """Spans of one dashboard rerun (scope "full", or the name of a fragment rerunning alone)."""
+
+    def __init__(self, backend: str = "", scope: str = "full"):
+        self.id = uuid.uuid4().hex[:12]
+        self.backend = backend
+        self.scope = scope
+        self.started = time.time()
+        self.spans: list[Span] = []
+
+    @contextmanager
+    def span(self, name: str, rows_in: Optional[int] = None):
+        sp = Span(name, rows_in=rows_in)
+        start = time.perf_counter()
+        try:
+            yield sp
+        finally:
+            sp.seconds = time.perf_counter() - start
+            self.spans.append(sp)
+
+    def frame(self) -> pd.DataFrame:
+        df = pd.DataFrame([asdict(sp) for sp in self.spans], columns=list(Span.__dataclass_fields__))
+        df["ms"] = (df["seconds"] * 1e3).round(2)
+        df = df.astype({"rows_in": "Int64", "rows_out": "Int64", "payload_bytes": "Int64"})
+        return df[["name", "ms", "rows_in", "rows_out", "payload_bytes"]]
+
+    def export(self, path: str = PERF_DIR) -> None:
+        """Append the spans to spans.jsonl and rewrite the Prometheus file."""
+        os.makedirs(path, exist_ok=True)
+        base = {"rerun": self.id, "scope": self.scope, "backend": self.backend, "ts": self.started}
+        with _lock:
+            with open(os.path.join(path, SPANS_FILE), "a") as f:
+                for sp in self.spans:
+                    f.write(json.dumps({**base, **asdict(sp)}) + "\n")
+            for sp in self.spans:
+                totals = _totals.setdefault(sp.name, Counter())
+                totals.update({
+                    "runs": 1, "seconds": sp.seconds,
+                    "rows_out": sp.rows_out or 0, "payload_bytes": sp.payload_bytes or 0,
+                })
+                _last[sp.name] = sp.seconds
+            text = prometheus_text()
+        tmp = os.path.join(path, f".{METRICS_FILE}.{os.getpid()}")
+        with open(tmp, "w") as f:
+            f.write(text)
+        os.replace(tmp, os.path.join(path, METRICS_FILE))
+
+
+def prometheus_text() -> str:
+    """Process-wide span totals in the Prometheus text exposition format."""
+    metrics = [
+        ("possax_span_runs_total", "counter", "Reruns that executed the span.", "runs"),
+        ("possax_span_seconds_total", "counter", "Wall time spent in the span.", "seconds"),
+        ("possax_span_rows_out_total", "counter", "Rows the span sent to the page.", "rows_out"),
+        ("possax_span_payload_bytes_total", "counter", "Serialized bytes the span sent to the page.", "payload_bytes"),
+    ]
+    lines = []
+    for metric, kind, help_text, key in metrics:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        lines += [f'{metric}{{span="{name}"}} {totals[key]:g}' for name, totals in sorted(_totals.items())]
+    lines += ["# HELP possax_span_last_seconds Wall time of the latest run of the span.", "# TYPE possax_span_last_seconds gauge"]
+    lines += [f'possax_span_last_seconds{{span="{name}"}} {seconds:g}' for name, seconds in sorted(_last.items())]
+    return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack at a fixed interval from a background thread."""
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks: Counter = Counter()  # collapsed stack ("outer;...;inner") → samples
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="perf-sampler", daemon=True)
+
+    def start(self) -> "SamplingProfiler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def top(self, n: int = 20) -> pd.DataFrame:
+        """Functions by samples where they were running (self) and on the stack (total)."""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = [f.rsplit(":", 1)[0] for f in stack.split(";")]
+            own[frames[-1]] += count
+            for f in set(frames):
+                total[f] += count
+        samples = max(self.samples, 1)
+        df = pd.DataFrame({"function": list(total), "total": list(total.values())})
+        df["self"] = df["function"].map(own).fillna(0).astype(int)
+        df["self %"] = (100 * df["self"] / samples).round(1)
+        df["total %"] = (100 * df["total"] / samples).round(1)
+        return df.sort_values(["self", "total"], ascending=False).head(n).reset_index(drop=True)
+
+    def write(self, path: str = PERF_DIR, name: Optional[str] = None) -> str:
+        """Write collapsed stacks (flamegraph.pl / speedscope input); returns the file path."""
+        os.makedirs(path, exist_ok=True)
+        file = os.path.join(path, name or f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        with open(file, "w") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+        return file
@@ -0,0 +1,148 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Callable, ContextManager, Optional
+
+import cohorts
+from chart_data import fit_budget
+from filters import FilterState
+from paging import TablePage
+
+# -------------------------
+# Headless dashboard pipeline
+# -------------------------
+# The computations one dashboard rerun performs for a FilterState, in page
+# order and without Streamlit: filter → metrics → trends → leaderboards →
+# pies → map → tables → expiry → owners → cohorts. Tables are their first page in the
+# default sort, charts are fitted to the point budget, as on screen.
+# A stage hook (a context manager factory taking the stage name) wraps every
+# stage, which is how benchmarks and profilers time them.
+#
+# Given the filtered frames the stages are independent, so with workers > 1
+# they run on a shared thread pool: the frames are filtered once in the calling
+# thread and handed to the workers by reference (threads, not processes, so
+# nothing is pickled). NumPy, pandas and SQLite release the GIL in their
+# inner loops, which is where the stages spend their time.
+STAGES = ["filter", "metrics", "trends", "leaderboards", "pies", "map", "tables", "expiry", "owners", "cohorts"]
+LEADERBOARD_SIZE = 10
+PAGE_LIMIT = 50
+AFTER = {"owners": "expiry"}  # runs on the same worker, reusing the expiring stores
+WORKERS = int(os.environ.get("POSSAX_WORKERS", min(os.cpu_count() or 1, 8)))
+
+_pools: dict[int, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def prefilter(backend, state: FilterState):
+    """Filtered (users, stores, subscriptions) of backends that filter once per rerun; None for SQL."""
+    filtered = getattr(backend, "filtered", None)
+    return filtered(state) if filtered else None
+
+
+def pool(workers: int = WORKERS) -> ThreadPoolExecutor:
+    """The process-wide pool of that many worker threads, started on first use."""
+    with _pools_lock:
+        if workers not in _pools:
+            _pools[workers] = ThreadPoolExecutor(workers, thread_name_prefix="possax-panel")
+        return _pools[workers]
+
+
+def in_worker(backend, fn: Callable) -> Callable:
+    """fn, to run on a worker thread with the calling thread's memoized frames."""
+    memos = backend.memos() if hasattr(backend, "memos") else None
+
+    def run():
+        if memos:
+            backend.adopt_memos(memos)
+        return fn()
+    return run
+
+
+def submit(backend, fn: Callable, workers: int = WORKERS) -> Future:
+    """Future of fn() on the worker pool (computed inline when workers <= 1)."""
+    if workers > 1:
+        return pool(workers).submit(in_worker(backend, fn))
+    future = Future()
+    try:
+        future.set_result(fn())
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def background(backend, fn: Callable) -> Future:
+    """Future of fn() on the worker pool, never inline (approximate mode refines there)."""
+    return pool(max(WORKERS, 1)).submit(in_worker(backend, fn))
+
+
+def _stages(backend, state: FilterState, today: datetime) -> dict[str, Callable]:
+    return {
+        "filter": lambda: prefilter(backend, state),
+        "metrics": lambda: backend.key_metrics(state),
+        "trends": lambda: {
+            "user_sub_trend": fit_budget(backend.user_sub_trend(state), "Month", "UserCount", "UserSubscriptionType")[0],
+            "store_trend": fit_budget(backend.store_trend(state), "Month", "StoreCount")[0],
+            "user_trend": fit_budget(backend.user_trend(state), "Month", "UserCount")[0],
+        },
+        "leaderboards": lambda: {
+            "top_active": backend.top_active(state, LEADERBOARD_SIZE),
+            "top_cities": backend.top_cities(state, LEADERBOARD_SIZE),
+            "top_refs": backend.top_refs(state, LEADERBOARD_SIZE),
+        },
+        "pies": lambda: {
+            "store_type_counts": backend.store_type_counts(state),
+            "role_counts": backend.role_counts(state),
+        },
+        "map": lambda: backend.user_map(state),
+        "tables": lambda: {
+            "users": backend.users_page(state, TablePage("UserID", limit=PAGE_LIMIT)),
+            "stores": backend.stores_page(state, TablePage("DaysToExpiry", limit=PAGE_LIMIT), today),
+        },
+        "expiry": lambda: {
+            "expiring": backend.expiring_page(state, TablePage("DaysToExpiry", limit=PAGE_LIMIT), today),
+            "expiring_trend": fit_budget(backend.expiring_trend(state, today), "EndDateOnly", "Count", "SubscriptionType")[0],
+        },
+        "owners": lambda: backend.affected_owners(state, today),
+        "cohorts": lambda: {
+            "user_retention": backend.user_retention(state, today),
+            "store_retention": backend.store_retention(state, today),
+            **{f"{across}_transitions": backend.tier_transitions(state, across) for across in cohorts.TRANSITIONS},
+        },
+    }
+
+
+def run(
+    backend,
+    state: FilterState,
+    today: Optional[datetime] = None,
+    stage: Callable[[str], ContextManager] = lambda name: nullcontext(),
+    stages: Optional[list] = None,
+    workers: int = 1,
+) -> dict:
+    """Results of every stage (or of the named stages, in STAGES order) for one FilterState."""
+    todo = _stages(backend, state, today or datetime.now())
+    names = [name for name in STAGES if stages is None or name in stages]
+
+    def timed(name: str):
+        with stage(name):
+            return todo[name]()
+
+    if workers <= 1:
+        return {name: timed(name) for name in names}
+    # Filter in this thread first: every other stage reads its frames
+    results = {"filter": timed("filter")} if "filter" in names else {}
+    if "filter" not in names:
+        prefilter(backend, state)
+    chains = {}
+    for name in names:
+        if name != "filter":
+            chains.setdefault(AFTER.get(name) if AFTER.get(name) in names else name, []).append(name)
+    futures = [
+        submit(backend, lambda chain=chain: {name: timed(name) for name in chain}, workers)
+        for chain in chains.values()
+    ]
+    for future in futures:
+        results.update(future.result())
+    return {name: results[name] for name in names}
@@ -0,0 +1,166 @@
+import logging
+import os
+import shutil
+import threading
+import weakref
+from datetime import datetime
+from typing import Callable, Optional
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+import snapshot
+
+# -------------------------
+# Background data refresh
+# -------------------------
+# The dashboard reads one Dataset (a loaded snapshot version) per rerun:
+# Refresher.current is taken once at the top of the rerun, so a refresh that
+# lands mid-render doesn't change what that rerun sees, and the next rerun
+# picks up the new version. Refreshing happens on a background thread: it
+# rebuilds a snapshot in its own versioned directory (from the generator, or
+# from <source>/<table>.parquet when a source directory is set and its files
+# changed), publishes it as the snapshot's current version, loads it and
+# swaps the reference. Objects derived from the data (backend, indexes,
+# rollup) hang off the Dataset, so they are swapped with it. A restarted
+# process starts from the last published version, and the source stamp
+# recorded in its manifest keeps the first refresh from rebuilding unchanged
+# source files.
+#
+# A version stays in memory while anything still holds it. At most MAX_LIVE
+# versions may be alive: when the older ones are still in use (a long rerun,
+# a fragment of an open page), the refresh waits for the next interval.
+# Directories of versions nobody holds any more are deleted.
+REFRESH_SECONDS = float(os.environ.get("POSSAX_REFRESH_SECONDS", 0))  # 0 = never
+SOURCE_DIR = os.environ.get("POSSAX_SOURCE_DIR")
+MAX_LIVE = 2
+
+log = logging.getLogger(__name__)
+
+
+class Dataset:
+    """One loaded snapshot version and the objects built from it."""
+
+    def __init__(self, path: str):
+        self.path = snapshot.resolve(path)  # pinned: later publishes don't move it
+        self.version = snapshot.manifest(self.path)["version"]
+        self.loaded_at = datetime.now()
+        self.frames: tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame] = snapshot.load(self.path)
+        self._resources: dict = {}
+        self._lock = threading.Lock()
+
+    def has(self, name: str) -> bool:
+        return name in self._resources
+
+    def resource(self, name: str, build: Callable):
+        """build(), once per version (the backend, indexes, ...)."""
+        with self._lock:
+            if name not in self._resources:
+                self._resources[name] = build()
+            return self._resources[name]
+
+
+def _discard(root: str, path: str) -> None:
+    if snapshot.resolve(root) != path:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _source_stamp(source: str) -> tuple:
+    return tuple(os.stat(os.path.join(source, f"{name}.parquet")).st_mtime_ns for name in snapshot.TABLES)
+
+
+class Refresher:
+    """Holds the current Dataset and replaces it with a rebuilt one every interval."""
+
+    def __init__(
+        self,
+        path: str = snapshot.SNAPSHOT_DIR,
+        source: Optional[str] = SOURCE_DIR,
+        interval: float = REFRESH_SECONDS,
+        max_live: int = MAX_LIVE,
+    ):
+        self.path = path
+        self.source = source
+        self.interval = interval
+        self.max_live = max_live
+        self.refreshes = self.skipped = 0
+        self.last_error: Optional[BaseException] = None
+        self._live: "weakref.WeakValueDictionary[str, Dataset]" = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+        if not snapshot.exists(path):
+            self._build(self._source_stamp())
+        self._current = self._adopt(Dataset(path))
+        self._stamp = self._built_from(self._current)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def current(self) -> Dataset:
+        return self._current
+
+    def get(self, version: Optional[str]) -> Dataset:
+        """The dataset of version while it is alive, else the current one."""
+        return self._live.get(version) or self._current
+
+    @property
+    def live_versions(self) -> list[str]:
+        return list(self._live)
+
+    def start(self) -> "Refresher":
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="data-refresher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:  # keep serving the current version
+                self.last_error = e
+                log.exception("Data refresh failed")
+
+    def _adopt(self, dataset: Dataset) -> Dataset:
+        self._live[dataset.version] = dataset
+        # the version's files go when the last reference to it does, unless
+        # it is still the published one
+        weakref.finalize(dataset, _discard, self.path, dataset.path)
+        return dataset
+
+    def _source_stamp(self) -> Optional[tuple]:
+        return _source_stamp(self.source) if self.source else None
+
+    def _built_from(self, dataset: Dataset) -> Optional[tuple]:
+        # The source stamp the dataset was built from, if it came from this source
+        meta = snapshot.manifest(dataset.path)["meta"]
+        if self.source and meta.get("source") == os.path.abspath(self.source) and "source_stamp" in meta:
+            return tuple(meta["source_stamp"])
+        return None
+
+    def _build(self, stamp: Optional[tuple]) -> None:
+        if self.source:
+            tables = {name: pq.read_table(os.path.join(self.source, f"{name}.parquet")) for name in snapshot.TABLES}
+            snapshot.write_snapshot(tables, self.path, source=os.path.abspath(self.source), source_stamp=list(stamp))
+        else:
+            snapshot.build_snapshot(path=self.path, seed=42)
+
+    def refresh(self) -> Optional[Dataset]:
+        """Build, load and swap in a new version; None if skipped (unchanged source, too many live versions)."""
+        with self._lock:
+            stamp = self._source_stamp()
+            if self.source and stamp == self._stamp:
+                return None
+            if len(self._live) >= self.max_live:
+                self.skipped += 1
+                log.info("Refresh skipped: %d versions still in use", len(self._live))
+                return None
+            self._build(stamp)
+            dataset = self._adopt(Dataset(self.path))
+            self._current = dataset  # the swap: one reference assignment
+            self._stamp = stamp
+            self.refreshes += 1
+            return dataset
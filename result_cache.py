@@ -0,0 +1,124 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Hashable
+
+import numpy as np
+import pandas as pd
+
+# -------------------------
+# Shared result cache
+# -------------------------
+# One LRU per server process for the filtered frames and panel results every
+# session computes. Keys are (what, FilterState, ...): FilterState is already
+# normalized (sorted city/sub/role tuples, timestamps, window as a sorted
+# tuple), so equal filter settings share entries. The cache belongs to one
+# dataset version, (snapshot version, ledger Seq): validate() with a new
+# version drops every entry. Eviction is by total bytes, least recently used
+# first. Concurrent misses of one key compute it once; the others wait.
+CACHE_BYTES = int(float(os.environ.get("POSSAX_CACHE_MB", 512)) * 2**20)
+
+
+def nbytes(value) -> int:
+    """Approximate memory held by a cached value (frames, arrays and containers of them)."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(deep=True)))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(nbytes(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """Byte-bounded LRU of computed results for one dataset version, shared across sessions."""
+
+    def __init__(self, max_bytes: int = CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.version = None
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+        self._entries: OrderedDict[Hashable, tuple[object, int]] = OrderedDict()  # key → (value, bytes)
+        self._pending: dict[Hashable, Future] = {}
+        self._generation = 0  # bumped by every invalidation
+        self._lock = threading.Lock()
+
+    def validate(self, version) -> bool:
+        """Make version current, dropping every entry if it changed; True if it did."""
+        with self._lock:
+            if version == self.version:
+                return False
+            if self.version is not None:
+                self.invalidations += 1
+            self.version = version
+            self._drop()
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._drop()
+
+    def _drop(self) -> None:
+        self._entries.clear()
+        self._pending.clear()
+        self.bytes = 0
+        self._generation += 1
+
+    def get(self, key: Hashable, compute: Callable):
+        """Cached value of key, or compute() stored under it."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            pending = self._pending.get(key)
+            if pending is None:
+                self.misses += 1
+                self._pending[key] = owner = Future()
+                generation = self._generation
+        if pending is not None:
+            # Another session is computing it
+            with self._lock:
+                self.hits += 1
+            return pending.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                self._pending.pop(key, None)
+            owner.set_exception(e)
+            raise
+        size = nbytes(value)
+        with self._lock:
+            # Not stored if invalidated meanwhile (it belongs to the old
+            # version) or too big to ever fit
+            if generation == self._generation:
+                self._pending.pop(key, None)
+                if size <= self.max_bytes:
+                    self._entries[key] = (value, size)
+                    self.bytes += size
+                    while self.bytes > self.max_bytes:
+                        _, (_, dropped) = self._entries.popitem(last=False)
+                        self.bytes -= dropped
+                        self.evictions += 1
+        owner.set_result(value)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
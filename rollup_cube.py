@@ -0,0 +1,244 @@
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from filters import FilterState
+
+# -------------------------
+# Rollup cubes
+# -------------------------
+# Dense count/sum arrays over the filter dimensions, built once and updated in
+# place as rows arrive. Their size depends on the number of distinct
+# dimension values, not on the number of rows, so Key Metrics, trends and pies
+# cost the same at 1k or 10M rows.
+#
+# The time dimension is the CreatedAt day rather than the month: the date
+# filter is day-aligned and must stay exact, and months are a rollup of days.
+# Day ranges are inclusive of rows exactly at the end midnight (the filter
+# compares CreatedAt <= end), hence the AtMidnight dimension.
+USER_DIMS = ["Day", "AtMidnight", "City", "Role", "UserSubscriptionType"]
+STORE_DIMS = ["Day", "AtMidnight", "City", "SubscriptionType", "StoreType"]
+PAID_TYPES = ["Pro", "Basic"]
+
+
+class RollupCube:
+    """Dense N-d cube of int64 measures, keyed by the labels of each dimension."""
+
+    def __init__(self, dims: list, measures: list):
+        self.dims = list(dims)
+        self.measures = list(measures)
+        self.labels = {d: np.empty(0, dtype=object) for d in self.dims}
+        self._codes = {d: {} for d in self.dims}
+        self.values = {m: np.zeros((0,) * len(self.dims), dtype=np.int64) for m in self.measures}
+
+    @property
+    def shape(self) -> tuple:
+        return tuple(len(self.labels[d]) for d in self.dims)
+
+    def _encode(self, dim: str, values) -> np.ndarray:
+        inverse, uniq = pd.factorize(np.asarray(values))
+        uniq = np.asarray(uniq)
+        codes = self._codes[dim]
+        new = [v for v in uniq.tolist() if v not in codes]
+        if new:
+            for v in new:
+                codes[v] = len(codes)
+            self.labels[dim] = np.concatenate([self.labels[dim], np.array(new, dtype=object)])
+            axis = self.dims.index(dim)
+            for m, arr in self.values.items():
+                pad = list(arr.shape)
+                pad[axis] = len(new)
+                self.values[m] = np.concatenate([arr, np.zeros(pad, dtype=np.int64)], axis=axis)
+        return np.array([codes[v] for v in uniq.tolist()], dtype=np.intp)[inverse]
+
+    def add(self, coords: dict, measures: dict, sign: int = 1) -> None:
+        """Add (or with sign=-1 remove) rows given per-dimension labels and per-measure values."""
+        codes = [self._encode(d, coords[d]) for d in self.dims]
+        if not len(codes[0]):
+            return
+        shape = self.shape
+        flat = np.ravel_multi_index(codes, shape)
+        size = int(np.prod(shape))
+        for m, v in measures.items():
+            v = np.broadcast_to(np.asarray(v, dtype=np.int64), flat.shape) * sign
+            if len(flat) >= size:
+                self.values[m] += np.bincount(flat, weights=v, minlength=size).astype(np.int64).reshape(shape)
+            else:
+                np.add.at(self.values[m].reshape(-1), flat, v)
+
+    def reduce(self, measure: str, where: dict, by: list) -> tuple[np.ndarray, list]:
+        """Sum measure over cells whose labels pass where (dim → bool mask over labels).
+
+        Returns the array over the by dimensions and their selected labels.
+        """
+        arr = self.values[measure]
+        labels = []
+        for axis, dim in enumerate(self.dims):
+            if dim in where:
+                arr = np.compress(where[dim], arr, axis=axis)
+        keep = [self.dims.index(d) for d in by]
+        arr = arr.sum(axis=tuple(i for i in range(len(self.dims)) if i not in keep))
+        for dim in by:
+            lab = self.labels[dim]
+            labels.append(lab[where[dim]] if dim in where else lab)
+        # sum() keeps the remaining axes in cube order; put them in the order of by
+        in_cube_order = sorted(keep)
+        return np.transpose(arr, [in_cube_order.index(k) for k in keep]), labels
+
+    def memory_bytes(self) -> int:
+        return sum(a.nbytes for a in self.values.values())
+
+
+# -------------------------
+# Dimension helpers
+# -------------------------
+def _days(col: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    ts = col.to_numpy().astype("datetime64[us]")
+    day = ts.astype("datetime64[D]")
+    return day.astype(np.int64), ts == day
+
+
+def _day(ts) -> int:
+    return int(np.datetime64(pd.Timestamp(ts).to_datetime64(), "D").astype(np.int64))
+
+
+def _isin(cube: RollupCube, dim: str, values: tuple) -> Optional[np.ndarray]:
+    if not values:
+        return None
+    return np.isin(cube.labels[dim], np.array(values, dtype=object))
+
+
+def _date_parts(cube: RollupCube, state: FilterState) -> list:
+    # Rows with start <= CreatedAt <= end, start/end being midnights: every row
+    # of days [start, end) plus the rows exactly at the end midnight
+    if not state.date_range:
+        return [{}]
+    lo, hi = (_day(d) for d in state.date_range)
+    days = cube.labels["Day"].astype(np.int64)
+    at_midnight = cube.labels["AtMidnight"].astype(bool)
+    return [
+        {"Day": (days >= lo) & (days < hi)},
+        {"Day": (days == hi) & (days >= lo), "AtMidnight": at_midnight},
+    ]
+
+
+def _frame(arr: np.ndarray, labels: list, by: list, name: str) -> pd.DataFrame:
+    if not by:
+        return pd.DataFrame({name: [int(arr)]})
+    grids = np.meshgrid(*labels, indexing="ij") if arr.size else [np.empty(0, object)] * len(by)
+    df = pd.DataFrame({d: g.ravel() for d, g in zip(by, grids)})
+    df[name] = arr.ravel()
+    return df
+
+
+class DatasetCubes:
+    """Users and stores cubes for one dataset, answering the aggregate panels."""
+
+    def __init__(self):
+        self.users = RollupCube(USER_DIMS, ["Users"])
+        self.stores = RollupCube(STORE_DIMS, ["Stores", "Income"])
+        # Cell coordinates and paid income of every store, so later
+        # subscriptions land in the right cell
+        self._store_cells = pd.DataFrame(columns=STORE_DIMS + ["Income"])
+
+    @classmethod
+    def build(cls, df_users: pd.DataFrame, df_stores: pd.DataFrame, df_subscriptions: pd.DataFrame) -> "DatasetCubes":
+        cubes = cls()
+        cubes.add_users(df_users)
+        cubes.add_stores(df_stores)
+        cubes.add_subscriptions(df_subscriptions)
+        return cubes
+
+    # ---------- Incremental updates ----------
+    def add_users(self, df: pd.DataFrame, sign: int = 1) -> None:
+        day, midnight = _days(df["CreatedAt"])
+        coords = {"Day": day, "AtMidnight": midnight}
+        coords.update({d: df[d].to_numpy() for d in USER_DIMS[2:]})
+        self.users.add(coords, {"Users": 1}, sign)
+
+    def add_stores(self, df: pd.DataFrame) -> None:
+        day, midnight = _days(df["CreatedAt"])
+        cells = pd.DataFrame({"Day": day, "AtMidnight": midnight}, index=df["StoreID"].to_numpy())
+        for d in STORE_DIMS[2:]:
+            cells[d] = df[d].to_numpy()
+        cells["Income"] = 0
+        self.stores.add({d: cells[d].to_numpy() for d in STORE_DIMS}, {"Stores": 1})
+        self._store_cells = pd.concat([self._store_cells, cells]) if len(self._store_cells) else cells
+
+    def add_subscriptions(self, df: pd.DataFrame, sign: int = 1) -> None:
+        # Income counts Pro/Basic payments of stores the cube knows about
+        paid = df[df["Type"].isin(PAID_TYPES)]
+        amount = paid.groupby("StoreID")["AmountPaid"].sum()
+        amount = amount[amount.index.isin(self._store_cells.index)]
+        if amount.empty:
+            return
+        cells = self._store_cells.loc[amount.index]
+        self.stores.add({d: cells[d].to_numpy() for d in STORE_DIMS}, {"Income": amount.to_numpy()}, sign)
+        self._store_cells.loc[amount.index, "Income"] += sign * amount.to_numpy()
+
+    def set_store_types(self, store_ids, sub_types) -> None:
+        """Move stores, with the income counted so far, to the cells of their new SubscriptionType."""
+        new = pd.Series(np.asarray(sub_types, dtype=object), index=np.asarray(store_ids, dtype=np.int64))
+        new = new[new.index.isin(self._store_cells.index)]
+        cells = self._store_cells.loc[new.index]
+        moved = cells["SubscriptionType"].to_numpy() != new.to_numpy()
+        cells, new = cells[moved], new[moved]
+        if not len(cells):
+            return
+        measures = {"Stores": 1, "Income": cells["Income"].to_numpy(dtype=np.int64)}
+        self.stores.add({d: cells[d].to_numpy() for d in STORE_DIMS}, measures, -1)
+        cells = cells.assign(SubscriptionType=new.to_numpy())
+        self.stores.add({d: cells[d].to_numpy() for d in STORE_DIMS}, measures)
+        self._store_cells.loc[cells.index, "SubscriptionType"] = new.to_numpy()
+
+    # ---------- Queries ----------
+    def _users_parts(self, state: FilterState) -> list:
+        extra = {"City": _isin(self.users, "City", state.cities), "Role": _isin(self.users, "Role", state.roles)}
+        return [{**part, **{k: v for k, v in extra.items() if v is not None}} for part in _date_parts(self.users, state)]
+
+    def _stores_parts(self, state: FilterState) -> list:
+        sub = _isin(self.stores, "SubscriptionType", state.sub_types)
+        return [{**part, **({"SubscriptionType": sub} if sub is not None else {})} for part in _date_parts(self.stores, state)]
+
+    def _series(self, cube: RollupCube, parts: list, measure: str, by: list, name: str) -> pd.DataFrame:
+        frames = [_frame(*cube.reduce(measure, where, by), by, name) for where in parts]
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        if "Day" in by:
+            df["Month"] = pd.to_datetime(df["Day"].astype(np.int64).to_numpy().astype("datetime64[D]").astype("datetime64[M]"))
+            by = ["Month" if d == "Day" else d for d in by]
+        df = df.groupby(by, sort=True)[name].sum().reset_index()
+        return df[df[name] > 0].reset_index(drop=True)
+
+    def _total(self, cube: RollupCube, parts: list, measure: str, where: Optional[dict] = None) -> int:
+        total = 0
+        for part in parts:
+            total += int(cube.reduce(measure, {**part, **(where or {})}, [])[0])
+        return total
+
+    def key_metrics(self, state: FilterState) -> dict:
+        users, stores = self._users_parts(state), self._stores_parts(state)
+        by_tier = self._series(self.stores, stores, "Stores", ["SubscriptionType"], "Count")
+        by_tier = dict(zip(by_tier["SubscriptionType"], by_tier["Count"]))
+        return {
+            "total_users": self._total(self.users, users, "Users"),
+            "total_stores": self._total(self.stores, stores, "Stores"),
+            "total_pro_stores": int(by_tier.get("Pro", 0)),
+            "total_basic_stores": int(by_tier.get("Basic", 0)),
+            "total_income": self._total(self.stores, stores, "Income"),
+        }
+
+    def user_sub_trend(self, state: FilterState) -> pd.DataFrame:
+        return self._series(self.users, self._users_parts(state), "Users", ["Day", "UserSubscriptionType"], "UserCount")
+
+    def store_trend(self, state: FilterState) -> pd.DataFrame:
+        return self._series(self.stores, self._stores_parts(state), "Stores", ["Day"], "StoreCount")
+
+    def user_trend(self, state: FilterState) -> pd.DataFrame:
+        return self._series(self.users, self._users_parts(state), "Users", ["Day"], "UserCount")
+
+    def store_type_counts(self, state: FilterState) -> pd.DataFrame:
+        return self._series(self.stores, self._stores_parts(state), "Stores", ["SubscriptionType"], "Count")
+
+    def role_counts(self, state: FilterState) -> pd.DataFrame:
+        return self._series(self.users, self._users_parts(state), "Users", ["Role"], "Count")
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# -------------------------
+# Type-ahead search over users / stores
+# -------------------------
+# Every searchable value (id, name and each of its words, email, phone with
+# and without "+") is lower-cased into one sorted array of fixed-width UTF-8
+# byte strings with a parallel id array. A query is a prefix range found by
+# np.searchsorted, so a keystroke costs O(log n) plus the N matches returned. Labels shown in the
+# pickers come from an id-indexed Arrow string array, not per-option scans.
+DEFAULT_LIMIT = 20
+
+
+def _text(col: pd.Series) -> pa.StringArray:
+    return pa.array(col.astype(object).where(col.notna(), None), pa.string())
+
+
+def _fixed_width(keys: pa.StringArray) -> np.ndarray:
+    # Zero-padded "S<width>" copy of the (non-empty) UTF-8 keys, built one
+    # byte column at a time: numpy compares these bytewise, the order Arrow
+    # sorted them in
+    if len(keys) == 0:
+        return np.zeros(0, dtype="S1")
+    offsets = np.frombuffer(keys.buffers()[1], dtype=np.int32)[keys.offset:keys.offset + len(keys) + 1]
+    data = np.frombuffer(keys.buffers()[2], dtype=np.uint8)
+    starts, ends = offsets[:-1].astype(np.int64), offsets[1:]
+    width = int((ends - starts).max())
+    columns = np.zeros((width, len(keys)), dtype=np.uint8)
+    for j in range(width):
+        at = starts + j
+        np.multiply(data[np.minimum(at, len(data) - 1)], at < ends, out=columns[j])
+    return np.ascontiguousarray(columns.T).view(f"S{width}").ravel()
+
+
+class SearchIndex:
+    """Prefix search over several text columns of one table, keyed by an integer id."""
+
+    def __init__(self, ids: pd.Series, fields: list[pd.Series], label: pd.Series):
+        ids = ids.to_numpy(dtype=np.int64)
+        keys, owners = [pa.array(ids.astype(str))], [ids]
+        for field in fields:
+            keys.append(pc.utf8_lower(_text(field)))
+            owners.append(ids)
+            # later words of multi-word values ("Budi Santoso" → "santoso")
+            words = pc.split_pattern(keys[-1], " ")
+            counts = pc.list_value_length(words).fill_null(0).to_numpy()
+            if counts.max(initial=0) > 1:
+                first = np.r_[0, np.cumsum(counts)[:-1]]
+                rest = np.ones(int(counts.sum()), dtype=bool)
+                rest[first[counts > 0]] = False
+                keys.append(pc.list_flatten(words).filter(pa.array(rest)))
+                owners.append(np.repeat(ids, counts)[rest])
+        keys = pa.chunked_array(keys).combine_chunks()
+        owners = np.concatenate(owners)
+        valid = pc.and_kleene(pc.is_valid(keys), pc.not_equal(keys, "")).to_numpy(zero_copy_only=False)
+        keys, owners = keys.filter(pa.array(valid)), owners[valid]
+        order = pc.sort_indices(keys).to_numpy()
+        self.keys = _fixed_width(keys.take(pa.array(order)))
+        self.ids = owners[order]
+
+        # id → "id — label"
+        size = int(ids.max(initial=0)) + 1
+        pos = np.full(size, -1, dtype=np.int64)
+        pos[ids] = np.arange(len(ids))
+        text = pc.binary_join_element_wise(pa.array(ids.astype(str)), _text(label), " — ")
+        self.labels = text.take(pa.array(pos, mask=pos < 0))
+
+    @classmethod
+    def users(cls, df_users: pd.DataFrame) -> "SearchIndex":
+        phone = df_users["Phone"].astype(str)
+        return cls(df_users["UserID"], [df_users["Name"], df_users["Email"], phone, phone.str.lstrip("+")], df_users["Name"])
+
+    @classmethod
+    def stores(cls, df_stores: pd.DataFrame) -> "SearchIndex":
+        return cls(df_stores["StoreID"], [df_stores["StoreName"]], df_stores["StoreName"])
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT) -> list[int]:
+        """Up to limit ids whose id or any indexed value starts with query (exact id first)."""
+        query = (query or "").strip().lower()
+        if not query:
+            return []
+        # Keys starting with prefix sort in [prefix, prefix + 0xff) (no UTF-8
+        # byte is 0xff). A prefix as wide as the keys only matches exactly,
+        # and a wider one never (numpy would truncate it to the key width)
+        prefix, width = query.encode(), self.keys.itemsize
+        if len(prefix) < width:
+            lo, hi = np.searchsorted(self.keys, [prefix, prefix + b"\xff"]).tolist()
+        elif len(prefix) == width:
+            lo, hi = (int(np.searchsorted(self.keys, prefix, side)) for side in ("left", "right"))
+        else:
+            lo = hi = 0
+        found = []
+        if query.isdigit() and self.label(int(query)) is not None:
+            found.append(int(query))
+        # widen the window until limit distinct ids (a user matches via several keys)
+        step = limit
+        while lo < hi and len(found) < limit:
+            for uid in self.ids[lo:min(hi, lo + step)].tolist():
+                if uid not in found:
+                    found.append(uid)
+                    if len(found) == limit:
+                        break
+            lo += step
+            step *= 2
+        return found
+
+    def label(self, id_: int):
+        if 0 <= id_ < len(self.labels):
+            return self.labels[id_].as_py()
+        return None
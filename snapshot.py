@@ -0,0 +1,223 @@
+import argparse
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import uuid
+from datetime import datetime
+from typing import Callable, Iterable, Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+
+from compact import arrow_types
+
+# -------------------------
+# Layout
+# -------------------------
+# <dir>/CURRENT                      name of the published version, replaced
+#                                    atomically (os.replace) on each write
+# <dir>/versions/<version>/          one directory per published version:
+#   manifest.json                    version, row counts, generator parameters
+#   <table>.arrow                    uncompressed Arrow IPC, one record batch, for
+#                                    memory-mapped zero-copy loads of the full table
+#   cache/<name>.pkl                 structures derived from this version (rollup
+#                                    cubes, leaderboards), so a new process loads
+#                                    them instead of rebuilding, see cached()
+#
+# Every reader goes through resolve(), which maps <dir> to the directory of
+# the published version (and leaves a version directory as it is). A version
+# directory is never modified once published, so a reader holding one keeps
+# a consistent snapshot while newer versions are published next to it.
+SNAPSHOT_DIR = os.environ.get("POSSAX_SNAPSHOT_DIR", "snapshot")
+TABLES = ("users", "stores", "subscriptions")
+MANIFEST = "manifest.json"
+POINTER = "CURRENT"
+VERSIONS_DIR = "versions"
+KEEP_VERSIONS = 3  # published versions kept on disk, the current one included
+CACHE_DIR = "cache"
+CACHE_FORMAT = 1  # bump when a cached structure's layout changes
+
+Frame = Union[pd.DataFrame, pa.Table]
+Frames = Union[Frame, Iterable[Frame]]
+
+
+def _to_arrow(frames: Frames) -> pa.Table:
+    if isinstance(frames, (pd.DataFrame, pa.Table)):
+        frames = [frames]
+    return pa.concat_tables(
+        f if isinstance(f, pa.Table) else pa.Table.from_pandas(f, preserve_index=False)
+        for f in frames
+    )
+
+
+def _file(path: str, name: str, ext: str) -> str:
+    return os.path.join(path, f"{name}.{ext}")
+
+
+# -------------------------
+# Write
+# -------------------------
+def write_snapshot(frames: dict[str, Frames], path: str = SNAPSHOT_DIR, **meta) -> dict:
+    """Write users/stores/subscriptions frames (or lists of chunks) as a new version under path and return the manifest.
+
+    The version is written to a temp directory, renamed to
+    versions/<version> and only then published by replacing the CURRENT
+    pointer, so readers see either the previous version or the new one,
+    never a half-written or missing snapshot.
+    """
+    versions = os.path.join(path, VERSIONS_DIR)
+    os.makedirs(versions, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".snapshot-", dir=versions)
+    manifest = {
+        "version": uuid.uuid4().hex,
+        "created_at": datetime.now().isoformat(),
+        "meta": meta,
+        "tables": {},
+    }
+    try:
+        for name in TABLES:
+            table = _to_arrow(frames[name]).combine_chunks()
+            with pa.ipc.new_file(_file(tmp, name, "arrow"), table.schema) as writer:
+                writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+            manifest["tables"][name] = {"rows": table.num_rows}
+        with open(os.path.join(tmp, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.rename(tmp, os.path.join(versions, manifest["version"]))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    _publish(path, manifest["version"])
+    _prune(path)
+    return manifest
+
+
+def _publish(path: str, version: str) -> None:
+    pointer = os.path.join(path, POINTER)
+    tmp = f"{pointer}.{uuid.uuid4().hex[:8]}"
+    with open(tmp, "w") as f:
+        f.write(version)
+    os.replace(tmp, pointer)
+
+
+def _prune(path: str) -> None:
+    # Keep the newest versions: a process that loaded one of them may still
+    # be reading it (or writing its cache)
+    versions = os.path.join(path, VERSIONS_DIR)
+    current = os.path.basename(resolve(path))
+    names = sorted(
+        (n for n in os.listdir(versions) if not n.startswith(".") and n != current),
+        key=lambda n: os.stat(os.path.join(versions, n)).st_mtime_ns,
+    )
+    for name in names[: max(len(names) - (KEEP_VERSIONS - 1), 0)]:
+        shutil.rmtree(os.path.join(versions, name), ignore_errors=True)
+
+
+def build_snapshot(
+    num_users: Optional[int] = None,
+    num_stores: Optional[int] = None,
+    path: str = SNAPSHOT_DIR,
+    **kwargs,
+) -> dict:
+    """Generate a mock dataset chunk by chunk and write it as a snapshot."""
+    from mock_data import NUM_STORES, NUM_USERS, iter_dataset
+
+    num_users = NUM_USERS if num_users is None else num_users
+    num_stores = NUM_STORES if num_stores is None else num_stores
+    parts = {name: [] for name in TABLES}
+    for name, frame in iter_dataset(num_users, num_stores, **kwargs):
+        # Arrow chunks are far more compact than the pandas frames they came from
+        parts[name].append(pa.Table.from_pandas(frame, preserve_index=False))
+    meta = {"num_users": num_users, "num_stores": num_stores}
+    meta.update({k: v for k, v in kwargs.items() if k != "now"})
+    return write_snapshot(parts, path, **meta)
+
+
+# -------------------------
+# Read
+# -------------------------
+def resolve(path: str = SNAPSHOT_DIR) -> str:
+    """The directory of the version published under path (path itself if it is a version directory)."""
+    try:
+        with open(os.path.join(path, POINTER)) as f:
+            return os.path.join(path, VERSIONS_DIR, f.read().strip())
+    except FileNotFoundError:
+        return path
+
+
+def exists(path: str = SNAPSHOT_DIR) -> bool:
+    return os.path.exists(os.path.join(resolve(path), MANIFEST))
+
+
+def manifest(path: str = SNAPSHOT_DIR) -> dict:
+    with open(os.path.join(resolve(path), MANIFEST)) as f:
+        return json.load(f)
+
+
+def read_table(name: str, path: str = SNAPSHOT_DIR) -> pd.DataFrame:
+    """Load a full table memory-mapped.
+
+    Fixed-width columns, categorical codes and the Stores CSR arrays are views
+    over the mapped file, so every process that loads the same snapshot
+    shares the same page-cache pages.
+    """
+    source = pa.memory_map(_file(resolve(path), name, "arrow"), "r")
+    return pa.ipc.open_file(source).read_all().to_pandas(split_blocks=True, types_mapper=arrow_types)
+
+
+def load(path: str = SNAPSHOT_DIR) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    path = resolve(path)  # all three tables from the same version
+    return tuple(read_table(name, path) for name in TABLES)
+
+
+def load_or_build(path: str = SNAPSHOT_DIR) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    if not exists(path):
+        build_snapshot(path=path, seed=42)
+    return load(path)
+
+
+def cached(name: str, build: Callable, path: str = SNAPSHOT_DIR):
+    """build(), stored under the snapshot and reused by every process while its version is unchanged."""
+    path = resolve(path)
+    key = (CACHE_FORMAT, manifest(path)["version"])
+    file = os.path.join(path, CACHE_DIR, f"{name}.pkl")
+    try:
+        with open(file, "rb") as f:
+            stored, value = pickle.load(f)
+        if stored == key:
+            return value
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+        pass
+    value = build()
+    try:
+        try:
+            os.mkdir(os.path.dirname(file))  # not makedirs: a pruned version stays gone
+        except FileExistsError:
+            pass
+        tmp = f"{file}.{uuid.uuid4().hex[:8]}"
+        with open(tmp, "wb") as f:
+            pickle.dump((key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, file)
+    except OSError:
+        pass  # read-only snapshot: rebuilt by every process
+    return value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build a mock data snapshot.")
+    parser.add_argument("--users", type=int, default=None)
+    parser.add_argument("--stores", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--max-history", type=int, default=5)
+    parser.add_argument("--out", default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+    m = build_snapshot(
+        args.users, args.stores, args.out,
+        seed=args.seed, chunk_size=args.chunk_size, max_history=args.max_history,
+    )
+    print(json.dumps(m, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,654 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+import cohorts
+import export
+import geo_bins
+import panels
+import snapshot
+from compact import csr
+from filters import FilterState
+from ledger import numbered
+from paging import TablePage
+
+# -------------------------
+# Embedded SQLite backend
+# -------------------------
+# Tables mirror the frames; datetimes are stored as integer microseconds since
+# the epoch so day/month arithmetic is exact. User → store membership lives in
+# its own user_stores table. Every panel is one parameterized query that
+# returns only what the panel renders.
+#
+# Ledger transactions are written into the tables by sync_ledger() in one
+# write transaction, which also records the last applied Seq in meta: the
+# file is shared by every server process, and each transaction lands once.
+# meta also records the id of the ledger the rows came from: synced against
+# a different ledger (one deleted and recreated at the same path), the file
+# is rebuilt from the snapshot first.
+DB_FILE = "possax.sqlite"
+SCHEMA_VERSION = 4  # bump when SCHEMA changes, so existing files are rebuilt
+US_PER_DAY = 86_400_000_000
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE users (
+    UserID INTEGER PRIMARY KEY, Name TEXT, CreatedAt INTEGER, LastActivity INTEGER,
+    Role TEXT, DeviceType TEXT, Phone TEXT, Email TEXT, ReferralCode TEXT, City TEXT,
+    Latitude REAL, Longitude REAL, TotalTransactions INTEGER, UserSubscriptionType TEXT
+);
+CREATE TABLE user_stores (UserID INTEGER, StoreID INTEGER);
+CREATE TABLE user_cells (
+    Level TEXT, UserID INTEGER, Cell INTEGER, PRIMARY KEY (Level, UserID)
+) WITHOUT ROWID;
+CREATE TABLE stores (
+    StoreID INTEGER PRIMARY KEY, StoreName TEXT, StoreType TEXT, OwnerUserID INTEGER,
+    City TEXT, CreatedAt INTEGER, SubscriptionType TEXT, Is_Branch INTEGER,
+    CurrentStart INTEGER, CurrentEnd INTEGER, ReoccuringSubs INTEGER, TotalMoneySpent INTEGER
+);
+CREATE TABLE subscriptions (
+    SubscriptionID INTEGER PRIMARY KEY, StoreID INTEGER, Type TEXT,
+    StartDate INTEGER, EndDate INTEGER, AmountPaid INTEGER
+);
+CREATE TABLE ledger_subscriptions (TransactionID TEXT PRIMARY KEY, SubscriptionID INTEGER);
+CREATE INDEX users_created ON users (CreatedAt);
+CREATE INDEX users_city_role ON users (City, Role);
+CREATE INDEX user_stores_user ON user_stores (UserID, StoreID);
+CREATE INDEX stores_created ON stores (CreatedAt);
+CREATE INDEX stores_sub ON stores (SubscriptionType);
+CREATE INDEX stores_end ON stores (CurrentEnd);
+CREATE INDEX subs_store ON subscriptions (StoreID, Type);
+"""
+
+USER_COLUMNS = [
+    "UserID", "Name", "CreatedAt", "LastActivity", "Role", "DeviceType", "Phone", "Email",
+    "ReferralCode", "City", "Latitude", "Longitude", "TotalTransactions", "UserSubscriptionType",
+]
+STORE_COLUMNS = [
+    "StoreID", "StoreName", "StoreType", "OwnerUserID", "City", "CreatedAt", "SubscriptionType",
+    "Is_Branch", "CurrentStart", "CurrentEnd", "ReoccuringSubs", "TotalMoneySpent",
+]
+SUB_COLUMNS = ["SubscriptionID", "StoreID", "Type", "StartDate", "EndDate", "AmountPaid"]
+DATETIME_COLUMNS = {"CreatedAt", "LastActivity", "CurrentStart", "CurrentEnd", "StartDate", "EndDate"}
+
+
+def _us(ts) -> int:
+    return int(pd.Timestamp(ts).value // 1000)
+
+
+def _column(s: pd.Series) -> list:
+    # Plain Python values for sqlite3: datetimes → µs, missing → NULL
+    if s.name in DATETIME_COLUMNS:
+        values = s.to_numpy().astype("datetime64[us]")
+        out = values.astype(np.int64).tolist()
+        for i in np.flatnonzero(np.isnat(values)).tolist():
+            out[i] = None
+        return out
+    if s.dtype == bool:
+        return s.astype(int).tolist()
+    if pd.api.types.is_numeric_dtype(s.dtype):
+        return s.tolist()
+    return s.astype(object).where(s.notna(), None).tolist()
+
+
+def _insert(conn: sqlite3.Connection, table: str, df: pd.DataFrame, columns: list) -> None:
+    rows = zip(*(_column(df[c]) for c in columns))
+    marks = ", ".join("?" * len(columns))
+    conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({marks})", rows)
+
+
+def build_database(
+    df_users: pd.DataFrame,
+    df_stores: pd.DataFrame,
+    df_subscriptions: pd.DataFrame,
+    db_path: str,
+    version: str = "",
+) -> None:
+    """Write the three frames to a fresh SQLite file at db_path (atomically replaced)."""
+    tmp = f"{db_path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript(SCHEMA)
+        _insert(conn, "users", df_users, USER_COLUMNS)
+        _insert(conn, "stores", df_stores, STORE_COLUMNS)
+        _insert(conn, "subscriptions", df_subscriptions, SUB_COLUMNS)
+        offsets, store_ids = csr(df_users["Stores"])
+        conn.executemany(
+            "INSERT INTO user_stores (UserID, StoreID) VALUES (?, ?)",
+            zip(np.repeat(df_users["UserID"].to_numpy(), np.diff(offsets)).tolist(), store_ids.tolist()),
+        )
+        for level, size in geo_bins.LEVELS.items():
+            # geo_bins.cell_ids in SQL, off the users just loaded: both
+            # offsets are non-negative, so CAST truncation is the floor
+            conn.execute(
+                """
+                INSERT INTO user_cells (Level, UserID, Cell)
+                SELECT :level, UserID, CAST((Latitude + 90) / :size AS INTEGER) * :cols
+                    + min(CAST((Longitude + 180) / :size AS INTEGER), :cols - 1)
+                FROM users
+                """,
+                {"level": level, "size": size, "cols": int(np.ceil(360 / size))},
+            )
+        conn.execute("INSERT INTO meta VALUES ('version', ?)", (version,))
+        conn.execute("INSERT INTO meta VALUES ('ledger_seq', '0')")
+        conn.execute("INSERT INTO meta VALUES ('ledger_id', '')")
+        first_id = int(df_subscriptions["SubscriptionID"].max()) + 1
+        conn.execute("INSERT INTO meta VALUES ('first_ledger_id', ?)", (str(first_id),))
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    os.replace(tmp, db_path)
+
+
+def database_version(db_path: str) -> Optional[str]:
+    if not os.path.exists(db_path):
+        return None
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+
+# -------------------------
+# Filter state → SQL
+# -------------------------
+# Builders append named parameters (prefixed by the table alias) to params and
+# return the WHERE clause, so several filtered subqueries can share one statement
+def _in(column: str, values: tuple, params: dict, prefix: str) -> str:
+    names = [f"{prefix}{i}" for i in range(len(values))]
+    params.update(zip(names, values))
+    return f"{column} IN ({', '.join(':' + n for n in names)})"
+
+
+def _date_range(alias: str, state: FilterState, params: dict) -> str:
+    params[f"{alias}_lo"], params[f"{alias}_hi"] = (_us(d) for d in state.date_range)
+    return f"{alias}.CreatedAt BETWEEN :{alias}_lo AND :{alias}_hi"
+
+
+def _users_where(state: FilterState, params: dict, alias: str = "u") -> str:
+    clauses = []
+    if state.date_range:
+        clauses.append(_date_range(alias, state, params))
+    if state.roles:
+        clauses.append(_in(f"{alias}.Role", state.roles, params, f"{alias}_role"))
+    if state.cities:
+        clauses.append(_in(f"{alias}.City", state.cities, params, f"{alias}_city"))
+    return " AND ".join(clauses) or "1"
+
+
+def _stores_where(state: FilterState, params: dict, alias: str = "st") -> str:
+    clauses = []
+    if state.date_range:
+        clauses.append(_date_range(alias, state, params))
+    if state.sub_types:
+        clauses.append(_in(f"{alias}.SubscriptionType", state.sub_types, params, f"{alias}_sub"))
+    return " AND ".join(clauses) or "1"
+
+
+# Floor division, matching Timedelta.days for expired (negative) spans
+_DAYS = f"((st.CurrentEnd - :today) / {US_PER_DAY} - ((st.CurrentEnd - :today) % {US_PER_DAY} < 0))"
+_MONTH = "strftime('%Y-%m-01', {col} / 1000000, 'unixepoch')"
+
+
+def _order(page: TablePage, allowed: list, key: str) -> str:
+    # Missing values last, ties by key, as in paging.top_k
+    if page.sort not in allowed:
+        raise ValueError(f"Cannot sort by {page.sort!r}")
+    direction = "" if page.ascending else " DESC"
+    return f"{page.sort} IS NULL, {page.sort}{direction}, {key}"
+
+
+def _limit(page: TablePage) -> str:
+    return f"LIMIT {int(page.limit)} OFFSET {int(page.offset)}"
+
+
+class SQLBackend:
+    name = "sql"
+
+    def __init__(self, db_path: str, rebuild: Optional[Callable[[], None]] = None):
+        self.db_path = db_path
+        self.rebuild = rebuild  # rewrites db_path from the snapshot frames
+        self._local = threading.local()
+
+    @classmethod
+    def from_frames(cls, df_users, df_stores, df_subscriptions, path: Optional[str] = None) -> "SQLBackend":
+        """Open the database next to the snapshot, (re)building it when the snapshot version changed."""
+        if path:
+            db_path = os.path.join(path, DB_FILE)
+            version = f"{snapshot.manifest(path)['version']}/{SCHEMA_VERSION}"
+        else:
+            db_path = os.path.join(tempfile.gettempdir(), f"possax-{os.getpid()}.sqlite")
+            version = ""
+
+        def rebuild():
+            build_database(df_users, df_stores, df_subscriptions, db_path, version)
+        if not path or database_version(db_path) != version:
+            rebuild()
+        return cls(db_path, rebuild)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # One read-only connection per thread (Streamlit runs sessions on
+        # threads), reopened when the file was rebuilt (replaced) since
+        inode = os.stat(self.db_path).st_ino
+        if getattr(self._local, "inode", None) != inode:
+            self._local.conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.inode = inode
+        return self._local.conn
+
+    @staticmethod
+    def _frame(rows: list, description) -> pd.DataFrame:
+        df = pd.DataFrame(rows, columns=[d[0] for d in description])
+        for col in df.columns.intersection(list(DATETIME_COLUMNS)):
+            df[col] = pd.to_datetime(df[col], unit="us")
+        return df
+
+    def _query(self, sql: str, params) -> pd.DataFrame:
+        cur = self.conn.execute(sql, params)
+        return self._frame(cur.fetchall(), cur.description)
+
+    def _stream(self, sql: str, params, chunk_rows: int) -> Iterator[pd.DataFrame]:
+        # The query's rows chunk_rows at a time, off one cursor (an empty
+        # result is one empty chunk)
+        cur = self.conn.cursor()
+        try:
+            cur.execute(sql, params)
+            rows = cur.fetchmany(chunk_rows)
+            yield self._frame(rows, cur.description)
+            while rows := cur.fetchmany(chunk_rows):
+                yield self._frame(rows, cur.description)
+        finally:
+            cur.close()
+
+    # ---------- Key Metrics ----------
+    def key_metrics(self, state: FilterState) -> dict:
+        params = {}
+        uw = _users_where(state, params)
+        sw = _stores_where(state, params)
+        sw2 = _stores_where(state, params, "st2")
+        row = self.conn.execute(
+            f"""
+            SELECT
+                (SELECT COUNT(*) FROM users u WHERE {uw}),
+                COUNT(*),
+                COALESCE(SUM(st.SubscriptionType = 'Pro'), 0),
+                COALESCE(SUM(st.SubscriptionType = 'Basic'), 0),
+                (SELECT COALESCE(SUM(x.AmountPaid), 0)
+                 FROM subscriptions x JOIN stores st2 ON st2.StoreID = x.StoreID
+                 WHERE x.Type IN ('Pro', 'Basic') AND {sw2})
+            FROM stores st WHERE {sw}
+            """,
+            params,
+        ).fetchone()
+        keys = ["total_users", "total_stores", "total_pro_stores", "total_basic_stores", "total_income"]
+        return dict(zip(keys, (int(v) for v in row)))
+
+    # ---------- Trends ----------
+    def user_sub_trend(self, state: FilterState) -> pd.DataFrame:
+        params = {}
+        uw = _users_where(state, params)
+        df = self._query(
+            f"""
+            SELECT {_MONTH.format(col='u.CreatedAt')} AS Month, u.UserSubscriptionType, COUNT(*) AS UserCount
+            FROM users u WHERE {uw} GROUP BY 1, 2 ORDER BY 1, 2
+            """,
+            params,
+        )
+        df["Month"] = pd.to_datetime(df["Month"])
+        return df
+
+    def store_trend(self, state: FilterState) -> pd.DataFrame:
+        params = {}
+        sw = _stores_where(state, params)
+        df = self._query(
+            f"""
+            SELECT {_MONTH.format(col='st.CreatedAt')} AS Month, COUNT(*) AS StoreCount
+            FROM stores st WHERE {sw} GROUP BY 1 ORDER BY 1
+            """,
+            params,
+        )
+        df["Month"] = pd.to_datetime(df["Month"])
+        return df
+
+    def user_trend(self, state: FilterState) -> pd.DataFrame:
+        params = {}
+        uw = _users_where(state, params)
+        df = self._query(
+            f"""
+            SELECT {_MONTH.format(col='u.CreatedAt')} AS Month, COUNT(*) AS UserCount
+            FROM users u WHERE {uw} GROUP BY 1 ORDER BY 1
+            """,
+            params,
+        )
+        df["Month"] = pd.to_datetime(df["Month"])
+        return df
+
+    # ---------- Leaderboards ----------
+    def top_active(self, state: FilterState, n: int = 10) -> pd.DataFrame:
+        params = {}
+        uw = _users_where(state, params)
+        return self._query(
+            f"""
+            SELECT u.Name, u.TotalTransactions FROM users u WHERE {uw}
+            ORDER BY u.TotalTransactions DESC, u.UserID LIMIT :n
+            """,
+            {**params, "n": n},
+        )
+
+    def _top_counts(self, state: FilterState, column: str, names: list, n: int) -> pd.DataFrame:
+        params = {}
+        uw = _users_where(state, params)
+        df = self._query(
+            f"""
+            SELECT u.{column}, COUNT(*) AS n FROM users u
+            WHERE {uw} AND u.{column} IS NOT NULL
+            GROUP BY 1 ORDER BY n DESC, 1 LIMIT :n
+            """,
+            {**params, "n": n},
+        )
+        df.columns = names
+        return df
+
+    def top_cities(self, state: FilterState, n: int = 10) -> pd.DataFrame:
+        return self._top_counts(state, "City", ["City", "User Count"], n)
+
+    def top_refs(self, state: FilterState, n: int = 10) -> pd.DataFrame:
+        return self._top_counts(state, "ReferralCode", ["Referral Code", "Usage Count"], n)
+
+    # ---------- Pies / map ----------
+    def store_type_counts(self, state: FilterState) -> pd.DataFrame:
+        params = {}
+        sw = _stores_where(state, params)
+        return self._query(
+            f"SELECT st.SubscriptionType, COUNT(*) AS Count FROM stores st WHERE {sw} GROUP BY 1 ORDER BY 1",
+            params,
+        )
+
+    def role_counts(self, state: FilterState) -> pd.DataFrame:
+        params = {}
+        uw = _users_where(state, params)
+        return self._query(f"SELECT u.Role, COUNT(*) AS Count FROM users u WHERE {uw} GROUP BY 1 ORDER BY 1", params)
+
+    # ---------- Tables ----------
+    def user_map(self, state: FilterState, level: Optional[str] = None) -> tuple[pd.DataFrame, Optional[str]]:
+        params = {}
+        uw = _users_where(state, params)
+        if level is None:
+            total = self.conn.execute(f"SELECT COUNT(*) FROM users u WHERE {uw}", params).fetchone()[0]
+            if total <= geo_bins.RAW_POINTS:
+                df = self._query(f"SELECT u.Latitude, u.Longitude FROM users u WHERE {uw} ORDER BY u.UserID", params)
+                return geo_bins.map_frame(df["Latitude"], df["Longitude"], np.ones(len(df)), None), None
+            counts = {}
+            for name in geo_bins.LEVELS:
+                counts[name] = self.conn.execute(
+                    f"""
+                    SELECT COUNT(DISTINCT c.Cell) FROM users u
+                    JOIN user_cells c ON c.Level = :level AND c.UserID = u.UserID WHERE {uw}
+                    """,
+                    {**params, "level": name},
+                ).fetchone()[0]
+            level = geo_bins.choose_level(counts)
+        df = self._query(
+            f"""
+            SELECT AVG(u.Latitude) AS lat, AVG(u.Longitude) AS lon, COUNT(*) AS count FROM users u
+            JOIN user_cells c ON c.Level = :level AND c.UserID = u.UserID WHERE {uw}
+            GROUP BY c.Cell ORDER BY c.Cell
+            """,
+            {**params, "level": level},
+        )
+        return geo_bins.map_frame(df["lat"], df["lon"], df["count"], level), level
+
+    def _users_sql(self, state: FilterState) -> tuple[str, dict]:
+        params = {}
+        uw = _users_where(state, params)
+        sql = f"""
+            SELECT u.*, (
+                SELECT group_concat(StoreID) FROM (
+                    SELECT StoreID FROM user_stores us WHERE us.UserID = u.UserID ORDER BY StoreID
+                )
+            ) AS Stores
+            FROM users u WHERE {uw} ORDER BY u.UserID
+        """
+        return sql, params
+
+    @staticmethod
+    def _users_frame(df: pd.DataFrame) -> pd.DataFrame:
+        df["Stores"] = [[int(x) for x in s.split(",")] if isinstance(s, str) else [] for s in df["Stores"]]
+        return df[panels.USER_COLS]
+
+    def users_page(self, state: FilterState, page: TablePage) -> tuple[pd.DataFrame, int]:
+        params = {}
+        uw = _users_where(state, params)
+        total = self.conn.execute(f"SELECT COUNT(*) FROM users u WHERE {uw}", params).fetchone()[0]
+        order = _order(page, panels.USER_SORTS, "UserID")
+        df = self._query(
+            f"""
+            WITH p AS (SELECT u.* FROM users u WHERE {uw} ORDER BY {order} {_limit(page)})
+            SELECT p.*, (
+                SELECT group_concat(StoreID) FROM (
+                    SELECT StoreID FROM user_stores us WHERE us.UserID = p.UserID ORDER BY StoreID
+                )
+            ) AS Stores
+            FROM p ORDER BY {order}
+            """,
+            params,
+        )
+        df["Stores"] = [[int(x) for x in s.split(",")] if isinstance(s, str) else [] for s in df["Stores"]]
+        return df[panels.USER_COLS], total
+
+    def stores_page(self, state: FilterState, page: TablePage, today: datetime) -> tuple[pd.DataFrame, int]:
+        cte, params = self._expiring_cte(state, today)
+        total = self.conn.execute(f"{cte} SELECT COUNT(*) FROM e", params).fetchone()[0]
+        df = self._query(
+            f"{cte} SELECT * FROM e ORDER BY {_order(page, panels.STORE_SORTS, 'StoreID')} {_limit(page)}", params
+        )
+        df["Is_Branch"] = df["Is_Branch"].astype(bool)
+        return df[panels.STORE_COLS], total
+
+    def expiring_page(self, state: FilterState, page: TablePage, today: datetime) -> tuple[pd.DataFrame, int]:
+        cte, params = self._expiring_cte(state, today)
+        window = self._window(state.expiry_window, params)
+        total = self.conn.execute(f"{cte} SELECT COUNT(*) FROM e WHERE {window}", params).fetchone()[0]
+        df = self._query(
+            f"{cte} SELECT * FROM e WHERE {window} ORDER BY {_order(page, panels.EXPIRING_SORTS, 'StoreID')} {_limit(page)}",
+            params,
+        )
+        return df[panels.EXPIRING_COLS], total
+
+    def _expiring_cte(self, state: FilterState, today: datetime) -> tuple[str, dict]:
+        params = {"today": _us(today)}
+        sw = _stores_where(state, params)
+        cte = f"""
+            WITH e AS (
+                SELECT st.*, {_DAYS} AS DaysToExpiry, o.Name AS Owner
+                FROM stores st LEFT JOIN users o ON o.UserID = st.OwnerUserID
+                WHERE {sw}
+            )
+        """
+        return cte, params
+
+    def _window(self, window: str, params: dict) -> str:
+        lo, hi = panels.expiry_bounds(window)
+        clauses = []
+        if lo is not None:
+            clauses.append("DaysToExpiry >= :lo")
+            params["lo"] = lo
+        if hi is not None:
+            clauses.append("DaysToExpiry <= :hi")
+            params["hi"] = hi
+        return " AND ".join(clauses) or "1"
+
+    def _stores_sql(self, state: FilterState, today: datetime, window="All") -> tuple[str, dict]:
+        cte, params = self._expiring_cte(state, today)
+        return f"{cte} SELECT * FROM e WHERE {self._window(window, params)} ORDER BY DaysToExpiry, StoreID", params
+
+    def expiring_trend(self, state: FilterState, today: datetime) -> pd.DataFrame:
+        cte, params = self._expiring_cte(state, today)
+        window = self._window(state.expiry_window, params)
+        df = self._query(
+            f"""
+            {cte}
+            SELECT date(CurrentEnd / 1000000, 'unixepoch') AS EndDateOnly, SubscriptionType, COUNT(*) AS Count
+            FROM e WHERE {window} GROUP BY 1, 2 ORDER BY 1, 2
+            """,
+            params,
+        )
+        df["EndDateOnly"] = pd.to_datetime(df["EndDateOnly"]).dt.date
+        return df
+
+    def _owners_sql(self, state: FilterState, today: datetime) -> tuple[str, dict]:
+        cte, params = self._expiring_cte(state, today)
+        window = self._window(state.expiry_window, params)
+        sql = f"""
+            {cte}
+            SELECT {', '.join('u.' + c for c in panels.OWNER_COLS)} FROM users u
+            WHERE u.UserID IN (SELECT OwnerUserID FROM e WHERE {window})
+            ORDER BY u.UserID
+        """
+        return sql, params
+
+    def affected_owners(self, state: FilterState, today: datetime) -> pd.DataFrame:
+        return self._query(*self._owners_sql(state, today))
+
+    # ---------- Export ----------
+    def export_chunks(
+        self, state: FilterState, table: str, today: datetime, chunk_rows: int = export.CHUNK_ROWS
+    ) -> Iterator[pd.DataFrame]:
+        """Rows of an export.TABLES table in on-screen order, chunk_rows at a time."""
+        if table == "users":
+            for df in self._stream(*self._users_sql(state), chunk_rows):
+                yield self._users_frame(df)
+        elif table in ("stores", "expiring"):
+            window = "All" if table == "stores" else state.expiry_window
+            columns = panels.STORE_COLS if table == "stores" else panels.EXPIRING_COLS
+            for df in self._stream(*self._stores_sql(state, today, window), chunk_rows):
+                if "Is_Branch" in columns:
+                    df["Is_Branch"] = df["Is_Branch"].astype(bool)
+                yield df[columns]
+        elif table == "owners":
+            yield from self._stream(*self._owners_sql(state, today), chunk_rows)
+        else:
+            raise ValueError(f"Unknown export table {table!r}; expected one of {list(export.TABLES)}")
+
+    # ---------- Cohorts ----------
+    # SQL selects the filtered rows' dates and plans; the month arithmetic is
+    # the vectorized one in cohorts.py, so the numbers match the pandas backend
+    def _cohort_subs(self, state: FilterState) -> pd.DataFrame:
+        params = {}
+        sw = _stores_where(state, params)
+        return self._query(
+            f"""
+            SELECT s.SubscriptionID, s.StoreID, s.Type, s.StartDate, s.EndDate
+            FROM subscriptions s JOIN stores st ON st.StoreID = s.StoreID
+            WHERE {sw} ORDER BY s.SubscriptionID
+            """,
+            params,
+        )
+
+    def user_retention(self, state: FilterState, today: datetime) -> pd.DataFrame:
+        params = {}
+        uw = _users_where(state, params)
+        users = self._query(f"SELECT u.CreatedAt, u.LastActivity FROM users u WHERE {uw}", params)
+        return cohorts.user_retention(users, today)
+
+    def store_retention(self, state: FilterState, today: datetime) -> pd.DataFrame:
+        params = {}
+        sw = _stores_where(state, params)
+        stores = self._query(f"SELECT st.StoreID, st.CreatedAt FROM stores st WHERE {sw} ORDER BY st.StoreID", params)
+        return cohorts.store_retention(stores, self._cohort_subs(state), today)
+
+    def tier_transitions(self, state: FilterState, across: str = "renewal") -> pd.DataFrame:
+        return cohorts.tier_transitions(self._cohort_subs(state), across)
+
+    # ---------- Ledger ----------
+    @staticmethod
+    def _meta(conn: sqlite3.Connection, key: str, type_=int):
+        return type_(conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()[0])
+
+    @property
+    def ledger_seq(self) -> int:
+        """Last ledger Seq written into the tables (by any process)."""
+        return self._meta(self.conn, "ledger_seq")
+
+    @property
+    def ledger_id(self) -> Optional[str]:
+        """Ledger.id of the ledger the tables were synced with, None before the first sync."""
+        return self._meta(self.conn, "ledger_id", str) or None
+
+    def sync_ledger(self, ledger, rollup) -> np.ndarray:
+        """Apply ledger transactions up to rollup.seq; returns the StoreIDs rewritten."""
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            # The write lock is taken before reading ledger_seq, so two
+            # processes never apply the same transactions
+            conn.execute("BEGIN IMMEDIATE")
+            after = self._meta(conn, "ledger_seq")
+            if self._meta(conn, "ledger_id", str) != ledger.id:
+                if after:
+                    # Rows of another ledger: start over from the snapshot
+                    conn.execute("ROLLBACK")
+                    if self.rebuild is None:
+                        raise RuntimeError(f"{self.db_path} holds another ledger's transactions")
+                    self.rebuild()
+                    return self.sync_ledger(ledger, rollup)
+                conn.execute("UPDATE meta SET value = ? WHERE key = 'ledger_id'", (ledger.id,))
+            inserts, cancels, seq = ledger.subscription_changes(after=after, until=rollup.seq)
+            if seq == after:
+                conn.execute("COMMIT")  # the ledger id, if it was just recorded
+                return np.zeros(0, dtype=np.int64)
+            added = numbered(inserts, self._meta(conn, "first_ledger_id"))
+            _insert(conn, "subscriptions", added, SUB_COLUMNS)
+            _insert(conn, "ledger_subscriptions", added, ["TransactionID", "SubscriptionID"])
+            cancelled = json.dumps(cancels)
+            removed = conn.execute(
+                """
+                SELECT s.StoreID FROM ledger_subscriptions l JOIN subscriptions s USING (SubscriptionID)
+                WHERE l.TransactionID IN (SELECT value FROM json_each(?))
+                """,
+                (cancelled,),
+            ).fetchall()
+            conn.execute(
+                """
+                DELETE FROM subscriptions WHERE SubscriptionID IN (
+                    SELECT SubscriptionID FROM ledger_subscriptions
+                    WHERE TransactionID IN (SELECT value FROM json_each(?))
+                )
+                """,
+                (cancelled,),
+            )
+            conn.execute("DELETE FROM ledger_subscriptions WHERE TransactionID IN (SELECT value FROM json_each(?))",
+                         (cancelled,))
+            store_ids = np.unique(np.r_[added["StoreID"].to_numpy(np.int64), np.array(removed, dtype=np.int64).ravel()])
+            stores = rollup.stores(store_ids)
+            columns = [c for c in stores.columns if c != "StoreID"]
+            conn.executemany(
+                f"UPDATE stores SET {', '.join(f'{c} = ?' for c in columns)} WHERE StoreID = ?",
+                zip(*(_column(stores[c]) for c in columns + ["StoreID"])),
+            )
+            users = rollup.users(store_ids)
+            conn.executemany(
+                "UPDATE users SET UserSubscriptionType = ? WHERE UserID = ?",
+                zip(_column(users["UserSubscriptionType"]), _column(users["UserID"])),
+            )
+            conn.execute("UPDATE meta SET value = ? WHERE key = 'ledger_seq'", (str(seq),))
+            conn.execute("COMMIT")
+            return store_ids
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+
+from compact import csr
+
+# -------------------------
+# Inverted indexes: users ↔ stores
+# -------------------------
+# owner → owned stores, user → associated stores and store → associated users,
+# each a CSR array indexed by id. Edits go to a small overlay that is folded
+# back into the CSR arrays once it grows past COMPACT_AFTER edits, so lookups
+# stay vectorized while the indexes track store and membership changes.
+COMPACT_AFTER = 10_000
+
+
+class Adjacency:
+    """id → ids, as CSR arrays indexed by the source id plus an edit overlay."""
+
+    def __init__(self, src: np.ndarray, dst: np.ndarray):
+        self._build(np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64))
+
+    def _build(self, src: np.ndarray, dst: np.ndarray) -> None:
+        order = np.argsort(src, kind="stable")
+        counts = np.bincount(src, minlength=1) if len(src) else np.zeros(1, dtype=np.int64)
+        self.offsets = np.r_[0, np.cumsum(counts)]
+        self.targets = dst[order]
+        self._added = {}
+        self._removed = {}
+        self._edits = 0
+
+    def edges(self) -> tuple[np.ndarray, np.ndarray]:
+        """All (src, dst) pairs, overlay included."""
+        src = np.repeat(np.arange(len(self.offsets) - 1), np.diff(self.offsets))
+        return self._apply_overlay(src, self.targets, set(self._added) | set(self._removed))
+
+    def _apply_overlay(self, src, dst, touched) -> tuple[np.ndarray, np.ndarray]:
+        removed = [(s, d) for s in touched for d in self._removed.get(s, ())]
+        if removed:
+            pairs = np.array(removed, dtype=np.int64)
+            keep = ~_pair_isin(src, dst, pairs[:, 0], pairs[:, 1])
+            src, dst = src[keep], dst[keep]
+        added = [(s, d) for s in touched for d in self._added.get(s, ())]
+        if added:
+            pairs = np.array(added, dtype=np.int64)
+            src, dst = np.r_[src, pairs[:, 0]], np.r_[dst, pairs[:, 1]]
+        return src, dst
+
+    def gather(self, ids) -> tuple[np.ndarray, np.ndarray]:
+        """(src, dst) pairs for every id in ids, in one vectorized pass over the CSR arrays."""
+        ids = np.asarray(ids, dtype=np.int64)
+        known = ids[(ids >= 0) & (ids < len(self.offsets) - 1)]
+        starts = self.offsets[known]
+        lengths = self.offsets[known + 1] - starts
+        idx = np.repeat(starts - np.r_[0, np.cumsum(lengths)[:-1]], lengths) + np.arange(lengths.sum())
+        src, dst = np.repeat(known, lengths), self.targets[idx]
+        touched = set(self._added) | set(self._removed)
+        if touched:
+            touched = set(np.intersect1d(ids, np.fromiter(touched, np.int64, len(touched))).tolist())
+            src, dst = self._apply_overlay(src, dst, touched)
+        return src, dst
+
+    def add(self, src: int, dst: int) -> None:
+        src, dst = int(src), int(dst)
+        if dst in self._removed.get(src, ()):
+            self._removed[src].discard(dst)
+        else:
+            self._added.setdefault(src, set()).add(dst)
+        self._edited()
+
+    def remove(self, src: int, dst: int) -> None:
+        src, dst = int(src), int(dst)
+        if dst in self._added.get(src, ()):
+            self._added[src].discard(dst)
+        else:
+            self._removed.setdefault(src, set()).add(dst)
+        self._edited()
+
+    def _edited(self) -> None:
+        self._edits += 1
+        if self._edits >= COMPACT_AFTER:
+            self.compact()
+
+    def compact(self) -> None:
+        self._build(*self.edges())
+
+
+def _pair_isin(src: np.ndarray, dst: np.ndarray, other_src: np.ndarray, other_dst: np.ndarray) -> np.ndarray:
+    width = int(max(dst.max(initial=0), other_dst.max(initial=0))) + 1
+    return np.isin(src * width + dst, other_src * width + other_dst)
+
+
+class StoreIndex:
+    """Owner/member ↔ store lookups for bulk subscription actions."""
+
+    def __init__(self, df_users: pd.DataFrame, df_stores: pd.DataFrame):
+        store_ids = df_stores["StoreID"].to_numpy()
+        owners = df_stores["OwnerUserID"].to_numpy()
+        offsets, assoc = csr(df_users["Stores"])
+        members = np.repeat(df_users["UserID"].to_numpy(), np.diff(offsets))
+        self.owned = Adjacency(owners, store_ids)       # owner → stores
+        self.member_of = Adjacency(members, assoc)      # user → associated stores
+        self.members = Adjacency(assoc, members)        # store → associated users
+        # store id → owner id, -1 for unknown stores
+        self._owner = np.full(int(store_ids.max(initial=0)) + 1, -1, dtype=np.int64)
+        self._owner[store_ids] = owners
+
+    # ---------- Lookups ----------
+    def stores_of_users(self, user_ids) -> np.ndarray:
+        """Sorted unique ids of stores owned by or associated with any of user_ids."""
+        return np.union1d(self.owned.gather(user_ids)[1], self.member_of.gather(user_ids)[1])
+
+    def users_of_stores(self, store_ids, include_owners: bool = True) -> np.ndarray:
+        """Sorted unique ids of users associated with (and owning) any of store_ids."""
+        users = self.members.gather(store_ids)[1]
+        if include_owners:
+            owners = self._owner_of(store_ids)
+            users = np.union1d(users, owners[owners >= 0])
+        return np.unique(users)
+
+    def _owner_of(self, store_ids) -> np.ndarray:
+        store_ids = np.asarray(store_ids, dtype=np.int64)
+        known = (store_ids >= 0) & (store_ids < len(self._owner))
+        return np.where(known, self._owner[np.where(known, store_ids, 0)], -1)
+
+    # ---------- Maintenance ----------
+    def add_store(self, store_id: int, owner_id: int) -> None:
+        if store_id >= len(self._owner):
+            grown = np.full(max(int(store_id) + 1, 2 * len(self._owner)), -1, dtype=np.int64)
+            grown[:len(self._owner)] = self._owner
+            self._owner = grown
+        self._owner[store_id] = owner_id
+        self.owned.add(owner_id, store_id)
+
+    def set_owner(self, store_id: int, owner_id: int) -> None:
+        old = int(self._owner_of([store_id])[0])
+        if old >= 0:
+            self.owned.remove(old, store_id)
+        self.add_store(store_id, owner_id)
+
+    def remove_store(self, store_id: int) -> None:
+        old = int(self._owner_of([store_id])[0])
+        if old >= 0:
+            self._owner[store_id] = -1
+            self.owned.remove(old, store_id)
+        for user in self.members.gather([store_id])[1].tolist():
+            self.remove_membership(user, store_id)
+
+    def add_membership(self, user_id: int, store_id: int) -> None:
+        self.member_of.add(user_id, store_id)
+        self.members.add(store_id, user_id)
+
+    def remove_membership(self, user_id: int, store_id: int) -> None:
+        self.member_of.remove(user_id, store_id)
+        self.members.remove(store_id, user_id)
+
+    def check(self, df_users: pd.DataFrame, df_stores: pd.DataFrame) -> bool:
+        """True when the maintained indexes match ones rebuilt from the frames."""
+        fresh = StoreIndex(df_users, df_stores)
+        for mine, theirs in ((self.owned, fresh.owned), (self.member_of, fresh.member_of), (self.members, fresh.members)):
+            a, b = np.column_stack(mine.edges()), np.column_stack(theirs.edges())
+            if not np.array_equal(np.unique(a, axis=0), np.unique(b, axis=0)):
+                return False
+        n = max(len(self._owner), len(fresh._owner))
+        return np.array_equal(self._owner_of(np.arange(n)), fresh._owner_of(np.arange(n)))
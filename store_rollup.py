@@ -0,0 +1,218 @@
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from compact import csr, csr_max
+from mock_data import aggregate_subscriptions, rank
+from store_index import StoreIndex
+
+# -------------------------
+# Incrementally maintained store rollup
+# -------------------------
+# CurrentStart / CurrentEnd (the subscription with the latest EndDate),
+# ReoccuringSubs and TotalMoneySpent per store, the store's tier and the
+# derived UserSubscriptionType (highest tier across a user's associated
+# stores). A store's tier is the snapshot SubscriptionType until a ledger
+# subscription becomes its current one, then that subscription's Type.
+#
+# The snapshot's subscriptions stay as CSR slices per store, sorted like
+# aggregate_subscriptions; inserted and cancelled subscriptions are kept
+# aside, and a batch only re-reduces the stores it touches and the users
+# linked to those stores.
+_RANK_TO_SUB = np.array(sorted(rank, key=rank.get), dtype=object)
+_NAT = np.datetime64("NaT", "us")
+ROLLUP_COLS = ["StoreID", "CurrentStart", "CurrentEnd", "ReoccuringSubs", "TotalMoneySpent", "SubscriptionType"]
+
+
+class StoreRollup:
+    """Per-store subscription rollup and user tiers, updated in O(batch)."""
+
+    def __init__(self, df_users: pd.DataFrame, df_stores: pd.DataFrame, df_subscriptions: pd.DataFrame,
+                 index: Optional[StoreIndex] = None):
+        self.index = index or StoreIndex(df_users, df_stores)
+
+        # Base subscriptions grouped by store, EndDate ascending (ties keep row order)
+        store = df_subscriptions["StoreID"].to_numpy(dtype=np.int64)
+        end = df_subscriptions["EndDate"].to_numpy("datetime64[us]")
+        order = np.lexsort((end, store))
+        size = int(max(df_stores["StoreID"].max(), store.max(initial=0))) + 1
+        self.offsets = np.r_[0, np.cumsum(np.bincount(store, minlength=size))]
+        self.sub_ids = df_subscriptions["SubscriptionID"].to_numpy()[order]
+        self.start = df_subscriptions["StartDate"].to_numpy("datetime64[us]")[order]
+        self.end = end[order]
+        self.rank = df_subscriptions["Type"].map(rank).to_numpy(dtype=np.int8)[order]
+        self.paid = df_subscriptions["AmountPaid"].to_numpy(dtype=np.int64)[order]
+        # SubscriptionID → base position, for cancels
+        self._id_order = np.argsort(self.sub_ids, kind="stable")
+        self._sorted_ids = self.sub_ids[self._id_order]
+
+        # Added rows per store (insertion order) and cancelled subscription ids
+        self.added: dict[int, list[tuple]] = {}
+        self.added_store: dict = {}
+        self.cancelled: set = set()
+        self.seq = 0  # last ledger Seq applied by sync()
+
+        # Current values, indexed by StoreID
+        agg = aggregate_subscriptions(df_subscriptions)
+        ids = agg["StoreID"].to_numpy()
+        self.cur_start = np.full(size, _NAT)
+        self.cur_end = np.full(size, _NAT)
+        self.count = np.zeros(size, dtype=np.int64)
+        self.total = np.zeros(size, dtype=np.int64)
+        self.cur_rank = np.zeros(size, dtype=np.int8)
+        self.cur_start[ids] = agg["CurrentStart"].to_numpy("datetime64[us]")
+        self.cur_end[ids] = agg["CurrentEnd"].to_numpy("datetime64[us]")
+        self.count[ids] = agg["ReoccuringSubs"].to_numpy()
+        self.total[ids] = agg["TotalMoneySpent"].to_numpy()
+        self.base_rank = np.zeros(size, dtype=np.int8)
+        self.base_rank[df_stores["StoreID"].to_numpy()] = df_stores["SubscriptionType"].map(rank).to_numpy(dtype=np.int8)
+        self.cur_rank[:] = self.base_rank
+
+        # UserSubscriptionType as a rank per UserID
+        user_ids = df_users["UserID"].to_numpy()
+        self.user_rank = np.zeros(int(user_ids.max(initial=0)) + 1, dtype=np.int8)
+        offsets, store_ids = csr(df_users["Stores"])
+        self.user_rank[user_ids] = csr_max(self.cur_rank[store_ids], offsets, empty=rank["Non-Paid"])
+
+    # ---------- Updates ----------
+    def _store_of(self, sub_id) -> Optional[int]:
+        if sub_id in self.added_store:
+            return self.added_store[sub_id]
+        if not isinstance(sub_id, (int, np.integer)):
+            return None
+        at = np.searchsorted(self._sorted_ids, sub_id)
+        if at < len(self._sorted_ids) and self._sorted_ids[at] == sub_id:
+            pos = self._id_order[at]
+            return int(np.searchsorted(self.offsets, pos, "right") - 1)
+        return None
+
+    def apply(self, inserts: Optional[pd.DataFrame] = None, cancels: Iterable = ()) -> np.ndarray:
+        """Apply inserted subscription rows and cancelled SubscriptionIDs; returns the StoreIDs that changed."""
+        touched = set()
+        if inserts is not None and len(inserts):
+            rows = zip(
+                inserts["SubscriptionID"].tolist(), inserts["StoreID"].tolist(),
+                inserts["StartDate"].to_numpy("datetime64[us]"), inserts["EndDate"].to_numpy("datetime64[us]"),
+                inserts["Type"].map(rank).tolist(), inserts["AmountPaid"].tolist(),
+            )
+            for sub_id, store, start, end, r, paid in rows:
+                self._grow(store)
+                self.added.setdefault(store, []).append((sub_id, start, end, r, paid))
+                self.added_store[sub_id] = store
+                touched.add(store)
+        for sub_id in cancels:
+            store = self._store_of(sub_id)
+            if store is not None and sub_id not in self.cancelled:
+                self.cancelled.add(sub_id)
+                touched.add(store)
+        stores = np.array(sorted(touched), dtype=np.int64)
+        old_rank = self.cur_rank[stores].copy()
+        for store in stores.tolist():
+            self._reduce(store)
+        # Tier changes flow to users associated with those stores
+        moved = stores[self.cur_rank[stores] != old_rank]
+        if len(moved):
+            users = np.unique(self.index.members.gather(moved)[1])
+            src, dst = self.index.member_of.gather(users)
+            ranks = np.full(len(users), rank["Non-Paid"], dtype=np.int8)
+            np.maximum.at(ranks, np.searchsorted(users, src), self.cur_rank[dst])
+            self.user_rank[users] = ranks
+        return stores
+
+    def _grow(self, store: int) -> None:
+        if store < len(self.cur_end):
+            return
+        extra = store + 1 - len(self.cur_end)
+        self.offsets = np.r_[self.offsets, np.full(extra, self.offsets[-1])]
+        self.cur_start = np.r_[self.cur_start, np.full(extra, _NAT)]
+        self.cur_end = np.r_[self.cur_end, np.full(extra, _NAT)]
+        self.count = np.r_[self.count, np.zeros(extra, dtype=np.int64)]
+        self.total = np.r_[self.total, np.zeros(extra, dtype=np.int64)]
+        self.cur_rank = np.r_[self.cur_rank, np.zeros(extra, dtype=np.int8)]
+        self.base_rank = np.r_[self.base_rank, np.zeros(extra, dtype=np.int8)]
+
+    def _reduce(self, store: int) -> None:
+        # Re-reduce one store from its base slice plus added rows, minus cancels
+        lo, hi = self.offsets[store], self.offsets[store + 1]
+        rows = list(zip(self.sub_ids[lo:hi].tolist(), self.start[lo:hi], self.end[lo:hi],
+                        self.rank[lo:hi].tolist(), self.paid[lo:hi].tolist()))
+        rows += self.added.get(store, [])
+        rows = [r for r in rows if r[0] not in self.cancelled]
+        if not rows:
+            self.cur_start[store] = self.cur_end[store] = _NAT
+            self.count[store] = self.total[store] = 0
+            self.cur_rank[store] = rank["Non-Paid"]
+            return
+        # latest EndDate wins, ties go to the later row (as the stable sort in aggregate_subscriptions)
+        current = max(range(len(rows)), key=lambda i: (rows[i][2], i))
+        sub_id, self.cur_start[store], self.cur_end[store], sub_rank, _ = rows[current]
+        self.cur_rank[store] = sub_rank if sub_id in self.added_store else self.base_rank[store]
+        self.count[store] = len(rows)
+        self.total[store] = sum(r[4] for r in rows)
+
+    def sync(self, ledger) -> np.ndarray:
+        """Apply ledger transactions newer than the last sync; returns the StoreIDs that changed."""
+        inserts, cancels, self.seq = ledger.subscription_changes(after=self.seq)
+        return self.apply(inserts, cancels)
+
+    # ---------- Reads ----------
+    def stores(self, store_ids=None) -> pd.DataFrame:
+        """Rollup columns of store_ids (default: every store with a subscription)."""
+        ids = np.flatnonzero(self.count > 0) if store_ids is None else np.asarray(store_ids, dtype=np.int64)
+        return pd.DataFrame({
+            "StoreID": ids,
+            "CurrentStart": self.cur_start[ids],
+            "CurrentEnd": self.cur_end[ids],
+            "ReoccuringSubs": self.count[ids],
+            "TotalMoneySpent": self.total[ids],
+            "SubscriptionType": _RANK_TO_SUB[self.cur_rank[ids]],
+        })
+
+    def user_tiers(self, user_ids) -> np.ndarray:
+        return _RANK_TO_SUB[self.user_rank[np.asarray(user_ids, dtype=np.int64)]]
+
+    def users(self, store_ids) -> pd.DataFrame:
+        """UserID and UserSubscriptionType of the users associated with store_ids."""
+        ids = self.index.users_of_stores(store_ids, include_owners=False)
+        return pd.DataFrame({"UserID": ids, "UserSubscriptionType": self.user_tiers(ids)})
+
+    def check(self, df_users: pd.DataFrame, df_stores: pd.DataFrame, df_subscriptions: pd.DataFrame) -> bool:
+        """True when the maintained values equal a full recompute with the same inserts and cancels."""
+        added = [(sub_id, store, *rest) for store, rows in self.added.items() for sub_id, *rest in rows]
+        sub_id, store, start, end, ranks, paid = (list(col) for col in zip(*added)) if added else ([],) * 6
+        extra = pd.DataFrame({
+            "SubscriptionID": pd.Series(sub_id, dtype=object),
+            "StoreID": np.array(store, dtype=np.int64),
+            "Type": _RANK_TO_SUB[np.array(ranks, dtype=np.int8)],
+            "StartDate": np.array(start, dtype="datetime64[us]"),
+            "EndDate": np.array(end, dtype="datetime64[us]"),
+            "AmountPaid": np.array(paid, dtype=np.int64),
+        })
+        subs = pd.concat([
+            df_subscriptions[["SubscriptionID", "StoreID", "Type", "StartDate", "EndDate", "AmountPaid"]]
+            .astype({"Type": object, "SubscriptionID": object}),
+            extra,
+        ], ignore_index=True)
+        subs = subs[~subs["SubscriptionID"].isin(self.cancelled)]
+        full = aggregate_subscriptions(subs)
+        order = np.lexsort((subs["EndDate"].to_numpy(), subs["StoreID"].to_numpy()))
+        current = subs.iloc[order].groupby("StoreID", sort=True)[["SubscriptionID", "Type"]].last()
+        snapshot_tier = df_stores.set_index("StoreID")["SubscriptionType"].astype(object)
+        full["SubscriptionType"] = np.where(
+            current["SubscriptionID"].isin(list(self.added_store)),
+            current["Type"], snapshot_tier.reindex(current.index).fillna("Non-Paid"),
+        )
+        mine = self.stores(full["StoreID"].to_numpy())
+        for col in ROLLUP_COLS:
+            if not np.array_equal(mine[col].to_numpy(), full[col].astype(mine[col].dtype).to_numpy()):
+                return False
+        # stores with every subscription cancelled are empty here and absent there
+        others = np.setdiff1d(np.flatnonzero(self.count > 0), full["StoreID"].to_numpy())
+        if len(others):
+            return False
+        store_rank = np.zeros(len(self.cur_rank), dtype=np.int8)
+        store_rank[full["StoreID"].to_numpy()] = full["SubscriptionType"].map(rank).to_numpy()
+        offsets, store_ids = csr(df_users["Stores"])
+        expected = csr_max(store_rank[store_ids], offsets, empty=rank["Non-Paid"])
+        return bool(np.array_equal(self.user_rank[df_users["UserID"].to_numpy()], expected))
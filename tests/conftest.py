@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import snapshot  # noqa: E402
+from ledger import Ledger  # noqa: E402
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    path = str(tmp_path / "snapshot")
+    snapshot.build_snapshot(400, 200, path, seed=7)
+    return path
+
+
+@pytest.fixture
+def frames(snapshot_path):
+    return snapshot.load(snapshot_path)
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return Ledger(str(tmp_path / "ledger.sqlite"))
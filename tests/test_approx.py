@@ -0,0 +1,72 @@
+import pandas as pd
+import pytest
+
+import approx
+import panels
+from backends import get_backend
+from filters import FilterState
+from mock_data import generate_dataset
+
+COUNTS = ["total_users", "total_stores", "total_pro_stores", "total_basic_stores"]
+
+
+@pytest.fixture(scope="module")
+def data():
+    frames = generate_dataset(20_000, 8_000, seed=3)
+    users = frames[0]
+    lo, hi = users["CreatedAt"].min(), users["CreatedAt"].max()
+    # cuts across the strata: dates, some cities, plans and a role
+    state = FilterState.from_widgets(
+        [(lo + (hi - lo) / 4).normalize(), (hi - (hi - lo) / 4).normalize()],
+        sorted(users["City"].unique().tolist())[:3], ["Pro", "Basic"], ["Owner"],
+    )
+    return frames, get_backend("pandas", *frames), state
+
+
+def _exact_panels(backend, state: FilterState) -> dict:
+    users_f, stores_f, _ = backend.filtered(state)
+    return {
+        "user_sub_trend": panels.user_sub_trend(users_f),
+        "store_trend": panels.store_trend(stores_f),
+        "user_trend": panels.user_trend(users_f),
+        "store_type_counts": panels.store_type_counts(stores_f),
+        "role_counts": panels.role_counts(users_f),
+    }
+
+
+@pytest.mark.parametrize("fraction", approx.FRACTIONS)
+def test_unfiltered_counts_are_exact(data, fraction):
+    # every sampled row counts 1 in its stratum: no variance, whatever the fraction
+    frames, backend, _ = data
+    estimates = approx.Samples(*frames).estimates(FilterState(), fraction)
+    exact = backend.key_metrics(FilterState())
+    for key in COUNTS:
+        assert estimates["metrics"][key] == exact[key] and estimates["metrics"]["margins"][key] == 0
+    counts = estimates["store_type_counts"]
+    assert counts.drop(columns="Margin").equals(panels.store_type_counts(frames[1])) and (counts["Margin"] == 0).all()
+
+
+def test_full_sample_is_exact(data, monkeypatch):
+    frames, backend, state = data
+    monkeypatch.setattr(approx, "FRACTIONS", (0.01, 1.0))
+    estimates = approx.Samples(*frames).estimates(state, 1.0)
+    metrics = estimates.pop("metrics")
+    assert set(metrics.pop("margins").values()) == {0}
+    assert metrics == backend.key_metrics(state)
+    for key, exact in _exact_panels(backend, state).items():
+        assert (estimates[key]["Margin"] == 0).all()
+        pd.testing.assert_frame_equal(estimates[key].drop(columns="Margin").reset_index(drop=True), exact.reset_index(drop=True))
+
+
+@pytest.mark.parametrize("fraction", approx.FRACTIONS)
+def test_intervals_cover_the_exact_values(data, fraction):
+    # 95% intervals over independent samples: most of them hold the exact value
+    frames, backend, state = data
+    exact = backend.key_metrics(state)
+    inside = total = 0
+    for seed in range(30):
+        metrics = approx.Samples(*frames, seed=seed).estimates(state, fraction)["metrics"]
+        for key, value in exact.items():
+            inside += abs(metrics[key] - value) <= metrics["margins"][key]
+            total += 1
+    assert inside / total >= 0.85
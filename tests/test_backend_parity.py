@@ -0,0 +1,128 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import geo_bins
+import panels
+import snapshot
+from backends import get_backend
+from filters import FilterState, apply_where
+from paging import TablePage
+
+TODAY = datetime.now()
+START, END = date.today() - timedelta(days=200), date.today() - timedelta(days=45)
+STATES = [
+    FilterState(),
+    FilterState.from_widgets(cities=["Jakarta", "Medan"], roles=["Owner"]),
+    FilterState.from_widgets(sub_types=["Pro", "Trial"], expiry_window="30 days"),
+    FilterState.from_widgets(sub_types=["Basic"], expiry_window=(-30, 5)),
+    # custom windows whose bounds are midnights that rows were created at
+    FilterState.from_widgets(date_range=[START, END], expiry_window="Expired"),
+    FilterState.from_widgets(date_range=[END, END], roles=["Kasir", "Manager"]),
+]
+PAGES = {
+    "users_page": [TablePage("UserID", limit=25), TablePage("TotalTransactions", False, 10, 25),
+                   TablePage("City", limit=30), TablePage("CreatedAt", False, limit=25)],
+    "stores_page": [TablePage("StoreID", limit=25), TablePage("Owner", offset=5, limit=20),
+                    TablePage("DaysToExpiry", limit=25), TablePage("TotalMoneySpent", False, limit=25)],
+    "expiring_page": [TablePage("DaysToExpiry", limit=25), TablePage("SubscriptionType", False, limit=25)],
+}
+
+
+@pytest.fixture(scope="module")
+def data(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("parity") / "snapshot")
+    snapshot.build_snapshot(300, 150, path, seed=11)
+    users, stores, subs = (df.copy() for df in snapshot.load(path))
+    # rows created exactly at the midnights bounding the date windows
+    for df, step in ((users, 9), (stores, 7)):
+        created = df["CreatedAt"].to_numpy().copy()
+        created[::step] = np.datetime64(pd.Timestamp(START), "us")
+        created[3::step] = np.datetime64(pd.Timestamp(END), "us")
+        df["CreatedAt"] = created
+    return users, stores, subs
+
+
+def _norm(x):
+    if isinstance(x, tuple):
+        return tuple(_norm(v) for v in x)
+    if not isinstance(x, pd.DataFrame):
+        return x
+    x = x.reset_index(drop=True).copy()
+    for c in x.columns:
+        if pd.api.types.is_datetime64_any_dtype(x[c]):
+            x[c] = x[c].astype("datetime64[us]")
+        elif c == "Stores":
+            x[c] = x[c].map(lambda ids: [int(i) for i in ids])
+        elif not pd.api.types.is_numeric_dtype(x[c]) or isinstance(x[c].dtype, pd.CategoricalDtype):
+            x[c] = x[c].astype(object).where(x[c].notna(), None)
+    return x
+
+
+def _expected(users, stores, subs, state: FilterState, method: str, *args):
+    # Every panel straight from panels.py over apply_where-filtered frames
+    users_f = apply_where(users, state.users_where())
+    stores_f = apply_where(stores, state.stores_where())
+    subs_f = subs[subs["StoreID"].isin(stores_f["StoreID"])]
+    if method == "key_metrics":
+        return panels.key_metrics(users_f, stores_f, subs_f)
+    if method in ("store_trend", "store_type_counts"):
+        return getattr(panels, method)(stores_f)
+    if method == "users_page":
+        return panels.users_page(users_f, *args)
+    if method == "stores_page":
+        return panels.stores_page(stores_f, users, *args, TODAY)
+    if method == "expiring_page":
+        return panels.expiring_page(stores_f, users, state.expiry_window, *args, TODAY)
+    if method == "affected_owners":
+        days = (stores_f["CurrentEnd"] - TODAY).dt.days
+        lo, hi = panels.expiry_bounds(state.expiry_window)
+        keep = (days >= (-np.inf if lo is None else lo)) & (days <= (np.inf if hi is None else hi))
+        return panels.affected_owners(stores_f[keep.to_numpy()], users)
+    return getattr(panels, method)(users_f)
+
+
+def _assert_same(got, want, what: str) -> None:
+    got, want = _norm(got), _norm(want)
+    if isinstance(want, tuple):
+        assert got[1] == want[1], what
+        got, want = got[0], want[0]
+    if isinstance(want, pd.DataFrame):
+        pd.testing.assert_frame_equal(got, want, check_dtype=False, obj=what)
+    else:
+        assert got == want, what
+
+
+@pytest.mark.parametrize("name", ["pandas", "cube", "sql"])
+def test_backends_match_panels(data, name):
+    backend = get_backend(name, *data)
+    for state in STATES:
+        for method in ["key_metrics", "user_sub_trend", "store_trend", "user_trend", "store_type_counts",
+                       "role_counts", "top_active", "top_cities", "top_refs"]:
+            _assert_same(getattr(backend, method)(state), _expected(*data, state, method), f"{method} {state}")
+        for method, pages in PAGES.items():
+            for page in pages:
+                args = (state, page) if method == "users_page" else (state, page, TODAY)
+                _assert_same(getattr(backend, method)(*args), _expected(*data, state, method, page),
+                             f"{method} {page} {state}")
+        _assert_same(backend.affected_owners(state, TODAY), _expected(*data, state, "affected_owners"),
+                     f"affected_owners {state}")
+
+
+@pytest.mark.parametrize("name", ["pandas", "cube", "sql"])
+def test_midnight_bounds_are_inclusive(data, name):
+    users, stores, _ = data
+    state = FilterState.from_widgets(date_range=[END, END])
+    metrics = get_backend(name, *data).key_metrics(state)
+    assert metrics["total_users"] == (users["CreatedAt"] == pd.Timestamp(END)).sum() > 0
+    assert metrics["total_stores"] == (stores["CreatedAt"] == pd.Timestamp(END)).sum() > 0
+
+
+@pytest.mark.parametrize("level", list(geo_bins.LEVELS))
+def test_sql_map_cells_match_geo_bins(data, level):
+    sql, pandas = get_backend("sql", *data), get_backend("pandas", *data)
+    for state in STATES:
+        got, want = (b.user_map(state, level)[0].sort_values(["lat", "lon"], ignore_index=True) for b in (sql, pandas))
+        pd.testing.assert_frame_equal(got, want, check_dtype=False, obj=f"{level} {state}")
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from chart_data import fit_budget, lttb
+
+
+@pytest.mark.parametrize("size, n", [(10, 3), (1000, 100), (1001, 999), (5000, 7)])
+def test_lttb_keeps_endpoints_and_budget(size, n):
+    rng = np.random.default_rng(size)
+    x, y = np.arange(size), rng.normal(size=size)
+    keep = lttb(x, y, n)
+    assert len(keep) == n
+    assert keep[0] == 0 and keep[-1] == size - 1
+    assert (np.diff(keep) > 0).all()
+
+
+def test_lttb_keeps_a_spike():
+    y = np.zeros(1000)
+    y[437] = 50
+    assert 437 in lttb(np.arange(1000), y, 20)
+
+
+def test_lttb_short_series_untouched():
+    assert lttb(np.arange(5), np.arange(5), 10).tolist() == list(range(5))
+    assert lttb(np.arange(5), np.arange(5), 2).tolist() == list(range(5))
+
+
+def test_fit_budget_per_series():
+    days = pd.date_range("2025-01-01", periods=900, freq="D")
+    df = pd.concat([
+        pd.DataFrame({"Day": days, "Count": np.arange(900) % 17, "Type": kind}) for kind in ["Basic", "Pro", "Trial"]
+    ], ignore_index=True).sample(frac=1, random_state=0)
+    out, downsampled = fit_budget(df, "Day", "Count", "Type", budget=300)
+    assert downsampled and len(out) == 300
+    for _, g in out.groupby("Type"):
+        assert len(g) == 100
+        assert g["Day"].iloc[0] == days[0] and g["Day"].iloc[-1] == days[-1]
+        assert g["Day"].is_monotonic_increasing
+
+    small, downsampled = fit_budget(df.iloc[:300], "Day", "Count", "Type", budget=300)
+    assert not downsampled and small.equals(df.iloc[:300])
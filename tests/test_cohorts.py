@@ -0,0 +1,104 @@
+from collections import Counter
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import cohorts
+
+TODAY = datetime.now()
+
+
+def _month(ts) -> int:
+    return ts.year * 12 + ts.month - 1
+
+
+def _cells(df: pd.DataFrame) -> dict:
+    return {(_month(c), m): (size, kept) for c, m, size, kept in zip(df["Cohort"], df["Month"], df["Size"], df["Retained"])}
+
+
+def _naive_users(users: pd.DataFrame) -> dict:
+    # Per user: counted in every observable month of its cohort, retained while LastActivity reaches it
+    last, cells = _month(TODAY), {}
+    for created, seen in zip(users["CreatedAt"], users["LastActivity"]):
+        cohort = _month(created)
+        active = 0 if pd.isna(seen) else _month(seen) - cohort
+        for k in range(last - cohort + 1):
+            size, kept = cells.get((cohort, k), (0, 0))
+            cells[(cohort, k)] = (size + 1, kept + (active >= k))
+    return cells
+
+
+def _naive_stores(stores: pd.DataFrame, subs: pd.DataFrame) -> dict:
+    # Per subscription: the months it covers, as sets of distinct stores
+    last, created = _month(TODAY), dict(zip(stores["StoreID"], stores["CreatedAt"]))
+    covered = {}
+    for store, tier, start, end in zip(subs["StoreID"], subs["Type"], subs["StartDate"], subs["EndDate"]):
+        if tier not in cohorts.ACTIVE_TIERS or store not in created:
+            continue
+        cohort = _month(created[store])
+        for m in range(max(_month(start), cohort), min(_month(end), last) + 1):
+            covered.setdefault((cohort, m - cohort), set()).add(store)
+    sizes = Counter(_month(c) for c in stores["CreatedAt"])
+    return {
+        (cohort, k): (size, len(covered.get((cohort, k), ())))
+        for cohort, size in sizes.items() for k in range(last - cohort + 1)
+    }
+
+
+def _naive_transitions(subs: pd.DataFrame, across: str) -> dict:
+    counts = Counter()
+    for _, group in subs.sort_values(["StoreID", "StartDate", "SubscriptionID"]).groupby("StoreID"):
+        tiers = list(group["Type"])
+        pairs = zip(tiers[:-1], tiers[1:]) if across == "renewal" else [(tiers[0], tiers[-1])] * (len(tiers) > 1)
+        counts.update(pairs)
+    return dict(counts)
+
+
+@pytest.fixture
+def edited(frames):
+    # Missing LastActivity, and overlapping/nested subscriptions of one store
+    users, stores, subs = (df.copy() for df in frames)
+    users.loc[users.index[:5], "LastActivity"] = pd.NaT
+    store = int(stores["StoreID"].iloc[0])
+    start = stores["CreatedAt"].iloc[0]
+    extra = pd.DataFrame({
+        "SubscriptionID": subs["SubscriptionID"].max() + 1 + pd.RangeIndex(3),
+        "StoreID": store,
+        "Type": pd.Categorical(["Pro", "Trial", "Basic"], categories=subs["Type"].cat.categories),
+        "StartDate": [start, start + pd.Timedelta(days=20), start + pd.Timedelta(days=40)],
+        "EndDate": [start + pd.Timedelta(days=90), start + pd.Timedelta(days=30), start + pd.Timedelta(days=200)],
+    })
+    subs = pd.concat([subs, extra], ignore_index=True)
+    return users, stores, subs
+
+
+def test_user_retention_matches_naive(edited):
+    users = edited[0]
+    assert _cells(cohorts.user_retention(users, TODAY)) == _naive_users(users)
+    half = users.iloc[::2]
+    assert _cells(cohorts.user_retention(half, TODAY)) == _naive_users(half)
+
+
+def test_store_retention_matches_naive(edited):
+    _, stores, subs = edited
+    assert _cells(cohorts.store_retention(stores, subs, TODAY)) == _naive_stores(stores, subs)
+    # filtered stores: the other stores' subscriptions are ignored
+    some = stores.iloc[::3]
+    assert _cells(cohorts.store_retention(some, subs, TODAY)) == _naive_stores(some, subs)
+
+
+@pytest.mark.parametrize("across", cohorts.TRANSITIONS)
+def test_tier_transitions_match_naive(edited, across):
+    subs = edited[2]
+    got = cohorts.tier_transitions(subs, across)
+    assert {(f, t): c for f, t, c in zip(got["From"], got["To"], got["Count"]) if c} == _naive_transitions(subs, across)
+    # string-typed plans (as read back from SQL) count the same
+    assert cohorts.tier_transitions(subs.assign(Type=subs["Type"].astype(str)), across).equals(got)
+
+
+def test_empty_frames(frames):
+    users, stores, subs = (df.iloc[:0] for df in frames)
+    assert cohorts.user_retention(users, TODAY).empty
+    assert cohorts.store_retention(stores, subs, TODAY).empty
+    assert cohorts.tier_transitions(subs)["Count"].sum() == 0
@@ -0,0 +1,70 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from expiry_index import ExpiryIndex
+
+TODAY = datetime(2026, 6, 15, 13, 37)
+WINDOWS = [(None, None), (None, -1), (0, 7), (0, 30), (31, 60), (-30, 5), (5, 5), (400, None), (10, 3)]
+
+
+def _stores(n: int, seed: int) -> pd.DataFrame:
+    # ends within ±120 days at any time of day, many on the same day, some missing
+    rng = np.random.default_rng(seed)
+    ends = pd.Series(pd.Timestamp(TODAY) + pd.to_timedelta(rng.integers(-120 * 1440, 120 * 1440, n), unit="min"))
+    ends[rng.random(n) < 0.1] = pd.NaT
+    return pd.DataFrame({"StoreID": rng.permutation(n), "CurrentEnd": ends})
+
+
+def _brute(stores: pd.DataFrame, lo, hi, ascending=True, keep=None) -> list:
+    # Every store's DaysToExpiry, filtered and fully sorted (missing last, ties by StoreID)
+    days = np.floor((stores["CurrentEnd"] - pd.Timestamp(TODAY)) / pd.Timedelta(days=1))
+    sel = pd.Series(True, index=stores.index)
+    if lo is not None:
+        sel &= days >= lo
+    if hi is not None:
+        sel &= days <= hi
+    if lo is not None or hi is not None:
+        sel &= days.notna()
+    if keep is not None:
+        sel &= keep[stores["StoreID"]]
+    rows = pd.DataFrame({"id": stores["StoreID"], "days": days if ascending else -days})[sel]
+    return rows.sort_values(["days", "id"], na_position="last")["id"].tolist()
+
+
+@pytest.mark.parametrize("lo, hi", WINDOWS)
+def test_windows_match_brute_force(lo, hi):
+    stores = _stores(2000, 1)
+    index = ExpiryIndex(stores)
+    keep = np.random.default_rng(2).random(len(stores)) < 0.6
+    for ascending in (True, False):
+        for mask in (None, keep):
+            expected = _brute(stores, lo, hi, ascending, mask)
+            ids, total = index.page(TODAY, lo, hi, ascending=ascending, keep=mask)
+            assert total == len(expected) and ids.tolist() == expected
+            pages = [index.page(TODAY, lo, hi, offset, 37, ascending, mask)[0] for offset in range(0, total + 37, 37)]
+            assert np.concatenate(pages).tolist() == expected
+        assert np.concatenate([[], *index.chunks(TODAY, lo, hi, 50, keep)]).tolist() == _brute(stores, lo, hi, keep=keep)
+
+
+def test_updates_keep_windows_exact():
+    stores = _stores(1000, 3)
+    index = ExpiryIndex(stores)
+    rng = np.random.default_rng(4)
+    # move some ends (into the tied days and to missing), add stores, remove others
+    moved = rng.choice(1000, 150, replace=False)
+    new_ends = pd.Series(stores["CurrentEnd"].to_numpy()[rng.choice(1000, 150)])
+    added = pd.DataFrame({"StoreID": np.arange(1000, 1040), "CurrentEnd": _stores(40, 5)["CurrentEnd"]})
+    index.update(np.r_[moved, added["StoreID"]], pd.concat([new_ends, added["CurrentEnd"]], ignore_index=True))
+    removed = rng.choice(1040, 60, replace=False)
+    index.remove(removed)
+
+    stores = stores.set_index("StoreID")
+    stores.loc[moved, "CurrentEnd"] = new_ends.to_numpy()
+    stores = pd.concat([stores.reset_index(), added], ignore_index=True)
+    stores = stores[~stores["StoreID"].isin(removed)]
+    assert len(index) == len(stores)
+    for lo, hi in WINDOWS:
+        assert index.page(TODAY, lo, hi)[0].tolist() == _brute(stores, lo, hi)
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import export
+import panels
+from backends import PandasBackend
+from filters import FilterState
+
+
+def _read(path: str, fmt: str) -> pd.DataFrame:
+    if fmt == "parquet":
+        return pd.read_parquet(path)
+    back = pd.read_csv(path, dtype={"Stores": str})
+    # CSV list cells are "id;id;...", empty for an empty list
+    return back.assign(Stores=back["Stores"].map(lambda v: [int(i) for i in v.split(";")] if isinstance(v, str) else []))
+
+
+@pytest.mark.parametrize("fmt", list(export.FORMATS))
+def test_user_stores_round_trip(frames, tmp_path, fmt):
+    backend = PandasBackend(*frames)
+    users = frames[0][panels.USER_COLS]
+    result = export.write(backend.export_chunks(FilterState(), "users", datetime.now(), 37), str(tmp_path / f"u.{fmt}"), fmt)
+    back = _read(result.path, fmt)
+    assert result.rows == len(back) == len(users) and result.chunks == -(-len(users) // 37)
+    assert [list(v) for v in back["Stores"]] == [list(v) for v in users["Stores"]]
+    assert back["UserID"].tolist() == users["UserID"].tolist()
+
+
+@pytest.mark.parametrize("fmt", list(export.FORMATS))
+def test_chunks_with_empty_lists_and_missing_ints(tmp_path, fmt):
+    # The first chunk fixes the schema: its lists are empty and its DaysToExpiry all missing
+    store_list = pd.ArrowDtype(pa.list_(pa.int32()))
+    chunks = [
+        pd.DataFrame({"UserID": [1, 2], "Stores": pd.Series([[], []], dtype=store_list), "DaysToExpiry": [None, None]}),
+        pd.DataFrame({"UserID": [3, 4], "Stores": pd.Series([[7, 8], [9]], dtype=store_list), "DaysToExpiry": [5, -2]}),
+    ]
+    back = _read(export.write(chunks, str(tmp_path / f"x.{fmt}"), fmt).path, fmt)
+    assert [list(v) for v in back["Stores"]] == [[], [], [7, 8], [9]]
+    assert back["DaysToExpiry"].isna().tolist() == [True, True, False, False]
+    assert back["DaysToExpiry"].iloc[2:].astype(int).tolist() == [5, -2]
+
+
+def test_failed_export_leaves_no_file(tmp_path):
+    def chunks():
+        yield pd.DataFrame({"UserID": [1]})
+        raise RuntimeError("backend failed")
+
+    with pytest.raises(RuntimeError):
+        export.write(chunks(), str(tmp_path / "x.csv"), "csv")
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,88 @@
+import itertools
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backends import PandasBackend
+from filter_index import FilterIndex
+from filters import FilterState, apply_where
+from store_rollup import StoreRollup
+
+TODAY = date.today()
+DATE_RANGES = [
+    (),
+    [TODAY - timedelta(days=200), TODAY - timedelta(days=45)],
+    [TODAY - timedelta(days=3000), TODAY + timedelta(days=1)],  # wider than the data
+    [TODAY + timedelta(days=10), TODAY + timedelta(days=20)],  # no rows
+]
+CITIES = [(), ("Jakarta",), ("Medan", "Surabaya"), None]  # None: every city
+ROLES = [(), ("Owner",), None]
+SUB_TYPES = [(), ("Pro",), ("Basic", "Non-Paid"), None]
+
+
+def _states(users: pd.DataFrame, stores: pd.DataFrame) -> list[FilterState]:
+    every = {"cities": users["City"].unique(), "roles": users["Role"].unique(),
+             "sub_types": stores["SubscriptionType"].unique()}
+    states = []
+    for dates, cities, roles, sub_types in itertools.product(DATE_RANGES, CITIES, ROLES, SUB_TYPES):
+        picked = {"cities": cities, "roles": roles, "sub_types": sub_types}
+        states.append(FilterState.from_widgets(
+            date_range=dates, **{k: every[k] if v is None else v for k, v in picked.items()}
+        ))
+    return states
+
+
+def _expected(users, stores, subs, state: FilterState):
+    stores_f = apply_where(stores, state.stores_where())
+    subs_f = subs[subs["StoreID"].isin(stores_f["StoreID"])]
+    return apply_where(users, state.users_where()), stores_f, subs_f
+
+
+def _assert_filters(index: FilterIndex, users, stores, subs, states) -> None:
+    for state in states:
+        got = index.filter(state)
+        for g, want in zip(got, _expected(users, stores, subs, state)):
+            pd.testing.assert_frame_equal(g.reset_index(drop=True), want.reset_index(drop=True), obj=str(state))
+
+
+def test_index_matches_apply_where(frames):
+    users, stores, subs = frames
+    states = _states(users, stores)
+    assert len(states) == 192
+    _assert_filters(FilterIndex(users, stores, subs), users, stores, subs, states)
+
+
+def test_update_after_edits(frames):
+    users, stores, subs = frames
+    index = FilterIndex(users, stores, subs)
+    rows = np.arange(0, len(stores), 7)
+    edited = stores.copy()
+    tiers = edited["SubscriptionType"].to_numpy().copy()
+    tiers[rows] = np.where(tiers[rows] == "Pro", "Basic", "Pro")
+    edited["SubscriptionType"] = pd.Categorical(tiers, dtype=stores["SubscriptionType"].dtype)
+    index.update_stores(edited, rows)
+    _assert_filters(index, users, edited, subs, _states(users, edited)[::5])
+
+
+@pytest.mark.parametrize("cancel", [False, True])
+def test_update_after_ledger_writes(frames, ledger, cancel):
+    backend = PandasBackend(*frames)
+    states = _states(*frames[:2])[::7]
+    for state in states:  # the index exists before the writes
+        backend.key_metrics(state)
+    pro = ledger.create(frames[1]["StoreID"].iloc[:40:3], "Pro", 365, 400_000)
+    ledger.create(frames[1]["StoreID"].iloc[1:40:3], "Basic", 30, 200_000)
+    if cancel:
+        ledger.cancel(pro[0], int(frames[1]["StoreID"].iloc[0]))
+    rollup = StoreRollup(*frames)
+    rollup.sync(ledger)
+    assert len(backend.sync_ledger(ledger, rollup))
+
+    index = backend.index
+    _assert_filters(index, backend.df_users, backend.df_stores, backend.df_subscriptions, states)
+    fresh = FilterIndex(backend.df_users, backend.df_stores, backend.df_subscriptions)
+    for column, bitmaps in fresh.stores.bitmaps.items():
+        for value, bitmap in bitmaps.items():
+            np.testing.assert_array_equal(index.stores.bitmaps[column][value], bitmap, err_msg=value)
@@ -0,0 +1,91 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import panels
+from backends import get_backend
+from filters import FilterState, apply_where
+from leaderboard import Leaderboards
+from store_rollup import StoreRollup
+
+STATES = [
+    FilterState(),
+    FilterState.from_widgets(cities=["Jakarta", "Medan", "Surabaya"]),
+    FilterState.from_widgets(roles=["Owner"]),
+    # cuts partitions mid-month at both ends (the mock data covers the last year)
+    FilterState.from_widgets(
+        date_range=[date.today() - timedelta(days=200), date.today() - timedelta(days=45)], roles=["Kasir", "Manager"]
+    ),
+]
+
+
+def _plain(df: pd.DataFrame) -> pd.DataFrame:
+    return df.reset_index(drop=True).astype(object)
+
+
+def _assert_boards(board: Leaderboards, users: pd.DataFrame) -> None:
+    # Merged partitions against nlargest / value_counts over the filtered frame
+    for state in STATES:
+        users_f = apply_where(users, state.users_where())
+        pd.testing.assert_frame_equal(_plain(board.top_active(state, 10)), _plain(panels.top_active(users_f, 10)))
+        pd.testing.assert_frame_equal(_plain(board.top_cities(state, 10)), _plain(panels.top_cities(users_f, 10)))
+        pd.testing.assert_frame_equal(_plain(board.top_refs(state, 10)), _plain(panels.top_refs(users_f, 10)))
+
+
+def test_built_boards_match_frame(frames):
+    users = frames[0]
+    _assert_boards(Leaderboards(users), users)
+
+
+def test_updated_boards_match_frame(frames):
+    users = frames[0].sort_values("UserID", ignore_index=True)
+    rng = np.random.default_rng(3)
+    board = Leaderboards(users.iloc[:250])
+    board.add_users(users.iloc[250:])
+    removed = users["UserID"].to_numpy()[::7]
+    board.remove_users(removed)
+    users = users[~users["UserID"].isin(removed)].reset_index(drop=True)
+    # raise some totals and lower others, the current leaders included
+    changed = np.r_[users.nlargest(5, "TotalTransactions").index, rng.choice(len(users), 60, replace=False)]
+    changed = np.unique(changed)
+    totals = rng.integers(0, users["TotalTransactions"].max() * 2, len(changed))
+    board.set_transactions(users["UserID"].to_numpy()[changed], totals)
+    users.loc[changed, "TotalTransactions"] = totals
+    _assert_boards(board, users)
+
+
+def test_top_active_is_bounded_by_heap_size(frames):
+    with pytest.raises(ValueError):
+        Leaderboards(frames[0]).top_active(FilterState(), 100)
+
+
+def test_update_users_moves_changed_rows(frames):
+    users = frames[0].sort_values("UserID", ignore_index=True)
+    board = Leaderboards(users)
+    rows = np.arange(0, len(users), 5)
+    before = users.iloc[rows]
+    after = before.copy()
+    cities = users["City"].cat.categories
+    after["City"] = pd.Categorical(np.roll(before["City"].astype(object).to_numpy(), 1), categories=cities)
+    after.loc[after.index[::3], "TotalTransactions"] += 1000
+    after.loc[after.index[1::4], "Name"] = "Renamed"
+    board.update_users(before, after)
+    updated = users.copy()
+    updated.iloc[rows] = after
+    _assert_boards(board, updated)
+
+
+def test_boards_follow_ledger_sync(frames, snapshot_path, ledger):
+    backend = get_backend("cube", *frames, path=snapshot_path)
+    rollup = StoreRollup(*frames)
+    pro = ledger.create([1, 2, 3, 4], "Pro", 365, 400_000)
+    ledger.cancel(pro[0], 1)
+    rollup.sync(ledger)
+    backend.sync_ledger(ledger, rollup)
+    users = backend.df_users.sort_values("UserID", ignore_index=True)
+    _assert_boards(backend.boards, users)
+    for state in STATES:
+        users_f = apply_where(users, state.users_where())
+        pd.testing.assert_frame_equal(_plain(backend.top_active(state)), _plain(panels.top_active(users_f)))
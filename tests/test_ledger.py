@@ -0,0 +1,67 @@
+import queue
+import threading
+
+import pytest
+
+from ledger import Ledger
+
+
+class _GatedRow(dict):
+    # A row whose insert waits for the test, keeping the writer inside one commit
+    def __init__(self, row: dict, gate: threading.Event):
+        super().__init__(row)
+        self.gate = gate
+
+    def get(self, key, default=None):
+        self.gate.wait(10)
+        return super().get(key, default)
+
+
+def _row(txn: str, amount=100) -> dict:
+    return {"TransactionID": txn, "Kind": "create", "StoreID": 1, "Datetime": 0,
+            "SubscriptionType": "Pro", "SubscriptionPeriod": 30, "Amount": amount}
+
+
+def test_writes_survive_reopen(tmp_path):
+    path = str(tmp_path / "ledger.sqlite")
+    ids = Ledger(path).create([1, 2, 3], "Basic", 30, 200_000)
+    reopened = Ledger(path)
+    inserts, cancels, seq = reopened.subscription_changes()
+    assert inserts["SubscriptionID"].tolist() == ids
+    assert inserts["StoreID"].tolist() == [1, 2, 3]
+    assert cancels == [] and seq == reopened.version() == 3
+
+
+def test_cancel_is_idempotent(ledger):
+    txn = ledger.create([5], "Pro", 365, 400_000)[0]
+    assert ledger.cancel(txn, 4) == "not found"
+    assert ledger.cancel(txn, 5, "refund") == "cancelled"
+    assert ledger.cancel(txn, 5, "again") == "already cancelled"
+    assert ledger.subscription_changes()[1] == [txn]
+    assert ledger.count(5) == 2
+
+
+def test_bad_request_fails_alone(ledger):
+    gate = threading.Event()
+    first = queue.Queue(maxsize=1)
+    ledger._queue.put(([_GatedRow(_row("T-0"), gate)], first))
+    # queued while the writer is held in the first commit: one batch
+    requests = [[_row("T-1")], [_row("T-2", amount=2**70)], [_row("T-3")]]
+    done = [queue.Queue(maxsize=1) for _ in requests]
+    for rows, q in zip(requests, done):
+        ledger._queue.put((rows, q))
+    gate.set()
+    assert first.get(timeout=10) == 1
+    results = [q.get(timeout=10) for q in done]
+    assert results[0] == 1 and results[2] == 1
+    assert isinstance(results[1], OverflowError)
+    assert ledger.count() == 3
+
+
+def test_writer_survives_errors(ledger):
+    with pytest.raises(OverflowError):
+        ledger.append([_row("T-1", amount=2**70)])
+    with pytest.raises(AttributeError):
+        ledger.append([("T-2", "create")])  # not a dict
+    assert ledger.append([_row("T-3")]) == 1
+    assert ledger._writer.is_alive()
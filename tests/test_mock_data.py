@@ -0,0 +1,60 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import snapshot
+
+from mock_data import generate_dataset, iter_dataset, rank
+
+NOW = datetime(2026, 6, 1, 12)
+
+
+def _dataset(**kwargs):
+    return generate_dataset(300, 120, now=NOW, **kwargs)
+
+
+@pytest.mark.parametrize("chunk_size", [None, 50, 7])
+def test_same_seed_same_data(chunk_size):
+    for a, b in zip(_dataset(seed=3, chunk_size=chunk_size), _dataset(seed=3, chunk_size=chunk_size)):
+        pd.testing.assert_frame_equal(a, b)
+    other = _dataset(seed=4, chunk_size=chunk_size)[0]
+    assert not _dataset(seed=3, chunk_size=chunk_size)[0]["TotalTransactions"].equals(other["TotalTransactions"])
+
+
+def test_chunks_fit_together():
+    sizes = {}
+    for name, frame in iter_dataset(300, 120, seed=3, chunk_size=50, now=NOW):
+        assert len(frame) <= 50 or name == "subscriptions"
+        sizes.setdefault(name, []).append(len(frame))
+    assert sizes["stores"] == [50, 50, 20] and sizes["users"] == [50] * 6
+
+    users, stores, subs = _dataset(seed=3, chunk_size=50)
+    assert users["UserID"].tolist() == list(range(1, 301))
+    assert stores["StoreID"].tolist() == list(range(1, 121))
+    assert subs["SubscriptionID"].tolist() == list(range(1, len(subs) + 1))
+    assert subs["StoreID"].is_monotonic_increasing and set(subs["StoreID"]) == set(stores["StoreID"])
+    # each user's tier is the best tier of their stores, across chunk borders
+    tiers = stores.set_index("StoreID")["SubscriptionType"]
+    for stores_of, tier in zip(users["Stores"], users["UserSubscriptionType"]):
+        best = max((tiers[s] for s in stores_of), key=rank.get, default="Non-Paid")
+        assert tier == best
+    last = subs.sort_values("EndDate").groupby("StoreID")["EndDate"].last()
+    np.testing.assert_array_equal(stores["CurrentEnd"].to_numpy(), last.loc[stores["StoreID"]].to_numpy())
+
+
+def test_no_stores(tmp_path):
+    users, stores, subs = generate_dataset(40, 0, now=NOW)
+    assert len(users) == 40 and len(stores) == len(subs) == 0
+    assert users["Stores"].map(len).eq(0).all()
+    assert (users["UserSubscriptionType"] == "Non-Paid").all()
+    assert str(stores["CurrentEnd"].dtype) == "datetime64[us]"
+    snapshot.build_snapshot(40, 0, str(tmp_path))
+    assert [len(df) for df in snapshot.load(str(tmp_path))] == [40, 0, 0]
+
+
+def test_stores_need_users():
+    with pytest.raises(ValueError):
+        generate_dataset(0, 10)
+
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from paging import TablePage, sort_values, top_k, window
+
+
+def _sorted(values: np.ndarray, tie: np.ndarray, ascending: bool) -> np.ndarray:
+    # Full sort: by value (either direction), then key, missing values last
+    missing = np.isnan(values)
+    ordered = np.where(missing, 0, values if ascending else -values)
+    return np.lexsort((tie, ordered, missing))
+
+
+@pytest.mark.parametrize("ascending", [True, False])
+def test_pages_match_a_full_sort(ascending):
+    rng = np.random.default_rng(5)
+    values = rng.integers(0, 6, 500).astype(np.float64)  # heavy ties
+    values[rng.random(500) < 0.1] = np.nan
+    tie = rng.permutation(500)
+    expected = _sorted(values, tie, ascending)
+    pages = [window(values, tie, TablePage("x", ascending, offset, 30)) for offset in range(0, 510, 30)]
+    assert np.array_equal(np.concatenate(pages), expected)
+    # NaN last in both directions, key order within a tie
+    assert np.isnan(values[expected[-50:]]).all()
+    assert np.array_equal(top_k(values, tie, 7, ascending), expected[:7])
+
+
+def test_window_among_rows():
+    values = np.array([3.0, 1.0, np.nan, 1.0, 2.0, 1.0])
+    tie = np.array([10, 50, 20, 40, 30, 60])
+    rows = np.array([0, 2, 3, 5])
+    assert window(values, tie, TablePage("x", True, 0, 10), rows).tolist() == [3, 5, 0, 2]
+    assert window(values, tie, TablePage("x", False, 1, 2), rows).tolist() == [3, 5]
+    assert top_k(values, tie, 0).size == 0
+
+
+@pytest.mark.parametrize("col", [
+    pd.Series(["b", None, "a", "c", "a"]),
+    pd.Series(pd.Categorical(["b", None, "a", "c", "a"], categories=["c", "b", "a"])),
+    pd.Series(pd.to_datetime(["2026-02-01", None, "2026-01-01", "2026-03-01", "2026-01-01"])),
+    pd.Series([2.0, np.nan, 1.0, 3.0, 1.0]),
+])
+def test_sort_values_order_like_the_column(col):
+    values = sort_values(col)
+    assert np.isnan(values[1])
+    assert np.argsort(values, kind="stable").tolist() == [2, 4, 0, 3, 1]
@@ -0,0 +1,39 @@
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import snapshot
+from refresher import Refresher
+
+
+def _write_source(source, frames):
+    os.makedirs(source, exist_ok=True)
+    for name, df in zip(snapshot.TABLES, frames):
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), os.path.join(source, f"{name}.parquet"))
+
+
+def test_unchanged_source_is_not_rebuilt(tmp_path, frames):
+    source, path = str(tmp_path / "source"), str(tmp_path / "data")
+    _write_source(source, frames)
+    refresher = Refresher(path, source, interval=0)
+    assert refresher.refresh() is None
+    # a restarted process starts from the same version, still up to date
+    restarted = Refresher(path, source, interval=0)
+    assert restarted.current.version == refresher.current.version
+    assert restarted.refresh() is None
+
+
+def test_restart_loads_the_latest_version(tmp_path, frames):
+    source, path = str(tmp_path / "source"), str(tmp_path / "data")
+    _write_source(source, frames)
+    refresher = Refresher(path, source, interval=0)
+    first = refresher.current.version
+    _write_source(source, [df.head(50) for df in frames])
+    dataset = refresher.refresh()
+    assert dataset is not None and dataset.version != first
+    assert len(dataset.frames[0]) == 50
+
+    restarted = Refresher(path, source, interval=0)
+    assert restarted.current.version == dataset.version
+    assert restarted.refresh() is None
@@ -0,0 +1,52 @@
+import numpy as np
+
+import panels
+from backends import get_backend
+from filters import FilterState
+from result_cache import ResultCache, nbytes
+from store_rollup import StoreRollup
+
+
+def test_filtered_frames_follow_ledger_writes(frames, snapshot_path, ledger):
+    cache = ResultCache()
+    backend = get_backend("pandas", *frames, path=snapshot_path, cache=cache)
+    state = FilterState.from_widgets(sub_types=["Pro"])
+    before = backend.key_metrics(state)
+    ledger.create([1, 2, 3], "Pro", 365, 400_000)
+    rollup = StoreRollup(*frames)
+    rollup.sync(ledger)
+    backend.sync_ledger(ledger, rollup)
+    # no cache.validate() in between: the key carries the ledger Seq
+    after = backend.key_metrics(state)
+    assert after == panels.key_metrics(*backend._filter(state)) != before
+    assert cache.misses == 2
+
+
+def test_eviction_keeps_bytes_under_the_bound():
+    block = np.zeros(1000, dtype=np.int64)  # 8000 bytes
+    cache = ResultCache(max_bytes=3 * nbytes(block) + 100)
+    for i in range(10):
+        cache.get(("block", i), lambda: block.copy())
+        assert cache.bytes <= cache.max_bytes
+        assert cache.bytes == sum(size for _, size in cache._entries.values())
+    assert list(cache._entries) == [("block", i) for i in (7, 8, 9)]
+    assert cache.evictions == 7
+    # a hit makes an entry the most recently used
+    cache.get(("block", 7), lambda: None)
+    cache.get(("block", 10), lambda: block.copy())
+    assert ("block", 7) in cache._entries and ("block", 8) not in cache._entries
+
+
+def test_values_larger_than_the_bound_are_not_stored():
+    cache = ResultCache(max_bytes=1000)
+    value = cache.get("big", lambda: np.zeros(1000))
+    assert len(value) == 1000 and cache.bytes == 0 and "big" not in cache._entries
+
+
+def test_validate_drops_entries_of_the_old_version():
+    cache = ResultCache()
+    cache.validate(("v1", 0))
+    cache.get("k", lambda: 1)
+    assert not cache.validate(("v1", 0)) and cache.get("k", lambda: 2) == 1
+    assert cache.validate(("v1", 1)) and cache.get("k", lambda: 2) == 2
+    assert cache.invalidations == 1
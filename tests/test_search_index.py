@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+
+from search_index import SearchIndex
+
+NAMES = ["Budi Santoso", "budiman", "Édith Ñúñez", "Ed", "Siti", "Zoë Quinn", None, "Sarah Lee-Wong"]
+
+
+@pytest.fixture
+def index():
+    ids = pd.Series([3, 7, 12, 25, 120, 121, 122, 999])
+    return SearchIndex(ids, [pd.Series(NAMES), pd.Series([f"user{i}@example.com" for i in ids])], pd.Series(NAMES))
+
+
+def _brute(index: SearchIndex, ids, query: str) -> set:
+    query = query.strip().lower()
+    words = lambda v: [] if v is None else [v.lower(), *v.lower().split(" ")[1:]]
+    return {i for i, name in zip(ids, NAMES)
+            if any(k.startswith(query) for k in [str(i), f"user{i}@example.com", *words(name)])}
+
+
+@pytest.mark.parametrize("query", [
+    "bu", "Budi", "santoso", "éd", "ÉDITH ñ", "ñúñez", "e", "12", "user12", "user12@example.com",
+    "user999@example.com", "user999@example.comx", "sarah lee-wong", "lee-wong", "zoë", "x", "1", "\U0010ffff",
+])
+def test_matches_brute_force(index, query):
+    ids = [3, 7, 12, 25, 120, 121, 122, 999]
+    assert set(index.search(query, limit=100)) == _brute(index, ids, query)
+
+
+def test_exact_id_first_and_limit(index):
+    assert index.search("12")[0] == 12
+    assert index.search("12", limit=2) == [12, 120]
+    assert index.search("  ") == [] and index.label(12) == "12 — Édith Ñúñez" and index.label(4) is None
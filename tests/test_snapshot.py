@@ -0,0 +1,51 @@
+import os
+import threading
+
+import snapshot
+
+
+def test_publish_moves_the_pointer(snapshot_path, frames):
+    first = snapshot.resolve(snapshot_path)
+    version = snapshot.manifest(snapshot_path)["version"]
+    tables = dict(zip(snapshot.TABLES, frames))
+    second = snapshot.write_snapshot(tables, snapshot_path)["version"]
+
+    assert second != version
+    assert snapshot.manifest(snapshot_path)["version"] == second
+    # a reader pinned to the first version keeps reading it
+    assert snapshot.manifest(first)["version"] == version
+    assert snapshot.load(first)[0].equals(frames[0])
+
+
+def test_readers_never_miss_the_snapshot(snapshot_path, frames, monkeypatch):
+    monkeypatch.setattr(snapshot, "KEEP_VERSIONS", 100)  # only the pointer is under test
+    tables = dict(zip(snapshot.TABLES, frames))
+    errors, done = [], threading.Event()
+
+    def read():
+        while not done.is_set():
+            try:
+                assert snapshot.exists(snapshot_path)
+                snapshot.load(snapshot_path)
+            except Exception as e:  # noqa: BLE001
+                errors.append(e)
+                return
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for _ in range(10):
+            snapshot.write_snapshot(tables, snapshot_path)
+    finally:
+        done.set()
+        reader.join()
+    assert errors == []
+
+
+def test_old_versions_are_pruned(snapshot_path, frames):
+    tables = dict(zip(snapshot.TABLES, frames))
+    for _ in range(5):
+        snapshot.write_snapshot(tables, snapshot_path)
+    versions = os.listdir(os.path.join(snapshot_path, snapshot.VERSIONS_DIR))
+    assert len(versions) == snapshot.KEEP_VERSIONS
+    assert os.path.basename(snapshot.resolve(snapshot_path)) in versions
@@ -0,0 +1,156 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import snapshot
+from backends import PandasBackend, get_backend
+from expiry_index import ExpiryIndex
+from filters import FilterState
+from ledger import Ledger, numbered
+from paging import TablePage
+from store_rollup import StoreRollup
+
+EXPIRY_PAGE = TablePage("DaysToExpiry", limit=25)
+STATES = [
+    FilterState(),
+    FilterState.from_widgets(sub_types=["Pro"]),
+    FilterState.from_widgets(sub_types=["Basic", "Non-Paid"], expiry_window="30 days"),
+]
+
+
+def _write_batch(ledger) -> None:
+    # creates over a few stores, one of them cancelled in a later write
+    pro = ledger.create([1, 2, 3], "Pro", 365, 400_000)
+    ledger.create([3, 4, 5], "Basic", 30, 200_000)
+    assert ledger.cancel(pro[2], 3, "test") == "cancelled"
+
+
+def _plain(df: pd.DataFrame) -> pd.DataFrame:
+    # Categoricals as plain values, as the SQL backend returns them
+    return df.reset_index(drop=True).astype({c: object for c in df.columns if df[c].dtype == "category"})
+
+
+def _recomputed(frames, rollup, ledger) -> PandasBackend:
+    # A fresh backend over copies of the frames with the ledger written in
+    users, stores, subs = (df.copy() for df in frames)
+    current = rollup.stores(stores["StoreID"]).drop(columns="StoreID")
+    for column in current.columns:
+        stores[column] = current[column].astype(stores[column].dtype).array
+    users["UserSubscriptionType"] = pd.Categorical(
+        rollup.user_tiers(users["UserID"]), dtype=users["UserSubscriptionType"].dtype
+    )
+    inserts, cancels, _ = ledger.subscription_changes()
+    live = numbered(inserts, int(subs["SubscriptionID"].max()) + 1)
+    live = live[~live["TransactionID"].isin(cancels)].drop(columns="TransactionID")
+    subs = pd.concat([subs, live.astype({"Type": subs["Type"].dtype})], ignore_index=True)
+    return PandasBackend(users, stores, subs)
+
+
+def test_rollup_matches_full_recompute(frames, ledger):
+    rollup = StoreRollup(*frames)
+    pro = ledger.create([1, 2, 3], "Pro", 365, 400_000)
+    rollup.sync(ledger)
+    ledger.create([3, 4, 5], "Basic", 30, 200_000)
+    ledger.cancel(pro[2], 3)
+    rollup.sync(ledger)
+    assert rollup.check(*frames)
+    assert rollup.stores([1, 3])["SubscriptionType"].tolist() == ["Pro", "Basic"]
+
+
+@pytest.mark.parametrize("name", ["pandas", "cube", "sql"])
+def test_backend_tables_follow_ledger(frames, snapshot_path, ledger, name):
+    backend = get_backend(name, *frames, path=snapshot_path)
+    for state in STATES:  # indexes built before the batch
+        backend.key_metrics(state)
+        backend.expiring_page(state, EXPIRY_PAGE, datetime.now())
+    rollup = StoreRollup(*frames)
+    _write_batch(ledger)
+    rollup.sync(ledger)
+    assert backend.sync_ledger(ledger, rollup).tolist() == [1, 2, 3, 4, 5]
+    assert backend.ledger_seq == ledger.version()
+    assert len(backend.sync_ledger(ledger, rollup)) == 0
+    if name == "cube":
+        # the cubes pickled next to the snapshot still hold its rows only
+        reloaded = get_backend(name, *frames, path=snapshot_path)
+        assert reloaded.key_metrics(FilterState()) == PandasBackend(*frames).key_metrics(FilterState())
+    if name == "pandas":
+        rebuilt = ExpiryIndex(backend.df_stores)
+        np.testing.assert_array_equal(backend.expiry.ids, rebuilt.ids)
+        np.testing.assert_array_equal(backend.expiry.ends, rebuilt.ends)
+    for df, loaded in zip(frames, snapshot.load(snapshot_path)):
+        pd.testing.assert_frame_equal(df, loaded)  # the dataset keeps the snapshot values
+
+    today = datetime.now()
+    expected = _recomputed(frames, rollup, ledger)
+    page = TablePage("StoreID", limit=10)
+    store = backend.stores_page(FilterState(), page, today)[0].set_index("StoreID").loc[1]
+    assert store["SubscriptionType"] == "Pro" and store["DaysToExpiry"] >= 364
+    for state in STATES:
+        assert backend.key_metrics(state) == expected.key_metrics(state)
+        for method in ["user_sub_trend", "store_trend", "store_type_counts"]:
+            pd.testing.assert_frame_equal(
+                _plain(getattr(backend, method)(state)), _plain(getattr(expected, method)(state)),
+                check_dtype=False, obj=method,
+            )
+        for method, rows in [("stores_page", page), ("stores_page", EXPIRY_PAGE), ("expiring_page", EXPIRY_PAGE)]:
+            got, total = getattr(backend, method)(state, rows, today)
+            want, want_total = getattr(expected, method)(state, rows, today)
+            assert total == want_total
+            for column in ["StoreID", "SubscriptionType", "DaysToExpiry"]:
+                np.testing.assert_array_equal(
+                    got[column].astype(object).to_numpy(), want[column].astype(object).to_numpy(), err_msg=method
+                )
+        pd.testing.assert_frame_equal(
+            _plain(backend.tier_transitions(state)), _plain(expected.tier_transitions(state)), check_dtype=False
+        )
+
+
+def test_sql_rebuilds_for_a_recreated_ledger(frames, snapshot_path, tmp_path):
+    path = str(tmp_path / "recreated.sqlite")
+    old = Ledger(path)
+    _write_batch(old)
+    rollup = StoreRollup(*frames)
+    rollup.sync(old)
+    get_backend("sql", *frames, path=snapshot_path).sync_ledger(old, rollup)
+
+    for file in os.listdir(tmp_path):
+        if file.startswith("recreated.sqlite"):
+            os.remove(tmp_path / file)
+    new = Ledger(path)  # same path, fewer rows, so lower Seqs than the old one
+    assert new.id != old.id
+    new.create([7], "Pro", 365, 400_000)
+    rollup = StoreRollup(*frames)
+    rollup.sync(new)
+    # a restarted process opens the same database file
+    backend = get_backend("sql", *frames, path=snapshot_path)
+    assert backend.ledger_id == old.id
+    assert backend.sync_ledger(new, rollup).tolist() == [7]
+    assert backend.ledger_id == new.id and backend.ledger_seq == new.version() == 1
+    expected = _recomputed(frames, rollup, new)
+    for state in STATES:
+        assert backend.key_metrics(state) == expected.key_metrics(state)
+
+
+
+@pytest.mark.parametrize("name", ["pandas", "cube"])
+def test_unknown_ids_leave_the_last_rows_alone(frames, ledger, name):
+    backend = get_backend(name, *frames)
+    rollup = StoreRollup(*frames)
+    ledger.create([1], "Pro", 365, 400_000)
+    rollup.sync(ledger)
+    inserts = numbered(ledger.subscription_changes()[0], 10**6)
+    last_user, last_store = frames[0].iloc[[-1]], frames[1].iloc[[-1]]
+    tier = "Trial" if last_user["UserSubscriptionType"].iloc[0] != "Trial" else "Basic"
+    stores = pd.concat([rollup.stores([1]), rollup.stores([1]).assign(StoreID=10**9)])
+    users = pd.concat([rollup.users([1]), pd.DataFrame({"UserID": [10**9], "UserSubscriptionType": [tier]})])
+    backend._apply_ledger(stores, users, inserts, inserts[:0])
+
+    pd.testing.assert_frame_equal(backend.df_users.iloc[[-1]], last_user)
+    pd.testing.assert_frame_equal(backend.df_stores.iloc[[-1]], last_store)
+    expected = PandasBackend(backend.df_users, backend.df_stores, frames[2])
+    pd.testing.assert_frame_equal(
+        _plain(backend.user_sub_trend(FilterState())), _plain(expected.user_sub_trend(FilterState())), check_dtype=False
+    )